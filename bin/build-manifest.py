@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Program: Manifest of the Input Gene Alignments
+----------------------------------------------
+Description:
+    Scans the input alignments once and writes one TSV row per gene, replacing
+    one PREPARE_ID task per file. The gene ID follows the same policy as the
+    PREPARE_ID scripts (prepare-id-split-path or prepare-id-split-all). Each
+    row also records what later steps cost, for scheduling:
+      - file              file name, to match the row with the staged input
+      - size_bytes        file size on disk ("NA" if it cannot be read)
+      - sequences         number of records
+      - alignment_length  common sequence length ("NA" if lengths differ)
+      - sha256            content hash of IDs and uppercase sequences, the
+                          same as in alignment caches and the metrics cache
+
+Input:
+    - Alignment files (FASTA, optionally gzip/bgzip compressed, or .cpaln
+      alignment caches) and/or directories of them.
+
+Output:
+    - A TSV manifest: id, path (absolute, symlinks resolved), file,
+      size_bytes, sequences, alignment_length, sha256. Files that cannot be parsed get
+      "NA" statistics.
+
+Usage:
+    python build-manifest.py <alignments ...> --output manifest.tsv
+        [--id-method prepare-id-split-path|prepare-id-split-all] [--workers N]
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+from pathlib import Path
+from core_phylogenies import (ID_METHODS, Telemetry, alignment_digest, is_alignment_cache, list_alignments,
+                              read_cache_header, read_sequences)
+
+MANIFEST_COLUMNS = ["id", "path", "file", "size_bytes", "sequences", "alignment_length", "sha256"]
+
+
+def describe_alignment(path):
+    """Return (sequences, alignment_length, sha256) of one alignment file."""
+    if is_alignment_cache(path):
+        header, _ = read_cache_header(path)
+        taxa, sites = header["shape"]
+        return taxa, sites, header["sha256"]
+
+    ids, sequences = read_sequences(path)
+    lengths = {len(seq) for seq in sequences}
+    length = lengths.pop() if len(lengths) == 1 else "NA"
+    return len(ids), length, alignment_digest(ids, sequences)
+
+
+def manifest_row(task):
+    gene_id, path = task
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        size = "NA"
+    try:
+        sequences, length, sha256 = describe_alignment(path)
+    except Exception:
+        sequences, length, sha256 = "NA", "NA", "NA"
+    return [gene_id, os.path.realpath(path), Path(path).name, size, sequences, length, sha256]
+
+
+def main():
+    p = argparse.ArgumentParser(
+        description="Write a TSV manifest (ID, path, size, sequences, length, hash) of gene alignments"
+    )
+    p.add_argument("alignments", nargs="+", help="Alignment files or directories of them")
+    p.add_argument("--output", required=True, help="Output manifest TSV")
+    p.add_argument("--id-method", choices=sorted(ID_METHODS), default="prepare-id-split-path",
+                   help="Gene ID policy, as the PREPARE_ID scripts (default: prepare-id-split-path)")
+    p.add_argument("--workers", type=int, default=1,
+                   help="Alignments described in parallel (default: 1)")
+    args = p.parse_args()
+    telemetry = Telemetry(__file__)
+
+    gene_id = ID_METHODS[args.id_method]
+    paths = []
+    for source in args.alignments:
+        if Path(source).is_dir():
+            paths.extend(path for _, path in list_alignments(source))
+        elif Path(source).is_file():
+            paths.append(Path(source))
+        else:
+            print(f"Error: '{source}' does not exist", file=sys.stderr)
+            sys.exit(1)
+
+    tasks = [(gene_id(path), path) for path in paths]
+
+    with telemetry.phase("parse"):
+        if args.workers > 1 and len(tasks) > 1:
+            context = multiprocessing.get_context("fork")
+            with context.Pool(min(args.workers, len(tasks))) as pool:
+                rows = pool.map(manifest_row, tasks, chunksize=16)
+        else:
+            rows = [manifest_row(task) for task in tasks]
+    telemetry.record(genes=len(rows), workers=args.workers)
+
+    with telemetry.phase("write"), open(args.output, "w") as manifest:
+        manifest.write("\t".join(MANIFEST_COLUMNS) + "\n")
+        for row in rows:
+            manifest.write("\t".join(str(value) for value in row) + "\n")
+
+    print(f"✓ {len(rows)} alignments written to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Program: Merge Telemetry Records
+--------------------------------
+Description:
+    Collects the JSON telemetry records the bin/ scripts write when
+    CORE_PHYLOGENIES_TELEMETRY is set (see core_phylogenies.py) and merges
+    them into one table, one row per script run. Directories are searched
+    recursively, so the work directory of a pipeline run can be given as is.
+    A work directory is shared by every run that used it, so --since (the
+    run's start, as Unix time) keeps only the records of scripts started
+    since then, and skips directories not modified since then: the records
+    of a run are written into task directories created during it.
+    Only the standard library is used, so it runs outside the containers.
+
+Output:
+    - A TSV with, per run: script, host, pid, start time, wall time, the
+      time of every phase (phase_import, phase_parse, phase_compute,
+      phase_write, ...), peak RSS of the process and of its workers, every
+      recorded input dimension (dim_taxa, dim_sites, dim_pairs, ...), the
+      decision and the arguments.
+    - Optionally (--summary) a TSV with, per script: runs, total and mean
+      wall time, total time of every phase and the largest peak RSS.
+
+Usage:
+    python collect-telemetry.py <work_dir or records ...> --output telemetry.tsv [--summary telemetry-summary.tsv]
+        [--since UNIX_TIME]
+"""
+
+import argparse
+import json
+import os
+import sys
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+
+# As TELEMETRY_SUFFIX in core_phylogenies.py
+TELEMETRY_SUFFIX = ".telemetry.json"
+
+# Phases first in this order, others after them alphabetically
+PHASE_ORDER = ["import", "parse", "compute", "write"]
+
+
+def walk_records(directory, since=None):
+    """Telemetry records under `directory`, not descending into subdirectories older than `since`."""
+    paths = []
+    for root, dirs, files in os.walk(directory):
+        if since is not None:
+            dirs[:] = [name for name in dirs if os.stat(os.path.join(root, name)).st_mtime >= since]
+        paths.extend(Path(root) / name for name in files if name.endswith(TELEMETRY_SUFFIX))
+    return sorted(paths)
+
+
+def find_records(sources, since=None):
+    paths = []
+    for source in sources:
+        source = Path(source)
+        if source.is_dir():
+            paths.extend(walk_records(source, since))
+        elif source.is_file():
+            paths.append(source)
+        else:
+            print(f"Warning: '{source}' does not exist", file=sys.stderr)
+    return paths
+
+
+def read_records(paths, since=None):
+    records = []
+    for path in paths:
+        try:
+            with open(path) as handle:
+                records.append(json.load(handle))
+        except (OSError, ValueError) as e:
+            print(f"Warning: skipping {path}: {e}", file=sys.stderr)
+    if since is not None:
+        records = [record for record in records if (record.get("start") or 0) >= since]
+    return sorted(records, key=lambda record: record.get("start", 0))
+
+
+def ordered_phases(records):
+    names = {name for record in records for name in record.get("phases", {})}
+    return [name for name in PHASE_ORDER if name in names] + sorted(names - set(PHASE_ORDER))
+
+
+def cell(value):
+    if value is None:
+        return "NA"
+    if isinstance(value, float):
+        return f"{value:.6g}"
+    return str(value).replace("\t", " ").replace("\n", " ")
+
+
+def write_table(records, output):
+    phases = ordered_phases(records)
+    dimensions = sorted({name for record in records for name in record.get("dimensions", {})})
+    columns = (["script", "host", "pid", "start", "wall_s"] + [f"phase_{name}_s" for name in phases]
+               + ["peak_rss_mb", "children_peak_rss_mb"] + [f"dim_{name}" for name in dimensions]
+               + ["decision", "cwd", "argv"])
+
+    with open(output, "w") as table:
+        table.write("\t".join(columns) + "\n")
+        for record in records:
+            start = record.get("start")
+            row = [record.get("script"), record.get("host"), record.get("pid"),
+                   datetime.fromtimestamp(start, timezone.utc).isoformat() if start else None,
+                   record.get("wall_s")]
+            row += [record.get("phases", {}).get(name) for name in phases]
+            row += [record.get("peak_rss_mb"), record.get("children_peak_rss_mb")]
+            row += [record.get("dimensions", {}).get(name) for name in dimensions]
+            row += [record.get("decision"), record.get("cwd"), " ".join(record.get("argv", []))]
+            table.write("\t".join(cell(value) for value in row) + "\n")
+
+
+def write_summary(records, output):
+    phases = ordered_phases(records)
+    by_script = defaultdict(list)
+    for record in records:
+        by_script[record.get("script")].append(record)
+
+    with open(output, "w") as summary:
+        summary.write("\t".join(["script", "runs", "wall_s_total", "wall_s_mean"]
+                                + [f"phase_{name}_s_total" for name in phases] + ["peak_rss_mb_max"]) + "\n")
+        for script, runs in sorted(by_script.items()):
+            wall = sum(run.get("wall_s") or 0.0 for run in runs)
+            row = [script, len(runs), wall, wall / len(runs)]
+            row += [sum(run.get("phases", {}).get(name, 0.0) for run in runs) for name in phases]
+            row += [max(run.get("peak_rss_mb") or 0.0 for run in runs)]
+            summary.write("\t".join(cell(value) for value in row) + "\n")
+
+
+def main():
+    p = argparse.ArgumentParser(description="Merge the telemetry records of the bin/ scripts into one table")
+    p.add_argument("sources", nargs="+", help="Telemetry records or directories to search for them")
+    p.add_argument("--output", required=True, help="Output TSV, one row per script run")
+    p.add_argument("--summary", default=None, help="Output TSV, one row per script")
+    p.add_argument("--since", type=float, default=None,
+                   help="Only records of scripts started at or after this Unix time, e.g. the pipeline run's start")
+    args = p.parse_args()
+
+    records = read_records(find_records(args.sources, args.since), args.since)
+    for output in (args.output, args.summary):
+        if output:
+            Path(output).parent.mkdir(parents=True, exist_ok=True)
+    write_table(records, args.output)
+    if args.summary:
+        write_summary(records, args.summary)
+
+    print(f"✓ {len(records)} telemetry records written to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,33 +8,129 @@ Description:
     - Maintains consistent organism order across genes
 
 Input:
-    Folder of (n) filtered gene alignments (FASTA format)
+    Folder of (n) filtered gene alignments (FASTA format, plain or gzip/bgzip
+    compressed, or .cpaln alignment caches)
 
 Output:
-    Single concatenated alignment in FASTA format
+    Single concatenated alignment in FASTA format (gzip-compressed if the
+    output name ends in .gz)
+
+Streaming mode (--streaming):
+    - Pass 1 reads only headers and sequence lengths to find the common
+      organisms and each gene's width
+    - Pass 2 writes each gene's block straight into its place in a
+      preallocated, memory-mapped output file, one gene at a time, while the
+      next gene files are read ahead in background threads
+    Memory stays bounded by a few gene alignments, whatever the number of
+    genes. Sequences are written on a single line per organism.
+
+Gene-block cache (--block-cache DIR, implies --streaming):
+    Each gene is parsed once into a block of the cache directory, rows in
+    sorted ID order (see BlockCache in core_phylogenies.py). Both passes
+    then read blocks instead of the input files: pass 1 only their headers,
+    pass 2 their memory-mapped rows. Concatenating another, overlapping
+    gene set with the same directory (e.g. the next subset of a threshold
+    sweep) only parses the genes it has not seen before.
+
+Site patterns (--patterns, --pattern-report):
+    Columns of the concatenation are hashed gene by gene to collapse
+    identical columns into weighted site patterns (see SitePatterns in
+    core_phylogenies.py). --patterns writes, next to the output:
+      - <output>.patterns.fasta        one column per distinct pattern
+      - <output>.site-weights.txt      how many columns each pattern stands for
+      - <output>.invariant-sites.tsv   patterns and columns per site class
+                                       (invariant per base, gaps only, variable)
+    --pattern-report writes a TSV with the distinct patterns, invariant and
+    variable sites of every gene (over the common organisms) and of the
+    concatenation, and prints the totals. Site classes only look at the
+    bases A/C/G/T: acgt_variable_sites counts columns with two or more of
+    them, so a column whose only other character is an ambiguity code is
+    invariant here, but polymorphic for
+    filter-by-normalized-polymorphic-sites.py (which ignores only '-' and 'N').
 
 Usage:
-    python concatenate_alignments.py input_folder/ output_file.fasta
+    python concatenate_alignments.py input_folder/ output_file.fasta [--streaming] [--read-ahead N]
+        [--block-cache DIR] [--patterns] [--pattern-report site-patterns.tsv]
 """
 
+import gzip
 import os
+import shutil
 import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from Bio import AlignIO
-from Bio.Seq import Seq
-from Bio.SeqRecord import SeqRecord
+import numpy as np
 from collections import defaultdict
-from Bio import SeqIO
+from core_phylogenies import (COMPRESS_LEVEL, BlockCache, FASTA_EXTS, SitePatterns, classify_patterns, clean_sequence,
+                              fasta_bytes, fasta_spans, is_alignment_cache, is_alignment_file, read_alignment,
+                              read_alignment_cache, read_cache_header, strip_compression, Telemetry, timed,
+                              write_fasta, write_site_weights)
 
-def concatenate_alignments(input_folder: str, output_file: str):
-    # Step 1: Gather all FASTA files
+# Columns of the --pattern-report table
+PATTERN_REPORT_COLUMNS = ["gene", "taxa", "sites", "patterns", "invariant_sites", "no_base_sites",
+                          "acgt_variable_sites", "acgt_variable_patterns"]
+
+def find_alignment_files(input_folder: str):
     input_path = Path(input_folder)
-    fasta_extensions = ['*.fasta', '*.fa', '*.fas', '*.fna']
-    input_files = []
+    return sorted(f for f in input_path.rglob("*") if f.is_file() and is_alignment_file(f))
+
+def pattern_paths(output_file):
+    """(pattern alignment, site weights, invariant-site summary) paths next to `output_file`."""
+    base = Path(strip_compression(output_file))
+    if base.suffix in FASTA_EXTS:
+        base = base.with_suffix("")
+    return f"{base}.patterns.fasta", f"{base}.site-weights.txt", f"{base}.invariant-sites.tsv"
+
+def pattern_row(name, patterns, counts):
+    classes = classify_patterns(patterns, counts)
+    invariant = sum(classes[f"invariant_{base}"][1] for base in "ACGT")
+    return [name, patterns.shape[0], classes["total"][1], classes["total"][0], invariant,
+            classes["no_base"][1], classes["variable"][1], classes["variable"][0]]
+
+class PatternTracker:
+    """Site patterns of the concatenation, added gene by gene, with a report row per gene."""
 
-    for ext in fasta_extensions:
-        input_files.extend(input_path.rglob(ext))
-    input_files = sorted(set(input_files))
+    def __init__(self, organisms):
+        self.organisms = organisms
+        self.patterns = SitePatterns(len(organisms))
+        self.rows = []
+
+    def add_gene(self, name, block):
+        """Add one gene, given as {organism: uint8 sequence} or as rows in organism order."""
+        if isinstance(block, dict):
+            block = [block[organism] for organism in self.organisms]
+        self.rows.append(pattern_row(name, *self.patterns.add(np.vstack(block))))
+
+    def write(self, output_file, write_patterns, report):
+        patterns, weights = self.patterns.matrix(), self.patterns.weights()
+        total = pattern_row("concatenation", patterns, weights)
+
+        if write_patterns:
+            alignment_path, weights_path, summary_path = pattern_paths(output_file)
+            write_fasta(alignment_path, self.organisms, patterns)
+            write_site_weights(weights_path, weights)
+            with open(summary_path, "w") as summary:
+                summary.write("class\tpatterns\tsites\n")
+                for name, (count, sites) in classify_patterns(patterns, weights).items():
+                    summary.write(f"{name}\t{count}\t{sites}\n")
+            print(f"✓ Pattern alignment written to: {alignment_path} (weights: {weights_path})")
+
+        if report:
+            with open(report, "w") as table:
+                table.write("\t".join(PATTERN_REPORT_COLUMNS) + "\n")
+                for row in self.rows + [total]:
+                    table.write("\t".join(str(value) for value in row) + "\n")
+            print(f"✓ Site pattern report written to: {report}")
+
+        sites, distinct = total[2], total[3]
+        print(f"✓ Site patterns: {distinct} distinct of {sites} columns "
+              f"({sites / max(distinct, 1):.1f} columns per pattern), {total[4]} invariant sites")
+        return distinct
+
+def concatenate_alignments(input_folder: str, output_file: str, telemetry=None, patterns=False, report=None):
+    # Step 1: Gather all FASTA files
+    input_files = find_alignment_files(input_folder)
 
     if not input_files:
         print(f"No FASTA files found in {input_folder}")
@@ -44,25 +140,26 @@ def concatenate_alignments(input_folder: str, output_file: str):
     sequence_dict = defaultdict(list)
     common_headers = None
     file_count = 0
+    gene_names = []
 
     for file in input_files:
         try:
-            alignment = AlignIO.read(file, "fasta")
+            with timed(telemetry, "parse"):
+                headers, matrix = read_alignment(file)
         except Exception as e:
             print(f"Skipping {file.name}: {e}")
             continue
 
-        headers = [record.id for record in alignment]
-
         if common_headers is None:
             common_headers = set(headers)
         else:
             common_headers &= set(headers)
 
-        for record in alignment:
-            if record.id in common_headers:
-                sequence_dict[record.id].append(str(record.seq).upper())
+        for header, row in zip(headers, matrix):
+            if header in common_headers:
+                sequence_dict[header].append(row.tobytes())
         file_count += 1
+        gene_names.append(file.name)
 
     if not common_headers:
         print("❌ No common organism headers found across all alignments.")
@@ -72,16 +169,173 @@ def concatenate_alignments(input_folder: str, output_file: str):
     print(f"✓ Common organism headers: {len(common_headers)}")
 
     # Step 3: Concatenate sequences for each organism
-    concatenated_records = []
-    for organism in sorted(common_headers):
-        full_seq = "".join(sequence_dict[organism])
-        concatenated_records.append(SeqRecord(Seq(full_seq), id=organism, description=""))
+    organisms = sorted(common_headers)
+    with timed(telemetry, "compute"):
+        concatenated = [b"".join(sequence_dict[organism]) for organism in organisms]
 
     # Step 4: Write to output file
-    SeqIO.write(concatenated_records, output_file, "fasta")
+    with timed(telemetry, "write"):
+        write_fasta(output_file, organisms, concatenated)
+    if telemetry:
+        telemetry.record(genes=file_count, taxa=len(organisms), sites=len(concatenated[0]))
+
+    if patterns or report:
+        with timed(telemetry, "patterns"):
+            tracker = PatternTracker(organisms)
+            for gene, name in enumerate(gene_names):
+                tracker.add_gene(name, [np.frombuffer(sequence_dict[organism][gene], dtype=np.uint8)
+                                        for organism in organisms])
+            distinct = tracker.write(output_file, patterns, report)
+        if telemetry:
+            telemetry.record(patterns=distinct)
+    print(f"\n✅ Concatenated alignment written to: {output_file}")
+    print(f"Total concatenated organisms: {len(organisms)}")
+    print(f"Total alignment length: {len(concatenated[0])} bases")
+
+def scan_alignment(file):
+    """
+    Header-only pass: return (IDs, alignment length) of one file without
+    keeping sequences. Raises ValueError where AlignIO.read would refuse it.
+    """
+    if is_alignment_cache(file):
+        header, _ = read_cache_header(file)
+        return header["ids"], header["shape"][1]
+
+    headers, lengths = [], set()
+    with fasta_bytes(file) as data:
+        for header, _, sequence_start, end in fasta_spans(data):
+            headers.append(header)
+            lengths.add(len(clean_sequence(data[sequence_start:end])))
+    if not headers:
+        raise ValueError("No records found in handle")
+    if len(lengths) > 1:
+        raise ValueError("Sequences must all be the same length")
+    return headers, lengths.pop()
+
+def read_gene_block(file, wanted, block_cache=None):
+    """Return {id: uppercase uint8 sequence} for the records of `file` in `wanted`."""
+    if block_cache:
+        ids, matrix = block_cache.load(file)
+        return {header: row for header, row in zip(ids, matrix) if header in wanted}
+
+    block = {}
+    if is_alignment_cache(file):
+        ids, matrix, _ = read_alignment_cache(file)
+        for header, row in zip(ids, matrix):
+            if header in wanted and header not in block:
+                block[header] = row
+        return block
+
+    with fasta_bytes(file) as data:
+        for header, _, sequence_start, end in fasta_spans(data):
+            if header in wanted and header not in block:
+                block[header] = np.frombuffer(clean_sequence(data[sequence_start:end]), dtype=np.uint8)
+    return block
+
+def concatenate_alignments_streaming(input_folder: str, output_file: str, read_ahead: int = 4, telemetry=None,
+                                     patterns=False, report=None, block_cache=None):
+    # Step 1: Gather all FASTA files
+    input_files = find_alignment_files(input_folder)
+
+    if not input_files:
+        print(f"No FASTA files found in {input_folder}")
+        return
+
+    # Step 2: Header-only pass for common organisms and gene widths
+    genes = []
+    common_headers = None
+
+    for file in input_files:
+        try:
+            with timed(telemetry, "parse"):
+                headers, width = block_cache.scan(file) if block_cache else scan_alignment(file)
+        except Exception as e:
+            print(f"Skipping {file.name}: {e}")
+            continue
+
+        if common_headers is None:
+            common_headers = set(headers)
+        else:
+            common_headers &= set(headers)
+        genes.append((file, width))
+
+    if not common_headers:
+        print("❌ No common organism headers found across all alignments.")
+        return
+
+    print(f"✓ Found {len(genes)} valid alignment files.")
+    print(f"✓ Common organism headers: {len(common_headers)}")
+    if block_cache:
+        print(f"✓ Gene blocks: {block_cache.hits} from cache, {block_cache.misses} parsed")
+
+    # Step 3: Preallocate the output, one ">id\n<sequence>\n" row per organism
+    organisms = sorted(common_headers)
+    total_length = sum(width for _, width in genes)
+    row_offsets = {}
+    size = 0
+    for organism in organisms:
+        size += len(organism.encode()) + 2
+        row_offsets[organism] = size
+        size += total_length + 1
+
+    # A compressed output is assembled uncompressed next to it, then compressed
+    compress = strip_compression(output_file) != str(output_file)
+    assembly_file = f"{output_file}.tmp" if compress else output_file
+
+    output = np.memmap(assembly_file, dtype=np.uint8, mode="w+", shape=(size,))
+    for organism, offset in row_offsets.items():
+        header = f">{organism}\n".encode()
+        output[offset - len(header):offset] = np.frombuffer(header, dtype=np.uint8)
+        output[offset + total_length] = ord("\n")
+
+    # Step 4: Write gene blocks in place, reading the next files ahead (and count their site patterns)
+    tracker = PatternTracker(organisms) if patterns or report else None
+    with timed(telemetry, "write"), ThreadPoolExecutor(max_workers=max(read_ahead, 1)) as pool:
+        pending = deque()
+        gene_iter = iter(genes)
+        column = 0
+
+        def submit_next():
+            for file, width in gene_iter:
+                pending.append((pool.submit(read_gene_block, file, common_headers, block_cache), width, file.name))
+                return
+
+        for _ in range(max(read_ahead, 1)):
+            submit_next()
+
+        while pending:
+            future, width, name = pending.popleft()
+            submit_next()
+            block = future.result()
+            for organism, seq in block.items():
+                start = row_offsets[organism] + column
+                output[start:start + width] = seq
+            column += width
+            if tracker:
+                tracker.add_gene(name, block)
+
+    output.flush()
+    del output
+
+    if compress:
+        with timed(telemetry, "compress"), open(assembly_file, "rb") as source, \
+                gzip.open(output_file, "wb", compresslevel=COMPRESS_LEVEL) as target:
+            shutil.copyfileobj(source, target, 1 << 20)
+        os.remove(assembly_file)
+    if telemetry:
+        telemetry.record(genes=len(genes), taxa=len(organisms), sites=total_length)
+        if block_cache:
+            telemetry.record(block_hits=block_cache.hits, block_misses=block_cache.misses)
+
+    if tracker:
+        with timed(telemetry, "patterns"):
+            distinct = tracker.write(output_file, patterns, report)
+        if telemetry:
+            telemetry.record(patterns=distinct)
+
     print(f"\n✅ Concatenated alignment written to: {output_file}")
-    print(f"Total concatenated organisms: {len(concatenated_records)}")
-    print(f"Total alignment length: {len(concatenated_records[0].seq)} bases")
+    print(f"Total concatenated organisms: {len(organisms)}")
+    print(f"Total alignment length: {total_length} bases")
 
 def main():
     import argparse
@@ -90,13 +344,30 @@ def main():
     )
     parser.add_argument("input_folder", help="Folder containing FASTA gene alignments")
     parser.add_argument("output_file", help="Output FASTA file for concatenated alignment")
+    parser.add_argument("--streaming", action="store_true",
+                        help="Two-pass, memory-bounded concatenation")
+    parser.add_argument("--read-ahead", type=int, default=4,
+                        help="Gene files read ahead in streaming mode (default: 4)")
+    parser.add_argument("--patterns", action="store_true",
+                        help="Also write the weighted site-pattern alignment, its weights and an invariant-site summary")
+    parser.add_argument("--pattern-report", default=None,
+                        help="TSV of distinct site patterns per gene and for the concatenation")
+    parser.add_argument("--block-cache", default=None,
+                        help="Directory of cached per-gene blocks, shared between runs (implies --streaming)")
     args = parser.parse_args()
+    telemetry = Telemetry(__file__)
+    telemetry.record(streaming=args.streaming or bool(args.block_cache))
 
     if not os.path.exists(args.input_folder):
         print(f"Error: Input folder '{args.input_folder}' does not exist.")
         sys.exit(1)
 
-    concatenate_alignments(args.input_folder, args.output_file)
+    if args.streaming or args.block_cache:
+        block_cache = BlockCache(args.block_cache) if args.block_cache else None
+        concatenate_alignments_streaming(args.input_folder, args.output_file, args.read_ahead, telemetry,
+                                         args.patterns, args.pattern_report, block_cache)
+    else:
+        concatenate_alignments(args.input_folder, args.output_file, telemetry, args.patterns, args.pattern_report)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,921 @@
+"""
+Shared helpers for the core-phylogenies bin/ scripts
+-----------------------------------------------------
+Description:
+    The bin/ programs are standalone executables with hyphenated names, so
+    they cannot be imported with a plain `import`. This module is placed next
+    to them (and therefore on `sys.path` of every script) and collects the
+    pieces that more than one program needs.
+
+Alignment cache (.cpaln):
+    A compact on-disk alignment written once after header formatting, so that
+    later steps do not parse FASTA text again. Layout:
+        8 bytes   magic b"CPALN\x00\x01\n"
+        8 bytes   little-endian length of the JSON header
+        JSON      {"ids": [...], "shape": [taxa, sites], "sha256": ...}
+        padding   up to the next 64-byte boundary
+        matrix    taxa × sites uppercase ASCII bytes (uint8), row-major
+    The matrix is memory-mapped when read, so scripts get it without a copy.
+    The SHA-256 covers the IDs and the matrix (see alignment_digest()).
+
+FASTA parsing:
+    FASTA is read as bytes, without Biopython: uncompressed files are
+    memory-mapped, records are located by searching for "\n>", and each
+    sequence is uppercased and stripped of line breaks and whitespace in one
+    bytes.translate() call. Alignments come back as a contiguous (taxa × sites)
+    uint8 matrix of ASCII codes, sequences of unequal length are refused (see
+    read_fasta()). IDs are the header up to the first whitespace, as
+    Biopython's `rec.id`, so results match what SeqIO used to give.
+
+Column windows:
+    For alignments too long to hold (with the temporaries of a computation)
+    in memory, read_alignment_mapped() parses FASTA into a temporary,
+    already unlinked file that backs the matrix as a memory map, so its
+    pages live in the page cache and can be written back and dropped under
+    memory pressure. Alignment caches are mapped as they are. Computations
+    then walk the matrix in column windows sized to a memory budget (see
+    column_windows()) and add up per-window statistics. Compressed FASTA is
+    still decompressed in memory first; use alignment caches for the largest
+    inputs.
+
+Compressed FASTA:
+    Every FASTA reader here accepts gzip and bgzip (BGZF) files, detected by
+    their magic bytes and decompressed while streaming. Writers compress when
+    the output name ends in .gz or .bgz (see open_text()).
+
+FASTA offset index (.cpidx):
+    A `.fai`-style index of an uncompressed FASTA file, so single records can
+    be seeked and copied as raw bytes without parsing the rest. A text file:
+        #cpidx<TAB><size of the FASTA><TAB><mtime of the FASTA, ns>
+        <id><TAB><byte offset of the '>' line><TAB><byte length of the record>
+    one line per record, in file order. It is rebuilt when the FASTA's size or
+    modification time no longer match (see fasta_index()).
+
+Site patterns:
+    Alignment columns are hashed (as fixed-size byte strings) to collapse
+    identical columns into distinct site patterns, each weighted by the
+    number of columns it stands for (see SitePatterns). A pattern alignment
+    plus its weights, written one weight per column of the pattern alignment
+    on a single whitespace-separated line (raxml-ng's --site-weights
+    format), carries the same information as the full alignment for
+    site-independent methods.
+
+Gene-block cache:
+    A directory of per-gene column blocks for repeated concatenation of
+    overlapping gene sets (e.g. the subsets of a threshold sweep). Each
+    block is an alignment cache (.cpaln) of one gene with its rows in sorted
+    ID order (first record of a duplicated ID), named after a key of its
+    source: the content hash of an alignment cache, otherwise the resolved
+    path, size and modification time of the FASTA, so a key is found without
+    reading the file. A gene is parsed once, on the first miss; afterwards
+    its IDs and width come from the block header and its rows from a memory
+    map. Blocks are written to a temporary name and renamed into place, so
+    concurrent tasks sharing the directory never see a partial block (see
+    BlockCache).
+
+Metrics cache:
+    An SQLite file of per-gene metrics (polymorphic sites, π, dN/dS) keyed by
+    the alignment content hash (see alignment_digest()), the metric name and
+    the parameters it depends on (e.g. gap handling). The filter scripts look
+    metrics up there before computing them and store them afterwards, so a
+    run that only changes thresholds does not recompute anything.
+
+Sequential decisions:
+    The π filter only needs to know whether a mean over all sequence pairs
+    lies inside a [min, max] window. With early decisions,
+    pairs are drawn at random (seeded, with replacement) in batches of
+    doubling size, and the running mean gets an empirical Bernstein
+    confidence bound (Audibert et al. 2009), which stays valid when the
+    sampled values happen to be all equal. The answer is given as soon as
+    the bound lies wholly inside or outside the window. The bound needs a
+    known range of the per-pair values (π lies in [0, 1]); means of
+    unbounded values such as dN/dS, where a few rare large ratios can
+    dominate, are always computed exactly. Past a fraction of
+    the pairs without a decision (a mean close to a boundary), the exact
+    computation takes over (see sequential_decision()).
+
+Telemetry:
+    Opt-in performance records. When the CORE_PHYLOGENIES_TELEMETRY
+    environment variable names a directory (relative paths are taken from the
+    working directory, i.e. the task directory in the pipeline), every script
+    writes one `<script>.<host>.<pid>.<ms>.telemetry.json` there when it exits:
+    phase timings (import, parse, compute, write), peak RSS of the process and
+    of its worker processes, input dimensions (taxa, sites, pairs, ...) and
+    the decision. collect-telemetry.py merges them into one table.
+"""
+
+import atexit
+import contextlib
+import gzip
+import hashlib
+import importlib.util
+import json
+import mmap
+import os
+import resource
+import socket
+import sqlite3
+import struct
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+import numpy as np
+
+# Directory holding the bin/ scripts
+BIN_DIR = Path(__file__).resolve().parent
+
+# Supported FASTA extensions
+FASTA_EXTS = [".fasta", ".fa", ".fas", ".fna"]
+
+# Bytes FASTA parsing: uppercasing table and characters dropped from sequences
+UPPERCASE = bytes.maketrans(b"abcdefghijklmnopqrstuvwxyz", b"ABCDEFGHIJKLMNOPQRSTUVWXYZ")
+WHITESPACE = b" \t\r\n\v\f"
+FASTA_WIDTH = 60  # Line width of written FASTA, as Biopython's
+
+# Compressed FASTA (BGZF is a series of gzip members, so gzip reads both)
+COMPRESSED_SUFFIXES = [".gz", ".bgz"]
+GZIP_MAGIC = b"\x1f\x8b"
+COMPRESS_LEVEL = 6
+
+# Alignment cache format
+CACHE_SUFFIX = ".cpaln"
+CACHE_MAGIC = b"CPALN\x00\x01\n"
+CACHE_ALIGN = 64
+
+# FASTA offset index
+INDEX_SUFFIX = ".cpidx"
+INDEX_MAGIC = "#cpidx"
+
+# Gene-block cache, part of every block key (bump when the block layout changes)
+BLOCK_CACHE_VERSION = 1
+
+# Metrics cache
+METRICS_TIMEOUT = 600  # Seconds to wait for another task holding the write lock
+MISSING = object()
+
+# Sequential decisions
+EARLY_CONFIDENCE = 0.999
+EARLY_MIN_PAIRS = 256  # Pairs drawn before the first decision, and size of the first batch
+EARLY_MAX_FRACTION = 0.5  # Pairs drawn (as a fraction of all pairs) before falling back to the exact mean
+
+# Telemetry
+TELEMETRY_ENV = "CORE_PHYLOGENIES_TELEMETRY"
+TELEMETRY_SUFFIX = ".telemetry.json"
+
+
+def load_script(name):
+    """
+    Import one of the hyphenated bin/ scripts (e.g.
+    'filter-by-dnds-ratio-optimized.py') as a module so its functions can be
+    reused without spawning a new interpreter. Modules are cached in
+    `sys.modules` under a sanitised name.
+    """
+    module_name = "_bin_" + Path(name).stem.replace("-", "_")
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+
+    spec = importlib.util.spec_from_file_location(module_name, BIN_DIR / name)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def is_compressed(path):
+    """True if `path` starts with the gzip magic bytes."""
+    try:
+        with open(path, "rb") as handle:
+            return handle.read(len(GZIP_MAGIC)) == GZIP_MAGIC
+    except OSError:
+        return False
+
+
+def strip_compression(name):
+    """Return a file name without its .gz/.bgz suffix, if any."""
+    name = str(name)
+    for suffix in COMPRESSED_SUFFIXES:
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+
+def is_alignment_file(path):
+    """True if `path` has a FASTA (optionally compressed) or alignment cache extension."""
+    return Path(strip_compression(Path(path).name)).suffix in FASTA_EXTS + [CACHE_SUFFIX]
+
+
+def open_text(path, mode="r"):
+    """
+    Open a FASTA file as text (or as bytes with a "b" mode). Reading
+    decompresses gzip/BGZF input whatever its name; writing compresses if
+    `path` ends in .gz or .bgz.
+    """
+    text = "b" not in mode
+    if "r" in mode:
+        if is_compressed(path):
+            return gzip.open(path, "rt" if text else "rb")
+        return open(path, "r" if text else "rb")
+    if strip_compression(path) != str(path):
+        return gzip.open(path, mode.replace("t", "") + ("t" if text else ""), compresslevel=COMPRESS_LEVEL)
+    return open(path, mode)
+
+
+def split_path_id(path):
+    """Gene ID of prepare-id-split-path.py: the file name up to its first extension."""
+    return Path(path).name.rsplit(".", 2)[0]
+
+
+def split_all_id(path):
+    """Gene ID of prepare-id-split-all.py: as split_path_id(), then cut at the first '_' or '-'."""
+    gene_id = split_path_id(path)
+    if "_" in gene_id:
+        return gene_id.split("_")[0]
+    if "-" in gene_id:
+        return gene_id.split("-")[0]
+    return gene_id
+
+
+# Gene ID policies, by the name of the PREPARE_ID script (params.prepare_id_method)
+ID_METHODS = {
+    "prepare-id-split-path": split_path_id,
+    "prepare-id-split-all": split_all_id,
+}
+
+
+def list_alignments(source):
+    """
+    Expand `source` into a list of (gene_id, path) tuples.
+
+    `source` is either a directory (every FASTA file in it, compressed or not,
+    is used, sorted by name) or a file-of-filenames with one path per line.
+    Lines of the form `<id><TAB><path>[<TAB>...]` set the gene ID explicitly
+    (so a manifest from build-manifest.py can be used, its header line is
+    skipped); otherwise the file name up to its first extension is used, as
+    in prepare-id-split-path.py.
+    """
+    source = Path(source)
+    genes = []
+
+    if source.is_dir():
+        files = sorted(f for f in source.iterdir() if is_alignment_file(f))
+        for f in files:
+            genes.append((split_path_id(f), f))
+        return genes
+
+    with open(source) as fofn:
+        for line in fofn:
+            line = line.strip()
+            if not line:
+                continue
+            if "\t" in line:
+                gene_id, path = line.split("\t")[:2]
+                if (gene_id, path) == ("id", "path"):
+                    continue
+            else:
+                path = line
+                gene_id = split_path_id(path)
+            genes.append((gene_id, Path(path)))
+    return genes
+
+
+def alignment_digest(ids, matrix):
+    """SHA-256 of an alignment's IDs and uppercase sequence rows (arrays or bytes)."""
+    digest = hashlib.sha256()
+    digest.update("\n".join(ids).encode())
+    digest.update(b"\x00")
+    for row in matrix:
+        digest.update(row if isinstance(row, bytes) else row.tobytes())
+    return digest.hexdigest()
+
+
+def is_alignment_cache(path):
+    """True if `path` starts with the alignment cache magic bytes."""
+    try:
+        with open(path, "rb") as handle:
+            return handle.read(len(CACHE_MAGIC)) == CACHE_MAGIC
+    except OSError:
+        return False
+
+
+def write_alignment_cache(path, ids, matrix):
+    """Write an (ids, uint8 matrix) alignment to `path` in the cache format."""
+    matrix = np.ascontiguousarray(matrix, dtype=np.uint8)
+    header = json.dumps({
+        "ids": list(ids),
+        "shape": list(matrix.shape),
+        "sha256": alignment_digest(ids, matrix),
+    }).encode()
+    offset = len(CACHE_MAGIC) + 8 + len(header)
+    padding = -offset % CACHE_ALIGN
+
+    with open(path, "wb") as handle:
+        handle.write(CACHE_MAGIC)
+        handle.write(struct.pack("<Q", len(header)))
+        handle.write(header)
+        handle.write(b" " * padding)
+        handle.write(matrix.tobytes())
+
+
+def read_cache_header(path):
+    """Return (header dict, byte offset of the matrix) of an alignment cache."""
+    with open(path, "rb") as handle:
+        if handle.read(len(CACHE_MAGIC)) != CACHE_MAGIC:
+            raise ValueError(f"{path} is not an alignment cache")
+        (length,) = struct.unpack("<Q", handle.read(8))
+        header = json.loads(handle.read(length))
+    offset = len(CACHE_MAGIC) + 8 + length
+    return header, offset + (-offset % CACHE_ALIGN)
+
+
+def read_alignment_cache(path, verify=False):
+    """
+    Return (ids, matrix, sha256) of an alignment cache. The matrix is a
+    read-only memory map of the file; with `verify` the hash is recomputed.
+    """
+    header, offset = read_cache_header(path)
+    taxa, sites = header["shape"]
+    if taxa * sites == 0:
+        matrix = np.zeros((taxa, sites), dtype=np.uint8)
+    else:
+        matrix = np.memmap(path, dtype=np.uint8, mode="r", offset=offset, shape=(taxa, sites))
+    if verify and alignment_digest(header["ids"], matrix) != header["sha256"]:
+        raise ValueError(f"{path} does not match its content hash")
+    return header["ids"], matrix, header["sha256"]
+
+
+def sequences_to_matrix(seqs):
+    """Return equal-length sequence strings as an uppercase (taxa × sites) uint8 matrix."""
+    rows = [seq.upper().encode("ascii") for seq in seqs]
+    if len({len(row) for row in rows}) > 1:
+        raise ValueError("Sequences must all be the same length")
+    length = len(rows[0]) if rows else 0
+    return np.frombuffer(b"".join(rows), dtype=np.uint8).reshape(len(rows), length)
+
+
+@contextlib.contextmanager
+def fasta_bytes(path):
+    """
+    Context giving the raw bytes of a FASTA file: a read-only memory map of an
+    uncompressed file, the decompressed content of a gzip/bgzip one.
+    """
+    if is_compressed(path):
+        with gzip.open(path, "rb") as handle:
+            yield handle.read()
+        return
+    with open(path, "rb") as handle:
+        if os.fstat(handle.fileno()).st_size == 0:  # Empty files cannot be mapped
+            yield b""
+            return
+        with mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield data
+
+
+def fasta_spans(data):
+    """
+    Yield (id, record start, sequence start, record end) byte offsets of every
+    record of FASTA bytes `data`. A record runs from its '>' up to the next
+    record's '>' (or the end), so data[start:end] is the record as written.
+    """
+    start = 0 if data[:1] == b">" else (data.find(b"\n>") + 1 or -1)
+    while start >= 0:
+        end = data.find(b"\n>", start) + 1 or len(data)
+        newline = data.find(b"\n", start, end)
+        sequence_start = end if newline < 0 else newline + 1
+        title = data[start + 1:sequence_start].split(None, 1)
+        yield (title[0].decode() if title else ""), start, sequence_start, end
+        start = end if end < len(data) else -1
+
+
+def clean_sequence(raw):
+    """Uppercase `raw` sequence bytes and drop line breaks and other whitespace."""
+    return raw.translate(UPPERCASE, WHITESPACE)
+
+
+def parse_fasta(data):
+    """Return (ids, uppercase sequence bytes) of the records of FASTA bytes `data`."""
+    ids, sequences = [], []
+    for seq_id, _, sequence_start, end in fasta_spans(data):
+        ids.append(seq_id)
+        sequences.append(clean_sequence(data[sequence_start:end]))
+    return ids, sequences
+
+
+def read_fasta(path):
+    """
+    Return (ids, uppercase uint8 matrix) of a (optionally compressed) FASTA
+    alignment. Rows are appended to one buffer as they are parsed, so the
+    matrix is built without a second copy. Raises ValueError for files
+    without records or with sequences of different lengths.
+    """
+    ids, buffer, length = [], bytearray(), None
+    with fasta_bytes(path) as data:
+        for seq_id, _, sequence_start, end in fasta_spans(data):
+            sequence = clean_sequence(data[sequence_start:end])
+            if length is None:
+                length = len(sequence)
+            elif len(sequence) != length:
+                raise ValueError("Sequences must all be the same length")
+            ids.append(seq_id)
+            buffer += sequence
+    if not ids:
+        raise ValueError("No records found in handle")
+    return ids, np.frombuffer(buffer, dtype=np.uint8).reshape(len(ids), length)
+
+
+def read_alignment(path):
+    """
+    Return (ids, uppercase uint8 matrix) of an alignment stored either as an
+    alignment cache or as (optionally compressed) FASTA. Raises ValueError
+    for FASTA files without records or with sequences of different lengths.
+    """
+    if is_alignment_cache(path):
+        ids, matrix, _ = read_alignment_cache(path)
+        return ids, matrix
+    return read_fasta(path)
+
+
+def read_alignment_mapped(path, directory="."):
+    """
+    read_alignment() with the matrix in a file-backed memory map: the map of
+    an alignment cache, or a temporary file in `directory` that FASTA rows
+    are parsed into one by one. The file is unlinked at once and freed with
+    the matrix. Raises ValueError as read_fasta().
+    """
+    if is_alignment_cache(path):
+        return read_alignment(path)
+
+    with fasta_bytes(path) as data:
+        spans = list(fasta_spans(data))
+        if not spans:
+            raise ValueError("No records found in handle")
+        length = len(clean_sequence(data[spans[0][2]:spans[0][3]]))
+        if length == 0:
+            matrix = np.zeros((len(spans), 0), dtype=np.uint8)
+        else:
+            with tempfile.NamedTemporaryFile(dir=directory, suffix=CACHE_SUFFIX) as handle:
+                matrix = np.memmap(handle, dtype=np.uint8, mode="w+", shape=(len(spans), length))
+        for row, (_, _, sequence_start, end) in enumerate(spans):
+            sequence = clean_sequence(data[sequence_start:end])
+            if len(sequence) != length:
+                raise ValueError("Sequences must all be the same length")
+            matrix[row] = np.frombuffer(sequence, dtype=np.uint8)
+    return [span[0] for span in spans], matrix
+
+
+def column_windows(shape, memory_budget=None, bytes_per_cell=1.0):
+    """
+    (start, stop) column ranges covering a taxa × sites matrix, each narrow
+    enough that temporaries of `bytes_per_cell` per matrix cell fit in
+    `memory_budget` bytes (at least one column). One window without a budget.
+    """
+    taxa, sites = shape
+    if memory_budget is None:
+        width = max(sites, 1)
+    else:
+        width = max(int(memory_budget // (max(taxa, 1) * bytes_per_cell)), 1)
+    return [(start, min(start + width, sites)) for start in range(0, sites, width)]
+
+
+def read_sequences(path):
+    """
+    Return (ids, uppercase sequence bytes) of an alignment cache or of any
+    FASTA file. Unlike read_alignment(), sequences may differ in length.
+    """
+    if is_alignment_cache(path):
+        ids, matrix, _ = read_alignment_cache(path)
+        return ids, [row.tobytes() for row in matrix]
+    with fasta_bytes(path) as data:
+        return parse_fasta(data)
+
+
+def write_fasta(path, ids, sequences, width=FASTA_WIDTH):
+    """
+    Write sequences (bytes or uint8 arrays) as FASTA with `width` bases per
+    line, laid out as SeqIO.write() does. Compressed if `path` ends in .gz.
+    """
+    with open_text(path, "wb") as handle:
+        for seq_id, sequence in zip(ids, sequences):
+            sequence = sequence if isinstance(sequence, bytes) else sequence.tobytes()
+            handle.write(b">" + seq_id.encode() + b"\n")
+            for offset in range(0, len(sequence), width):
+                handle.write(sequence[offset:offset + width] + b"\n")
+
+
+def read_ids(path):
+    """
+    Record IDs of an alignment cache (from its header) or of a FASTA file,
+    skipping over sequences without reading them. IDs are cut at the first
+    whitespace, as Biopython's `rec.id`.
+    """
+    if is_alignment_cache(path):
+        return read_cache_header(path)[0]["ids"]
+
+    with fasta_bytes(path) as data:
+        return [seq_id for seq_id, *_ in fasta_spans(data)]
+
+
+def build_fasta_index(path):
+    """Return [(id, offset, length)] of every record of an uncompressed FASTA file."""
+    with fasta_bytes(path) as data:
+        return [(seq_id, start, end - start) for seq_id, start, _, end in fasta_spans(data)]
+
+
+def write_fasta_index(path, index_path, entries):
+    stat = Path(path).stat()
+    with open(index_path, "w") as handle:
+        handle.write(f"{INDEX_MAGIC}\t{stat.st_size}\t{stat.st_mtime_ns}\n")
+        for seq_id, offset, length in entries:
+            handle.write(f"{seq_id}\t{offset}\t{length}\n")
+
+
+def read_fasta_index(path, index_path):
+    """Return the entries of `index_path`, or None if it is missing or stale for `path`."""
+    try:
+        with open(index_path) as handle:
+            magic, size, mtime = handle.readline().rstrip("\n").split("\t")
+            stat = Path(path).stat()
+            if magic != INDEX_MAGIC or (int(size), int(mtime)) != (stat.st_size, stat.st_mtime_ns):
+                return None
+            entries = []
+            for line in handle:
+                seq_id, offset, length = line.rstrip("\n").split("\t")
+                entries.append((seq_id, int(offset), int(length)))
+            return entries
+    except (OSError, ValueError):
+        return None
+
+
+def fasta_index(path, index_path=None):
+    """
+    Offset index of an uncompressed FASTA file: read from `index_path` if it
+    is up to date, otherwise built and saved there. Without `index_path`, or
+    if it cannot be saved (e.g. read-only directory), it is only returned;
+    indexes are never written next to the input, where they would be picked
+    up as alignments.
+    """
+    if index_path is None:
+        return build_fasta_index(path)
+    entries = read_fasta_index(path, index_path)
+    if entries is None:
+        entries = build_fasta_index(path)
+        try:
+            write_fasta_index(path, index_path, entries)
+        except OSError:
+            pass
+    return entries
+
+
+def matrix_to_records(ids, matrix):
+    """Return an (ids, matrix) alignment as a list of Biopython SeqRecords."""
+    from Bio.Seq import Seq
+    from Bio.SeqRecord import SeqRecord
+    return [SeqRecord(Seq(row.tobytes().decode("ascii")), id=seq_id, description="")
+            for seq_id, row in zip(ids, matrix)]
+
+
+def read_records(path):
+    """SeqRecords of an alignment cache or of any FASTA file (no length checks)."""
+    if is_alignment_cache(path):
+        ids, matrix, _ = read_alignment_cache(path)
+        return matrix_to_records(ids, matrix)
+
+    from Bio import SeqIO
+    with open_text(path) as handle:
+        return list(SeqIO.parse(handle, "fasta"))
+
+
+def content_hash(path, ids, matrix):
+    """
+    Content hash of an alignment read from `path`: taken from the header of an
+    alignment cache, computed with alignment_digest() otherwise.
+    """
+    if is_alignment_cache(path):
+        return read_cache_header(path)[0]["sha256"]
+    return alignment_digest(ids, matrix)
+
+
+class SitePatterns:
+    """
+    Distinct site patterns of an alignment and how many columns each stands
+    for, accumulated block by block (e.g. gene by gene) over the columns of
+    a taxa × sites uint8 matrix, in order of first occurrence.
+    """
+
+    def __init__(self, taxa):
+        self.taxa = taxa
+        self.index = {}  # Column bytes → pattern number
+        self.columns = []
+        self.counts = []
+        self.sites = 0
+
+    def add(self, block):
+        """Add the columns of a taxa × columns block; return (its own patterns matrix, their counts)."""
+        block = np.asarray(block, dtype=np.uint8)
+        if block.shape[1] == 0:
+            return np.zeros((self.taxa, 0), dtype=np.uint8), np.zeros(0, dtype=np.int64)
+
+        columns = np.ascontiguousarray(block.T).view(np.dtype((np.void, self.taxa))).ravel()
+        unique, first, counts = np.unique(columns, return_index=True, return_counts=True)
+        order = np.argsort(first)
+        unique, counts = unique[order], counts[order]
+
+        for column, count in zip(unique, counts.tolist()):
+            key = column.tobytes()
+            number = self.index.get(key)
+            if number is None:
+                self.index[key] = len(self.columns)
+                self.columns.append(key)
+                self.counts.append(count)
+            else:
+                self.counts[number] += count
+        self.sites += block.shape[1]
+
+        patterns = np.frombuffer(unique.tobytes(), dtype=np.uint8).reshape(len(unique), self.taxa).T
+        return patterns, counts
+
+    def matrix(self):
+        """Taxa × patterns uint8 matrix of every distinct pattern so far."""
+        data = np.frombuffer(b"".join(self.columns), dtype=np.uint8)
+        return data.reshape(len(self.columns), self.taxa).T
+
+    def weights(self):
+        return np.array(self.counts, dtype=np.int64)
+
+
+def classify_patterns(patterns, weights):
+    """
+    Site classes of a taxa × patterns matrix, each as (patterns, sites):
+    invariant_A … invariant_T (a single base, A/C/G/T, apart from gaps and
+    ambiguity codes), no_base (gaps and ambiguity codes only), variable
+    (two or more bases) and total.
+    """
+    weights = np.asarray(weights, dtype=np.int64)
+    present = np.stack([(patterns == ord(base)).any(axis=0) for base in "ACGT"])
+    bases = present.sum(axis=0)
+    classes = {}
+    for code, base in enumerate("ACGT"):
+        mask = (bases == 1) & present[code]
+        classes[f"invariant_{base}"] = (int(mask.sum()), int(weights[mask].sum()))
+    for name, mask in (("no_base", bases == 0), ("variable", bases >= 2)):
+        classes[name] = (int(mask.sum()), int(weights[mask].sum()))
+    classes["total"] = (len(weights), int(weights.sum()))
+    return classes
+
+
+def write_site_weights(path, weights):
+    """Write column weights on one whitespace-separated line (raxml-ng's --site-weights format)."""
+    with open(path, "w") as handle:
+        handle.write(" ".join(str(int(weight)) for weight in weights) + "\n")
+
+
+def read_site_weights(path):
+    """Column weights written by write_site_weights() (any whitespace), as an int64 array."""
+    with open(path) as handle:
+        return np.array(handle.read().split(), dtype=np.int64)
+
+
+class BlockCache:
+    """
+    Directory of per-gene blocks in sorted ID order, built on the first
+    request for a gene and memory-mapped afterwards. Thread-safe; blocks are
+    shared by every process given the same directory.
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.blocks = {}  # Source path → block path, for sources already looked up
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def key(self, path):
+        if is_alignment_cache(path):
+            source = f"{BLOCK_CACHE_VERSION}\t{read_cache_header(path)[0]['sha256']}"
+        else:
+            real = os.path.realpath(path)
+            stat = os.stat(real)
+            source = f"{BLOCK_CACHE_VERSION}\t{real}\t{stat.st_size}\t{stat.st_mtime_ns}"
+        return hashlib.sha256(source.encode()).hexdigest()
+
+    def block(self, path):
+        """Path of the block of `path`, parsing the alignment and storing it if missing."""
+        path = str(path)
+        block = self.blocks.get(path)
+        if block is not None:
+            return block
+
+        block = self.directory / f"{self.key(path)}{CACHE_SUFFIX}"
+        hit = block.exists()
+        if not hit:
+            ids, matrix = read_alignment(path)
+            first = {}
+            for row, seq_id in enumerate(ids):
+                first.setdefault(seq_id, row)
+            order = sorted(first)
+            temporary = f"{block}.{os.getpid()}.{threading.get_ident()}.tmp"
+            write_alignment_cache(temporary, order, matrix[[first[seq_id] for seq_id in order]])
+            os.replace(temporary, block)
+
+        with self.lock:
+            self.blocks[path] = block
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return block
+
+    def scan(self, path):
+        """(sorted IDs, width) of the block of `path`, from its header only."""
+        header, _ = read_cache_header(self.block(path))
+        return header["ids"], header["shape"][1]
+
+    def load(self, path):
+        """(sorted IDs, memory-mapped uint8 matrix) of the block of `path`."""
+        ids, matrix, _ = read_alignment_cache(self.block(path))
+        return ids, matrix
+
+
+def triangle_pairs(k, n):
+    """Pairs (i, j), i < j, of linear indices `k` into the n(n-1)/2 pairs of n items, in row order."""
+    k = np.asarray(k, dtype=np.int64)
+    i = n - 2 - np.floor(np.sqrt(-8.0 * k + 4.0 * n * (n - 1) - 7) / 2 - 0.5).astype(np.int64)
+    j = k + i + 1 - n * (n - 1) // 2 + (n - i) * (n - i - 1) // 2
+    return i, j
+
+
+def sequential_decision(pair_values, pairs, low, high, value_range, seed=119318,
+                        confidence=EARLY_CONFIDENCE, min_pairs=EARLY_MIN_PAIRS, max_fraction=EARLY_MAX_FRACTION):
+    """
+    Decide whether the mean of a per-pair value over `pairs` pairs lies in
+    [low, high] from randomly drawn pairs. `pair_values(k)` returns the
+    values of the pairs with linear indices `k`, leaving out pairs without a
+    value. Every value must lie within an interval of width `value_range`
+    (e.g. 1 for proportions), or the bound is not valid.
+
+    Returns (decision, estimated mean, pairs drawn), with decision None when
+    the bound still straddles a boundary after `max_fraction` of the pairs.
+    """
+    budget = int(max_fraction * pairs)
+    if budget < min_pairs:
+        return None, None, 0
+
+    rng = np.random.default_rng(seed)
+    log_term = np.log(3 / (1 - confidence))
+    drawn = count = 0
+    total = squares = 0.0
+    mean = None
+    batch = min_pairs
+    while drawn < budget:
+        size = min(batch, budget - drawn)
+        values = np.asarray(pair_values(rng.integers(0, pairs, size)), dtype=np.float64)
+        drawn += size
+        batch *= 2
+        if values.size == 0:
+            continue
+        count += values.size
+        total += float(values.sum())
+        squares += float((values ** 2).sum())
+        mean = total / count
+        if count < min_pairs:
+            continue
+
+        variance = max(squares / count - mean ** 2, 0.0)
+        bound = np.sqrt(2 * variance * log_term / count) + 3 * value_range * log_term / count
+        if mean + bound < low or mean - bound > high:
+            return False, mean, drawn
+        if low <= mean - bound and mean + bound <= high:
+            return True, mean, drawn
+    return None, mean, drawn
+
+
+class MetricsCache:
+    """
+    SQLite store of per-gene metrics, one row per (content hash, metric,
+    parameters). Values are stored as JSON, so tuples come back as lists.
+    """
+
+    def __init__(self, path):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(path, timeout=METRICS_TIMEOUT)
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS metrics ("
+                "sha256 TEXT NOT NULL, metric TEXT NOT NULL, params TEXT NOT NULL, value TEXT, "
+                "PRIMARY KEY (sha256, metric, params))"
+            )
+
+    def get(self, sha256, metric, params=""):
+        """Return the stored value, or MISSING."""
+        row = self.connection.execute(
+            "SELECT value FROM metrics WHERE sha256 = ? AND metric = ? AND params = ?",
+            (sha256, metric, params),
+        ).fetchone()
+        return MISSING if row is None else json.loads(row[0])
+
+    def put(self, sha256, metric, value, params=""):
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO metrics (sha256, metric, params, value) VALUES (?, ?, ?, ?)",
+                (sha256, metric, params, json.dumps(value)),
+            )
+
+    def close(self):
+        self.connection.close()
+
+
+def cached_metric(cache, sha256, metric, params, compute):
+    """Return `metric` from `cache` (if any), else `compute()` it and store it."""
+    if cache is None:
+        return compute()
+    value = cache.get(sha256, metric, params)
+    if value is MISSING:
+        value = compute()
+        cache.put(sha256, metric, value, params)
+    return value
+
+
+def process_start_time():
+    """Epoch time at which this process started (Linux), or None."""
+    try:
+        with open("/proc/self/stat") as handle:
+            ticks = int(handle.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as handle:
+            uptime = float(handle.read().split()[0])
+        return time.time() - uptime + ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    """Peak resident memory in MB (ru_maxrss is in kB on Linux, in bytes on macOS)."""
+    return resource.getrusage(who).ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+class Telemetry:
+    """
+    Performance record of one script run, written at exit if the
+    CORE_PHYLOGENIES_TELEMETRY environment variable is set. Phases are timed
+    with `with telemetry.phase("parse"): ...` (repeated phases add up),
+    input dimensions are set with record() and the outcome with decide().
+    """
+
+    def __init__(self, script):
+        self.script = Path(script).name
+        self.directory = os.environ.get(TELEMETRY_ENV) or None
+        self.started = time.time()
+        self.phases = {}
+        self.dimensions = {}
+        self.decision = None
+
+        process_start = process_start_time()
+        if process_start is not None:
+            self.phases["import"] = max(self.started - process_start, 0.0)
+
+        if self.directory:
+            atexit.register(self.write)
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    def record(self, **dimensions):
+        self.dimensions.update(dimensions)
+
+    def decide(self, decision):
+        self.decision = decision
+
+    def write(self):
+        record = {
+            "script": self.script,
+            "argv": sys.argv[1:],
+            "cwd": os.getcwd(),
+            "host": socket.gethostname(),
+            "pid": os.getpid(),
+            "start": self.started,
+            "wall_s": time.time() - self.started + self.phases.get("import", 0.0),
+            "phases": self.phases,
+            "peak_rss_mb": peak_rss_mb(),
+            "children_peak_rss_mb": peak_rss_mb(resource.RUSAGE_CHILDREN),
+            "dimensions": self.dimensions,
+            "decision": self.decision,
+        }
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            stamp = int(self.started * 1000)
+            name = f"{Path(self.script).stem}.{record['host']}.{record['pid']}.{stamp}{TELEMETRY_SUFFIX}"
+            with open(os.path.join(self.directory, name), "w") as handle:
+                json.dump(record, handle, default=str)
+        except OSError as e:
+            print(f"Warning: telemetry not written: {e}", file=sys.stderr)
+
+
+def timed(telemetry, name):
+    """`telemetry.phase(name)`, or a no-op context if `telemetry` is None (library use)."""
+    return telemetry.phase(name) if telemetry is not None else contextlib.nullcontext()
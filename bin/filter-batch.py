@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Program: Batch Pass/Fail Filter for Many Gene Alignments
+--------------------------------------------------------
+Description:
+    Evaluates every gene alignment of a directory (or file-of-filenames) in a
+    single interpreter. Each alignment is parsed once and the enabled criteria
+    are run in the requested order, stopping at the first one that fails:
+      - polymorphic-sites:    polymorphic-site rate ≥ cutoff
+      - nucleotide-diversity: π ∈ [min, max]
+      - dnds-ratio:           average pairwise dN/dS ∈ [min, max]
+    The metric kernels are the ones of the single-gene filter scripts, so the
+    decisions match FILTER_BY_POLYMORPHIC_SITES, FILTER_BY_NUCLEOTIDE_DIVERSITY
+    and FILTER_BY_DNDS_RATIO. With --metrics-cache they also share the same
+    metrics cache entries, so either can reuse the other's results.
+    With --all-metrics every metric is computed for every gene (criteria
+    without a threshold pass), which is what threshold-sweep.py reads.
+    --metrics restricts this to the metrics a sweep actually uses; the
+    others are left "NA", so e.g. the O(n²) dN/dS is not computed for a
+    grid without a dN/dS axis.
+
+Input:
+    - A directory of FASTA alignments (or .cpaln alignment caches), or a text
+      file with one path per line (optionally `<id><TAB><path>`).
+
+Output:
+    - A TSV table with one row per gene: its absolute path, the metrics that
+      were computed ("NA" for skipped ones), the first failed criterion and
+      TRUE/FALSE.
+    - A TSV list (`<id><TAB><absolute path>`) of the genes that passed.
+
+Usage:
+    python filter-batch.py <alignments> --table <results.tsv> --passed <passed.tsv>
+        [--polymorphic-sites-cutoff X] [--nucleotide-diversity MIN MAX]
+        [--dnds-ratio MIN MAX] [--order a,b,c] [--include-gaps] [--threads N]
+        [--metrics-cache DB] [--all-metrics [--metrics a,b]]
+"""
+
+import argparse
+import sys
+from pathlib import Path
+from core_phylogenies import (MetricsCache, Telemetry, cached_metric, content_hash, list_alignments, load_script,
+                              read_alignment, timed)
+
+CRITERIA = ["polymorphic-sites", "nucleotide-diversity", "dnds-ratio"]
+
+TABLE_COLUMNS = [
+    "id", "path",
+    "polymorphic_sites", "informative_sites", "total_columns", "polymorphic_rate",
+    "nucleotide_diversity", "dnds_ratio",
+    "failed_filter", "result",
+]
+
+polymorphic_sites = load_script("filter-by-normalized-polymorphic-sites.py")
+nucleotide_diversity = load_script("filter-by-nucleotide-diversity-optimized.py")
+dnds_ratio = load_script("filter-by-dnds-ratio-optimized.py")
+
+
+def check_polymorphic_sites(ids, matrix, args, row, cache, sha256):
+    poly, informative, length = cached_metric(cache, sha256, polymorphic_sites.METRIC, "",
+                                              lambda: polymorphic_sites.count_site_classes(matrix))
+    rate = poly / length if length > 0 else 0.0
+    row.update(polymorphic_sites=poly, informative_sites=informative,
+               total_columns=length, polymorphic_rate=f"{rate:.4f}")
+    return args.polymorphic_sites_cutoff is None or rate >= args.polymorphic_sites_cutoff
+
+
+def check_nucleotide_diversity(ids, matrix, args, row, cache, sha256):
+    ignore_gaps = not args.include_gaps
+    pi = cached_metric(cache, sha256, nucleotide_diversity.METRIC, nucleotide_diversity.metric_params(ignore_gaps),
+                       lambda: nucleotide_diversity.count_nucleotide_diversity(matrix, ignore_gaps=ignore_gaps))
+    row["nucleotide_diversity"] = pi
+    if args.nucleotide_diversity is None:
+        return True
+    low, high = args.nucleotide_diversity
+    return pi is not None and low <= pi <= high
+
+
+def check_dnds_ratio(ids, matrix, args, row, cache, sha256):
+    avg = cached_metric(cache, sha256, dnds_ratio.METRIC, dnds_ratio.metric_params(args.include_gaps),
+                        lambda: dnds_ratio.average_dnds_table([seq.tobytes() for seq in matrix],
+                                                              args.include_gaps, args.threads))
+    row["dnds_ratio"] = avg
+    if args.dnds_ratio is None:
+        return True
+    low, high = args.dnds_ratio
+    return avg is not None and low <= avg <= high
+
+
+CHECKS = {
+    "polymorphic-sites": check_polymorphic_sites,
+    "nucleotide-diversity": check_nucleotide_diversity,
+    "dnds-ratio": check_dnds_ratio,
+}
+
+
+def enabled_criteria(args):
+    """Return the enabled criteria in the order requested with --order."""
+    enabled = {
+        "polymorphic-sites": args.polymorphic_sites_cutoff is not None,
+        "nucleotide-diversity": args.nucleotide_diversity is not None,
+        "dnds-ratio": args.dnds_ratio is not None,
+    }
+    return [name for name in args.order if enabled[name]]
+
+
+def evaluate_gene(gene_id, path, criteria, args, cache=None, keep_going=False, telemetry=None):
+    """
+    Parse one alignment and run `criteria` on it, short-circuiting on failure
+    unless `keep_going` (then every metric is computed and the first failed
+    criterion is reported). Metrics are taken from / stored to `cache` (a
+    MetricsCache), if given. Parsing and metrics are timed in `telemetry`,
+    if given.
+    """
+    row = {column: "NA" for column in TABLE_COLUMNS}
+    row.update(id=gene_id, path=Path(path).absolute())
+
+    try:
+        with timed(telemetry, "parse"):
+            ids, matrix = read_alignment(path)
+    except Exception:
+        row.update(failed_filter="parse", result="FALSE")
+        return row
+
+    with timed(telemetry, "compute"):
+        sha256 = content_hash(path, ids, matrix) if cache else None
+        for name in criteria:
+            if not CHECKS[name](ids, matrix, args, row, cache, sha256) and row["result"] == "NA":
+                row.update(failed_filter=name, result="FALSE")
+                if not keep_going:
+                    return row
+
+    if row["result"] == "NA":
+        row["result"] = "TRUE"
+    return row
+
+
+def parse_criteria(value):
+    names = [name.strip() for name in value.split(",") if name.strip()]
+    unknown = [name for name in names if name not in CRITERIA]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown criteria: {', '.join(unknown)}")
+    return names
+
+
+def parse_order(value):
+    order = parse_criteria(value)
+    # Criteria left out of --order still run, after the listed ones
+    return order + [name for name in CRITERIA if name not in order]
+
+
+def main():
+    p = argparse.ArgumentParser(
+        description="Evaluate polymorphic-site, π and dN/dS criteria for many alignments at once"
+    )
+    p.add_argument("alignments", help="Directory of FASTA alignments or file-of-filenames")
+    p.add_argument("--table", required=True, help="Output TSV with per-gene metrics and result")
+    p.add_argument("--passed", required=True, help="Output TSV listing genes that passed")
+    p.add_argument("--polymorphic-sites-cutoff", type=float, default=None,
+                   help="Minimum polymorphic-site rate (0–1)")
+    p.add_argument("--nucleotide-diversity", type=float, nargs=2, metavar=("MIN", "MAX"),
+                   default=None, help="Inclusive π range")
+    p.add_argument("--dnds-ratio", type=float, nargs=2, metavar=("MIN", "MAX"),
+                   default=None, help="Inclusive average dN/dS range")
+    p.add_argument("--order", type=parse_order, default=list(CRITERIA),
+                   help="Comma-separated evaluation order (default: polymorphic-sites,nucleotide-diversity,dnds-ratio)")
+    p.add_argument("--include-gaps", action="store_true",
+                   help="Include gaps in the π and dN/dS calculations")
+    p.add_argument("--threads", type=int, default=1,
+                   help="Worker processes for the dN/dS pairwise comparisons (default: 1)")
+    p.add_argument("--metrics-cache", default=None,
+                   help="SQLite metrics cache to look metrics up in and store them to")
+    p.add_argument("--all-metrics", action="store_true",
+                   help="Compute every metric for every gene, without short-circuiting (for threshold-sweep.py)")
+    p.add_argument("--metrics", type=parse_criteria, default=list(CRITERIA),
+                   help="Comma-separated metrics computed with --all-metrics, the others are left NA (default: all)")
+    args = p.parse_args()
+    telemetry = Telemetry(__file__)
+
+    if not Path(args.alignments).exists():
+        print(f"Error: '{args.alignments}' does not exist", file=sys.stderr)
+        sys.exit(1)
+
+    genes = list_alignments(args.alignments)
+    criteria = [name for name in args.order if name in args.metrics] if args.all_metrics else enabled_criteria(args)
+    cache = MetricsCache(args.metrics_cache) if args.metrics_cache else None
+
+    passed_count = 0
+    with open(args.table, "w") as table, open(args.passed, "w") as passed:
+        table.write("\t".join(TABLE_COLUMNS) + "\n")
+        for gene_id, path in genes:
+            row = evaluate_gene(gene_id, path, criteria, args, cache, args.all_metrics, telemetry)
+            with telemetry.phase("write"):
+                table.write("\t".join(str(row[column]) for column in TABLE_COLUMNS) + "\n")
+                if row["result"] == "TRUE":
+                    passed.write(f"{gene_id}\t{Path(path).absolute()}\n")
+                    passed_count += 1
+
+    telemetry.record(genes=len(genes), criteria=",".join(criteria), threads=args.threads)
+    telemetry.decide(f"{passed_count}/{len(genes)} passed")
+
+if __name__ == "__main__":
+    main()
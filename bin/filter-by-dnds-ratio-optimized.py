@@ -7,18 +7,42 @@ Description:
     pairwise dN/dS (NG86), and prints "TRUE" if the result ∈ [min_dnds, max_dnds], 
     else "FALSE".
 
+Engines:
+    table      NumPy NG86 kernel: ORFs encoded as codon indices (0–63), all
+               pairs scored by lookups in precomputed 64×64 tables (default)
+    biopython  Bio.codonalign cal_dn_ds(..., method="NG86") for every pair
+
+    With --threads N the sequence pairs are split into contiguous row blocks
+    of roughly equal pair counts and evaluated by a pool of N processes. The
+    ORFs are handed to each worker once, when it starts.
+
+    With --metrics-cache, the average of the table engine is looked up by
+    alignment content hash and gap handling, and only computed (and stored)
+    on a miss.
+
 Usage:
-    python filter_dnds_passfail.py <input_fasta> <min_dnds> <max_dnds> [--include-gaps]
+    python filter_dnds_passfail.py <input_fasta> <min_dnds> <max_dnds> [--include-gaps] [--engine table|biopython] [--threads N] [--metrics-cache DB]
 """
 
 import argparse
-from Bio import SeqIO
+import multiprocessing
+from Bio.Data import CodonTable
 from Bio.codonalign.codonseq import cal_dn_ds
 from Bio.codonalign import CodonSeq
+import numpy as np
 import warnings
-from itertools import combinations
+from itertools import permutations
+from core_phylogenies import MetricsCache, Telemetry, cached_metric, content_hash, read_sequences
+
+# Metrics cache entry of average_dnds_table()
+METRIC = "dnds_ratio"
+
+def metric_params(include_gaps):
+    return f"include_gaps={include_gaps}"
 
 def extract_valid_codons(seq, include_gaps):
+    if isinstance(seq, bytes):
+        seq = seq.decode("ascii")
     s = seq.upper().replace("\n","").replace(" ","")
     if not include_gaps:
         s = s.replace("-", "")
@@ -35,33 +59,242 @@ def extract_valid_codons(seq, include_gaps):
             codons.append(c)
     return codons
 
-def average_dnds(recs, include_gaps):
-    if len(recs) < 2:
+# Codon index = 16·b1 + 4·b2 + b3 with A=0, C=1, G=2, T=3
+NG86_BASES = "ACGT"
+NG86_CODONS = [a + b + c for a in NG86_BASES for b in NG86_BASES for c in NG86_BASES]
+
+# Byte → base code lookup; 4 marks anything that is not A, C, G or T
+BASE_CODES = np.full(256, 4, dtype=np.uint8)
+for code, base in enumerate(NG86_BASES):
+    BASE_CODES[ord(base)] = code
+
+def build_ng86_tables(codon_table=None):
+    """
+    Precompute the NG86 quantities Bio.codonalign derives codon by codon.
+
+    Returns (syn_sites, non_sites, syn_diffs, non_diffs, is_stop), indexed by codon:
+        syn_sites, non_sites  synonymous / non-synonymous sites of each codon
+                              (NaN for stop codons)
+        syn_diffs, non_diffs  64×64 synonymous / non-synonymous differences,
+                              averaged over all mutational pathways
+        is_stop               True for the stop codons
+
+    As in Biopython, intermediate stop codons on a pathway are not excluded:
+    a step is synonymous when both codons translate to the same amino acid,
+    and two stop codons count as the same "amino acid".
+    """
+    if codon_table is None:
+        codon_table = CodonTable.generic_by_id[1]
+    forward, stops = codon_table.forward_table, codon_table.stop_codons
+    translate = forward.get
+
+    syn_sites = np.full(64, np.nan)
+    non_sites = np.full(64, np.nan)
+    for index, codon in enumerate(NG86_CODONS):
+        if codon in stops:
+            continue
+        syn = non = 0
+        for pos, base in enumerate(codon):
+            for other in NG86_BASES:
+                if other == base:
+                    continue
+                neighbor = codon[:pos] + other + codon[pos + 1:]
+                if neighbor not in stops and forward[neighbor] == forward[codon]:
+                    syn += 1
+                else:
+                    non += 1
+        norm = (syn + non) / 3
+        syn_sites[index] = syn / norm
+        non_sites[index] = non / norm
+
+    def step(codon1, codon2, weight):
+        return (weight, 0.0) if translate(codon1) == translate(codon2) else (0.0, weight)
+
+    syn_diffs = np.zeros((64, 64))
+    non_diffs = np.zeros((64, 64))
+    for i, codon1 in enumerate(NG86_CODONS):
+        for j, codon2 in enumerate(NG86_CODONS):
+            diff_pos = [k for k in range(3) if codon1[k] != codon2[k]]
+            if not diff_pos:
+                continue
+            paths = list(permutations(diff_pos))
+            weight = 1 / len(paths)
+            syn = non = 0.0
+            for path in paths:
+                current = codon1
+                for k in path:
+                    following = current[:k] + codon2[k] + current[k + 1:]
+                    s_step, n_step = step(current, following, weight)
+                    syn += s_step
+                    non += n_step
+                    current = following
+            syn_diffs[i, j] = syn
+            non_diffs[i, j] = non
+
+    is_stop = np.array([codon in stops for codon in NG86_CODONS])
+    return syn_sites, non_sites, syn_diffs, non_diffs, is_stop
+
+SYN_SITES, NON_SITES, SYN_DIFFS, NON_DIFFS, IS_STOP = build_ng86_tables()
+
+def extract_codon_indices(seq, include_gaps):
+    """
+    Array equivalent of extract_valid_codons(): the ORF from the first ATG up
+    to the first stop codon, with ambiguous codons dropped, as codon indices.
+    `seq` may be bytes (as read by read_sequences()) or a string.
+    """
+    s = seq if isinstance(seq, bytes) else seq.encode("ascii")
+    s = s.upper().replace(b"\n", b"").replace(b" ", b"")
+    if not include_gaps:
+        s = s.replace(b"-", b"")
+    start = s.find(b"ATG")
+    if start < 0:
+        return np.empty(0, dtype=np.intp)
+    n = (len(s) - start) // 3
+    raw = np.frombuffer(s, dtype=np.uint8, count=3 * n, offset=start)
+    codes = BASE_CODES[raw].reshape(n, 3).astype(np.intp)
+    valid = (codes < 4).all(axis=1)
+    index = np.where(valid, codes[:, 0] * 16 + codes[:, 1] * 4 + codes[:, 2], 0)
+    stops = np.flatnonzero(valid & IS_STOP[index])
+    if stops.size:
+        valid, index = valid[:stops[0]], index[:stops[0]]
+    return index[valid]
+
+def ng86_pair_ratios(orfs, start=0, stop=None):
+    """
+    dN/dS of the pairs (i, j > i) for rows start ≤ i < stop of the (sequences ×
+    codons) index matrix `orfs` of equal-length ORFs, following
+    Bio.codonalign's NG86 and the filter's rules: pairs without synonymous or
+    non-synonymous sites are skipped, dS > 0 gives dN/dS, dS ≤ 0 with dN = 0
+    gives 0.
+    """
+    if stop is None:
+        stop = len(orfs) - 1
+    S = SYN_SITES[orfs].sum(axis=1)
+    N = NON_SITES[orfs].sum(axis=1)
+
+    ratios = []
+    for i in range(start, stop):
+        others = orfs[i + 1:]
+        sd = SYN_DIFFS[orfs[i], others].sum(axis=1)
+        nd = NON_DIFFS[orfs[i], others].sum(axis=1)
+        s_sites = (S[i] + S[i + 1:]) / 2
+        n_sites = (N[i] + N[i + 1:]) / 2
+
+        ok = (s_sites > 0) & (n_sites > 0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ps = sd[ok] / s_sites[ok]
+            pn = nd[ok] / n_sites[ok]
+            ds = np.where(ps < 3 / 4, np.abs(-3 / 4 * np.log(1 - 4 / 3 * ps)), -1.0)
+            dn = np.where(pn < 3 / 4, np.abs(-3 / 4 * np.log(1 - 4 / 3 * pn)), -1.0)
+            ratio = np.where(ds > 0, dn / ds, 0.0)
+        ratios.append(ratio[(ds > 0) | (dn == 0)])
+    return np.concatenate(ratios) if ratios else np.empty(0)
+
+def biopython_pair_ratios(cs_list, start=0, stop=None):
+    """dN/dS of the pairs (i, j > i) for rows start ≤ i < stop via cal_dn_ds."""
+    if stop is None:
+        stop = len(cs_list) - 1
+    ratios = []
+    for i in range(start, stop):
+        for j in range(i + 1, len(cs_list)):
+            do_skip:bool = False
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                try:
+                    dn, ds = cal_dn_ds(cs_list[i], cs_list[j], method="NG86")
+                except:
+                    do_skip = True
+            if do_skip:
+                continue
+            if ds > 0:
+                ratios.append(dn/ds)
+            elif dn == 0:
+                ratios.append(0.0)
+    return ratios
+
+def split_rows(m, units):
+    """
+    Split the rows 0 … m-2 of the pair triangle of m sequences into at most
+    `units` contiguous (start, stop) blocks holding similar numbers of pairs.
+    """
+    if m < 2:
+        return []
+    pairs_before = np.concatenate(([0], np.cumsum(np.arange(m - 1, 0, -1))))
+    targets = np.linspace(0, pairs_before[-1], units + 1)[1:-1]
+    bounds = np.unique(np.concatenate(([0], np.searchsorted(pairs_before, targets), [m - 1])))
+    return [(int(a), int(b)) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+
+# Data shared with the pool workers, set once per process by _init_worker()
+_WORKER_DATA = None
+
+def _init_worker(data):
+    global _WORKER_DATA
+    _WORKER_DATA = data
+
+def _table_work_unit(unit):
+    group, start, stop = unit
+    return ng86_pair_ratios(_WORKER_DATA[group], start, stop)
+
+def _biopython_work_unit(unit):
+    start, stop = unit
+    return biopython_pair_ratios(_WORKER_DATA, start, stop)
+
+def run_work_units(function, data, units, threads):
+    """Evaluate `function` over `units` in order, in a pool of `threads` processes if > 1."""
+    if threads <= 1 or len(units) <= 1:
+        _init_worker(data)
+        return [function(unit) for unit in units]
+    context = multiprocessing.get_context("fork")
+    with context.Pool(threads, initializer=_init_worker, initargs=(data,)) as pool:
+        return pool.map(function, units, chunksize=1)
+
+def average_dnds_table(seqs, include_gaps, threads=1, stats=None):
+    """Table-driven equivalent of average_dnds()."""
+    if len(seqs) < 2:
+        return None
+    orfs = [extract_codon_indices(seq, include_gaps) for seq in seqs]
+    if any(orf.size == 0 for orf in orfs):
+        return None
+    if stats is not None:
+        stats["codons_kept"] = int(sum(orf.size for orf in orfs))
+
+    # cal_dn_ds refuses ORFs of different lengths, so only equal-length pairs count
+    by_length = {}
+    for orf in orfs:
+        by_length.setdefault(orf.size, []).append(orf)
+    groups = [np.vstack(group) for group in by_length.values()]
+
+    units = [(g, start, stop)
+             for g, group in enumerate(groups)
+             for start, stop in split_rows(len(group), max(threads, 1) * 4)]
+    ratios = run_work_units(_table_work_unit, groups, units, threads)
+    ratios = np.concatenate(ratios) if ratios else np.empty(0)
+    if stats is not None:
+        stats["pairs_evaluated"] = int(ratios.size)
+    return float(ratios.sum() / ratios.size) if ratios.size else None
+
+def average_dnds(seqs, include_gaps, threads=1, stats=None):
+    """
+    Average pairwise NG86 dN/dS of sequences (bytes or strings); `stats` (a
+    dict), if given, gets codons_kept and pairs_evaluated.
+    """
+    if len(seqs) < 2:
         return None
     cs_list = []
-    for rec in recs:
-        orf = extract_valid_codons(str(rec.seq), include_gaps)
+    for seq in seqs:
+        orf = extract_valid_codons(seq, include_gaps)
         if not orf:
             return None
         try:
             cs_list.append(CodonSeq("".join(orf)))
         except:
             return None
-    ratios = []
-    for x, y in combinations(cs_list, 2):
-        do_skip:bool = False
-        with warnings.catch_warnings():
-            warnings.simplefilter("ignore")
-            try:
-                dn, ds = cal_dn_ds(x, y, method="NG86")
-            except:
-                do_skip = True
-        if do_skip:
-            continue
-        if ds > 0:
-            ratios.append(dn/ds)
-        elif dn == 0:
-            ratios.append(0.0)
+    if stats is not None:
+        stats["codons_kept"] = sum(len(cs) // 3 for cs in cs_list)
+    units = split_rows(len(cs_list), max(threads, 1) * 4)
+    ratios = [r for chunk in run_work_units(_biopython_work_unit, cs_list, units, threads) for r in chunk]
+    if stats is not None:
+        stats["pairs_evaluated"] = len(ratios)
     return sum(ratios)/len(ratios) if ratios else None
 
 def main():
@@ -73,20 +306,41 @@ def main():
     p.add_argument("max_dnds", type=float, help="Maximum dN/dS (inclusive)")
     p.add_argument("--include-gaps", action="store_true",
                    help="Include gaps in codon extraction")
+    p.add_argument("--engine", choices=["table", "biopython"], default="table",
+                   help="NG86 implementation (default: table)")
+    p.add_argument("--threads", "--processes", type=int, default=1,
+                   help="Number of worker processes for the pairwise comparisons (default: 1)")
+    p.add_argument("--metrics-cache", default=None,
+                   help="SQLite metrics cache to look the metric up in and store it to")
     args = p.parse_args()
+    telemetry = Telemetry(__file__)
 
     try:
-        recs = list(SeqIO.parse(args.input_fasta, "fasta"))
+        with telemetry.phase("parse"):
+            ids, seqs = read_sequences(args.input_fasta)
     except Exception:
+        telemetry.decide("FALSE")
         print("FALSE")
         return
+    telemetry.record(taxa=len(seqs), sites=max((len(seq) for seq in seqs), default=0),
+                     pairs=len(seqs) * (len(seqs) - 1) // 2, engine=args.engine, threads=args.threads)
 
-    avg = average_dnds(recs, args.include_gaps)
+    stats = {}  # Stays empty on a metrics cache hit
+    with telemetry.phase("compute"):
+        if args.engine == "table":
+            cache = MetricsCache(args.metrics_cache) if args.metrics_cache else None
+            sha256 = content_hash(args.input_fasta, ids, seqs) if cache else None
+            avg = cached_metric(cache, sha256, METRIC, metric_params(args.include_gaps),
+                                lambda: average_dnds_table(seqs, args.include_gaps, args.threads, stats))
+        else:
+            avg = average_dnds(seqs, args.include_gaps, args.threads, stats)
     within_range:bool = (avg is not None and args.min_dnds <= avg <= args.max_dnds)
+    telemetry.record(dnds_ratio=avg, **stats)
+    telemetry.decide("TRUE" if within_range else "FALSE")
     print("TRUE" if within_range else "FALSE")
 
     log_path = args.input_fasta + ".log"
-    with open(log_path, 'w') as log_file:
+    with telemetry.phase("write"), open(log_path, 'w') as log_file:
         log_file.write(f"Average: {avg}\n")
         log_file.write(f"Min: {args.min_dnds}, Max: {args.max_dnds}\n")
         log_file.write("Result: " + ("TRUE" if within_range else "FALSE") + "\n")
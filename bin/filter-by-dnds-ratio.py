@@ -12,13 +12,15 @@ Usage:
 """
 
 import argparse
-from Bio import SeqIO
 from Bio.codonalign.codonseq import cal_dn_ds
 from Bio.codonalign import CodonSeq
 import warnings
 from itertools import combinations
+from core_phylogenies import Telemetry, read_sequences
 
 def extract_valid_codons(seq, include_gaps):
+    if isinstance(seq, bytes):
+        seq = seq.decode("ascii")
     seq = seq.upper().replace("\n", "").replace(" ", "")
     if not include_gaps:
         seq = seq.replace("-", "")
@@ -36,13 +38,16 @@ def extract_valid_codons(seq, include_gaps):
             valid.append(codon)
     return valid
 
-def average_dnds(aln_file, include_gaps):
-    records = list(SeqIO.parse(aln_file, "fasta"))
-    if len(records) < 2:
+def average_dnds(sequences, include_gaps, stats=None):
+    """
+    Average pairwise NG86 dN/dS of sequences (bytes or strings); `stats` (a
+    dict), if given, gets codons_kept and pairs_evaluated.
+    """
+    if len(sequences) < 2:
         return None
     codon_seqs = []
-    for rec in records:
-        codons = extract_valid_codons(str(rec.seq), include_gaps)
+    for seq in sequences:
+        codons = extract_valid_codons(seq, include_gaps)
         if not codons:
             return None
         try:
@@ -50,6 +55,8 @@ def average_dnds(aln_file, include_gaps):
             codon_seqs.append(cs)
         except Exception:
             return None
+    if stats is not None:
+        stats["codons_kept"] = sum(len(cs) // 3 for cs in codon_seqs)
     ratios = []
     for i, j in combinations(range(len(codon_seqs)), 2):
         do_skip:bool = False
@@ -65,6 +72,8 @@ def average_dnds(aln_file, include_gaps):
             ratios.append(dn / ds)
         elif dn == 0:
             ratios.append(0.0)
+    if stats is not None:
+        stats["pairs_evaluated"] = len(ratios)
     return sum(ratios) / len(ratios) if ratios else None
 
 def main():
@@ -77,24 +86,33 @@ def main():
     p.add_argument("--include-gaps", action="store_true",
                    help="Include gaps in codon extraction")
     args = p.parse_args()
+    telemetry = Telemetry(__file__)
 
     # Attempt to parse the file; on any error, print FALSE and exit
     try:
         # This will raise if the file is missing or not valid FASTA
-        _ = list(SeqIO.parse(args.input_fasta, "fasta"))
+        with telemetry.phase("parse"):
+            _, sequences = read_sequences(args.input_fasta)
     except Exception:
+        telemetry.decide("FALSE")
         print("FALSE")
         return
+    telemetry.record(taxa=len(sequences), sites=max((len(seq) for seq in sequences), default=0),
+                     pairs=len(sequences) * (len(sequences) - 1) // 2)
 
-    avg = average_dnds(args.input_fasta, args.include_gaps)
+    stats = {}
+    with telemetry.phase("compute"):
+        avg = average_dnds(sequences, args.include_gaps, stats)
     within_range:bool = avg is not None and args.min_dnds <= avg <= args.max_dnds
+    telemetry.record(dnds_ratio=avg, **stats)
+    telemetry.decide("TRUE" if within_range else "FALSE")
     if within_range:
         print("TRUE")
     else:
         print("FALSE")
 
     log_path = args.input_fasta + ".log"
-    with open(log_path, 'w') as log_file:
+    with telemetry.phase("write"), open(log_path, 'w') as log_file:
         log_file.write(f"Average: {avg}\n")
         log_file.write(f"Min: {args.min_dnds}, Max: {args.max_dnds}\n")
         log_file.write("Result: " + ("TRUE" if within_range else "FALSE") + "\n")
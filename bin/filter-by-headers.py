@@ -4,23 +4,48 @@ Program: Filter an alignment to only the taxa in a header list
 ---------------------------------------------------------------------
 Input:
     1) A text file of k headers (one per line)
-    2) Base name or FASTA filename of an alignment (supports .fasta, .fa, .fas, .fna)
+    2) Base name or FASTA filename of an alignment (supports .fasta, .fa, .fas, .fna,
+       gzip/bgzip-compressed FASTA and .cpaln alignment caches)
 
 Output:
     A FASTA alignment file containing only those records whose headers
-    appear in the header list (order preserved).
+    appear in the header list (order preserved). Gzip-compressed if the
+    output name ends in .gz.
+
+    Uncompressed FASTA is read through an offset index (built on each run, or
+    with --index-dir saved there as <alignment>.cpidx and reused while the
+    alignment is unchanged; never written next to the input): wanted
+    records are seeked and copied as raw bytes, without parsing, so their
+    header lines and line wrapping are kept as in the input. Compressed FASTA
+    is decompressed in memory and its wanted records copied the same way;
+    records of alignment caches are written 60 bases per line.
+
+Batch mode (--alignments):
+    Applies one header list to every alignment of a directory (or file of
+    filenames, or manifest) with a pool of workers, writing one
+    <gene id>.fasta per alignment to --output-dir.
 
 Usage:
     python filter_by_taxa_list.py <headers.txt> <alignment_base_or_filename> <filtered.fasta>
+    python filter_by_taxa_list.py <headers.txt> --alignments <dir|fofn> --output-dir <dir>
+        [--workers N] [--compress] [--index-dir <dir>]
 """
 
 import sys
 import argparse
+import multiprocessing
+import os
 from pathlib import Path
-from Bio import SeqIO
+from core_phylogenies import (CACHE_SUFFIX, INDEX_SUFFIX, Telemetry, fasta_bytes, fasta_index, fasta_spans,
+                              is_alignment_cache, is_compressed, list_alignments, open_text,
+                              read_alignment_cache, write_fasta)
 
 # Supported FASTA extensions
-EXTS = [".fasta", ".fa", ".fas", ".fna"]
+EXTS = [".fasta", ".fa", ".fas", ".fna", CACHE_SUFFIX,
+        ".fasta.gz", ".fa.gz", ".fas.gz", ".fna.gz"]
+
+# Bytes copied at a time from a record
+COPY_BUFFER = 1 << 20
 
 def resolve_fasta_path(base):
     """
@@ -31,23 +56,71 @@ def resolve_fasta_path(base):
         return p
     if p.suffix == "":
         for ext in EXTS:
-            q = p.with_suffix(ext)
+            q = p.with_name(p.name + ext)
             if q.is_file():
                 return q
     return None
 
-def main():
-    p = argparse.ArgumentParser(
-        description="Filter FASTA alignment to only headers in a text list"
-    )
-    p.add_argument("headers_txt", help="Text file with one header per line")
-    p.add_argument("alignment_base", help="Base name or FASTA filename of the alignment")
-    p.add_argument("output_fasta", help="Output FASTA file for filtered records")
-    args = p.parse_args()
+def index_path_for(aln_path, index_dir):
+    """Where the offset index of `aln_path` is saved in `index_dir` (None: not saved)."""
+    if index_dir is None:
+        return None
+    return Path(index_dir) / (Path(aln_path).name + INDEX_SUFFIX)
 
-    # Load header set
+def copy_indexed_records(aln_path, wanted, output_path, index_path=None):
+    """Copy the wanted records of an uncompressed FASTA as raw bytes; return how many."""
+    entries = [entry for entry in fasta_index(aln_path, index_path) if entry[0] in wanted]
+
+    with open(aln_path, "rb") as source, open_text(output_path, "wb") as out:
+        for _, offset, length in entries:
+            source.seek(offset)
+            last = b""
+            while length > 0:
+                chunk = source.read(min(length, COPY_BUFFER))
+                if not chunk:
+                    break
+                out.write(chunk)
+                length -= len(chunk)
+                last = chunk
+            if not last.endswith(b"\n"):  # Last record of a file without a final newline
+                out.write(b"\n")
+    return len(entries)
+
+def copy_compressed_records(aln_path, wanted, output_path):
+    """Copy the wanted records of a compressed FASTA as raw (decompressed) bytes; return how many."""
+    kept = 0
+    with fasta_bytes(aln_path) as data, open_text(output_path, "wb") as out:
+        for seq_id, start, _, end in fasta_spans(data):
+            if seq_id in wanted:
+                record = data[start:end]
+                out.write(record if record.endswith(b"\n") else record + b"\n")
+                kept += 1
+    return kept
+
+def write_cached_records(aln_path, wanted, output_path):
+    """Write the wanted records of an alignment cache as FASTA; return how many."""
+    ids, matrix, _ = read_alignment_cache(aln_path)
+    rows = [i for i, seq_id in enumerate(ids) if seq_id in wanted]
+    write_fasta(output_path, [ids[i] for i in rows], (matrix[i] for i in rows))
+    return len(rows)
+
+def filter_alignment(aln_path, wanted, output_path, index_path=None):
+    if is_alignment_cache(aln_path):
+        return write_cached_records(aln_path, wanted, output_path)
+    if is_compressed(aln_path):
+        return copy_compressed_records(aln_path, wanted, output_path)
+    return copy_indexed_records(aln_path, wanted, output_path, index_path)
+
+def filter_gene(task):
+    gene_id, aln_path, wanted, output_path, index_path = task
     try:
-        with open(args.headers_txt) as f:
+        return gene_id, filter_alignment(aln_path, wanted, output_path, index_path), None
+    except Exception as e:
+        return gene_id, 0, str(e)
+
+def read_wanted(headers_txt):
+    try:
+        with open(headers_txt) as f:
             wanted = {line.strip() for line in f if line.strip()}
     except Exception as e:
         print(f"Error reading headers file: {e}", file=sys.stderr)
@@ -55,6 +128,64 @@ def main():
     if not wanted:
         print("Error: no headers found in list", file=sys.stderr)
         sys.exit(1)
+    return wanted
+
+def main_batch(args, wanted, telemetry):
+    os.makedirs(args.output_dir, exist_ok=True)
+    if args.index_dir:
+        os.makedirs(args.index_dir, exist_ok=True)
+
+    suffix = ".fasta.gz" if args.compress else ".fasta"
+    tasks = [(gene_id, path, wanted, os.path.join(args.output_dir, gene_id + suffix),
+              index_path_for(path, args.index_dir))
+             for gene_id, path in list_alignments(args.alignments)]
+
+    with telemetry.phase("write"):
+        if args.workers > 1 and len(tasks) > 1:
+            context = multiprocessing.get_context("fork")
+            with context.Pool(min(args.workers, len(tasks))) as pool:
+                results = pool.map(filter_gene, tasks, chunksize=16)
+        else:
+            results = [filter_gene(task) for task in tasks]
+    telemetry.record(genes=len(tasks), wanted=len(wanted), records_kept=sum(kept for _, kept, _ in results),
+                     workers=args.workers)
+
+    failed = [(gene_id, error) for gene_id, _, error in results if error]
+    for gene_id, error in failed:
+        print(f"Error filtering {gene_id}: {error}", file=sys.stderr)
+    if failed:
+        sys.exit(1)
+
+    print(f"✓ {len(results)} alignments filtered to {len(wanted)} headers in: {args.output_dir}")
+
+def main():
+    p = argparse.ArgumentParser(
+        description="Filter FASTA alignment to only headers in a text list"
+    )
+    p.add_argument("headers_txt", help="Text file with one header per line")
+    p.add_argument("alignment_base", nargs="?", help="Base name or FASTA filename of the alignment")
+    p.add_argument("output_fasta", nargs="?", help="Output FASTA file for filtered records")
+    p.add_argument("--alignments", default=None,
+                   help="Batch mode: directory, file of filenames or manifest of alignments")
+    p.add_argument("--output-dir", default=None, help="Batch mode: directory for the filtered alignments")
+    p.add_argument("--workers", type=int, default=1, help="Batch mode: alignments filtered in parallel (default: 1)")
+    p.add_argument("--compress", action="store_true", help="Batch mode: gzip the filtered alignments")
+    p.add_argument("--index-dir", default=None,
+                   help="Directory to save and reuse the offset indexes in (default: not saved)")
+    args = p.parse_args()
+    telemetry = Telemetry(__file__)
+
+    if args.alignments:
+        if args.alignment_base or args.output_fasta or not args.output_dir:
+            p.error("batch mode takes the header list, --alignments and --output-dir only")
+        main_batch(args, read_wanted(args.headers_txt), telemetry)
+        return
+
+    if not (args.alignment_base and args.output_fasta):
+        p.error("an alignment and an output file are required (or --alignments and --output-dir)")
+
+    # Load header set
+    wanted = read_wanted(args.headers_txt)
 
     # Resolve the alignment path
     aln_path = resolve_fasta_path(args.alignment_base)
@@ -62,21 +193,17 @@ def main():
         print(f"Error: no FASTA file found for '{args.alignment_base}'", file=sys.stderr)
         sys.exit(1)
 
-    # Parse and filter
-    try:
-        records = SeqIO.parse(aln_path, "fasta")
-    except Exception as e:
-        print(f"Error reading alignment: {e}", file=sys.stderr)
-        sys.exit(1)
-
-    filtered = (rec for rec in records if rec.id in wanted)
+    if args.index_dir:
+        os.makedirs(args.index_dir, exist_ok=True)
 
-    # Write output
+    # Filter and write output
     try:
-        SeqIO.write(filtered, args.output_fasta, "fasta")
+        with telemetry.phase("write"):
+            kept = filter_alignment(aln_path, wanted, args.output_fasta, index_path_for(aln_path, args.index_dir))
+        telemetry.record(wanted=len(wanted), records_kept=kept)
     except Exception as e:
-        print(f"Error writing filtered alignment: {e}", file=sys.stderr)
+        print(f"Error filtering alignment: {e}", file=sys.stderr)
         sys.exit(1)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -7,31 +7,57 @@ Description:
     defined as (# polymorphic sites) / (alignment length).
     A polymorphic site is a column with ≥2 distinct non‐gap, non‐N bases.
     Prints "TRUE" if rate ≥ min_rate, else "FALSE".
+    With --metrics-cache the counts are looked up by alignment content hash
+    and only computed (and stored) on a miss.
+    The default engine loads the alignment once as a uint8 matrix and counts
+    distinct bases per column with array operations, also reporting the
+    number of parsimony-informative sites (≥2 bases each seen ≥2 times).
+    With --memory-budget the matrix is memory-mapped and counted in column
+    windows sized to the budget, so memory does not grow with alignment
+    length (see read_alignment_mapped() in core_phylogenies.py).
 
 Input:
-    - One FASTA alignment file containing ≥1 sequence.
+    - One FASTA alignment file (or alignment cache) containing ≥1 sequence.
 
 Output:
     - Writes exactly one line to stdout: "TRUE" or "FALSE".
 
 Key steps:
- 1. Load the alignment via Biopython’s AlignIO.
+ 1. Load the alignment as a uint8 matrix (FASTA or .cpaln alignment cache).
  2. Count polymorphic sites: for each column, strip '-' and 'N'; if ≥2 distinct bases remain, it’s polymorphic.
  3. Compute rate = polymorphic_sites / total_columns.
  4. Print TRUE if rate ≥ min_rate; otherwise FALSE.
 
+Engines:
+    numpy      Per-column base counts over the whole matrix (default)
+    reference  Original column-by-column loop, kept for equality checks
+               (tests/benchmarks/run-benchmarks.py --check)
+
 Usage:
-    python filter_polymorphic_rate_passfail.py <input_fasta> <min_rate>
+    python filter_polymorphic_rate_passfail.py <input_fasta> <min_rate> [--engine numpy|reference] [--metrics-cache DB]
+        [--memory-budget MB]
 
 Example:
     python filter_polymorphic_rate_passfail.py gene1.fasta 0.10
 """
 
 import argparse
-from Bio import AlignIO
+from collections import Counter
+import numpy as np
+from core_phylogenies import (MetricsCache, Telemetry, cached_metric, column_windows, content_hash, matrix_to_records,
+                              read_alignment, read_alignment_mapped)
+
+# Characters that do not count as a base of a column
+IGNORED_CHARS = b"-N"
+
+# Metrics cache entry of count_site_classes()
+METRIC = "polymorphic_sites"
+
+# Temporaries of count_site_classes() per cell of a column window: the window and one base mask
+WINDOW_BYTES_PER_CELL = 2
 
 def compute_polymorphic_rate(alignment):
-    """Return (polymorphic_site_count, total_columns)."""
+    """Return (polymorphic_site_count, total_columns). Reference implementation."""
     length = alignment.get_alignment_length()
     poly = 0
     for i in range(length):
@@ -41,22 +67,87 @@ def compute_polymorphic_rate(alignment):
             poly += 1
     return poly, length
 
+def count_informative_sites(alignment):
+    """Return the parsimony-informative site count. Reference implementation."""
+    informative = 0
+    for i in range(alignment.get_alignment_length()):
+        col = alignment[:, i].upper()
+        counts = Counter(col.replace('-', '').replace('N', ''))
+        if sum(1 for count in counts.values() if count >= 2) >= 2:
+            informative += 1
+    return informative
+
+def count_site_classes(matrix, memory_budget=None):
+    """
+    Return (polymorphic_site_count, informative_site_count, total_columns) of a
+    uint8 alignment matrix.
+
+    For every base present in the matrix (other than '-' and 'N') the number
+    of sequences carrying it is counted per column. A column is polymorphic if
+    ≥2 bases occur in it and parsimony-informative if ≥2 bases occur ≥2 times.
+    Columns are independent, so with `memory_budget` (bytes) the counts are
+    summed over column windows.
+    """
+    _, length = matrix.shape
+    poly = informative = 0
+    for start, stop in column_windows(matrix.shape, memory_budget, WINDOW_BYTES_PER_CELL):
+        window = np.ascontiguousarray(matrix[:, start:stop])
+        present = np.flatnonzero(np.bincount(window.ravel(), minlength=256))
+
+        distinct = np.zeros(stop - start, dtype=np.int32)
+        repeated = np.zeros(stop - start, dtype=np.int32)
+        for base in present:
+            if base in IGNORED_CHARS:
+                continue
+            counts = np.count_nonzero(window == base, axis=0)
+            distinct += counts > 0
+            repeated += counts > 1
+
+        poly += int(np.count_nonzero(distinct >= 2))
+        informative += int(np.count_nonzero(repeated >= 2))
+    return poly, informative, length
+
 def main():
     p = argparse.ArgumentParser(
         description="Print TRUE/FALSE if alignment polymorphic‐site rate passes threshold"
     )
     p.add_argument("input_fasta", help="Input FASTA alignment file")
     p.add_argument("min_rate", type=float, help="Minimum polymorphic‐site rate (0–1)")
+    p.add_argument("--engine", choices=["numpy", "reference"], default="numpy",
+                   help="Site counting implementation (default: numpy)")
+    p.add_argument("--metrics-cache", default=None,
+                   help="SQLite metrics cache to look the metric up in and store it to")
+    p.add_argument("--memory-budget", type=float, default=None,
+                   help="MB for column-window temporaries; the matrix is memory-mapped (default: whole alignment at once)")
     args = p.parse_args()
+    telemetry = Telemetry(__file__)
+    budget = args.memory_budget * 1e6 if args.memory_budget else None
 
     try:
-        aln = AlignIO.read(args.input_fasta, "fasta")
+        with telemetry.phase("parse"):
+            ids, matrix = read_alignment_mapped(args.input_fasta) if budget else read_alignment(args.input_fasta)
     except Exception:
+        telemetry.decide("FALSE")
         print("FALSE")
         return
+    telemetry.record(taxa=matrix.shape[0], sites=matrix.shape[1], engine=args.engine,
+                     memory_budget_mb=args.memory_budget)
 
-    poly, length = compute_polymorphic_rate(aln)
+    informative = None
+    with telemetry.phase("compute"):
+        if args.engine == "numpy":
+            cache = MetricsCache(args.metrics_cache) if args.metrics_cache else None
+            sha256 = content_hash(args.input_fasta, ids, matrix) if cache else None
+            poly, informative, length = cached_metric(cache, sha256, METRIC, "",
+                                                      lambda: count_site_classes(matrix, budget))
+        else:
+            from Bio.Align import MultipleSeqAlignment
+            alignment = MultipleSeqAlignment(matrix_to_records(ids, matrix))
+            poly, length = compute_polymorphic_rate(alignment)
+            informative = count_informative_sites(alignment)
     rate = poly / length if length > 0 else 0.0
+    telemetry.record(polymorphic_sites=poly, informative_sites=informative)
+    telemetry.decide("TRUE" if rate >= args.min_rate else "FALSE")
 
     if rate >= args.min_rate:
         print("TRUE")
@@ -65,8 +156,10 @@ def main():
 
     # Create log
     log_path = args.input_fasta + ".log"
-    with open(log_path, 'w') as log_file:
+    with telemetry.phase("write"), open(log_path, 'w') as log_file:
         log_file.write(f"Polymorphic sites: {poly}\n")
+        if informative is not None:
+            log_file.write(f"Parsimony-informative sites: {informative}\n")
         log_file.write(f"Total columns: {length}\n")
         log_file.write(f"Polymorphic site rate: {rate:.4f}\n")
         log_file.write(f"Minimum required rate: {args.min_rate:.4f}\n")
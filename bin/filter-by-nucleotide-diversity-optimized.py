@@ -7,26 +7,139 @@ Description:
     defined as the average pairwise Hamming distance per site.
     Prints "TRUE" if π ∈ [min_diversity, max_diversity]; otherwise "FALSE".
 
+Engines:
+    counts     π from per-column base counts, linear in the number of taxa (default)
+    pairwise   Explicit loop over all sequence pairs, kept as the reference
+
+    Both give the same π: the mean over sequence pairs of
+    (mismatches / comparable sites), where with gaps ignored a site is only
+    comparable for a pair if neither sequence has a gap there.
+
+    With --metrics-cache, π of the counts engine is looked up by alignment
+    content hash and gap handling, and only computed (and stored) on a miss.
+
+    With --memory-budget the matrix is memory-mapped and the counts engine
+    walks it in column windows sized to the budget, so memory does not grow
+    with alignment length (see read_alignment_mapped() in core_phylogenies.py).
+
+Early decision (--early-decision):
+    Pairs are drawn at random (seeded by --seed) and their π averaged until
+    a confidence bound on the mean lies wholly inside or outside the window
+    (see sequential_decision() in core_phylogenies.py). Near a boundary the
+    selected engine computes π exactly. A cached π is used as is. Estimates
+    are never stored in the metrics cache. The log records the pairs drawn.
+
 Usage:
-    python filter_diversity_passfail.py <input_fasta> <min_diversity> <max_diversity> [--include-gaps]
+    python filter_diversity_passfail.py <input_fasta> <min_diversity> <max_diversity> [--include-gaps] [--engine counts|pairwise] [--metrics-cache DB]
+        [--early-decision] [--seed 119318] [--memory-budget MB]
 """
 
 import argparse
-from Bio import SeqIO
 import numpy as np
 from itertools import combinations
+from core_phylogenies import (MISSING, MetricsCache, Telemetry, cached_metric, column_windows, content_hash,
+                              read_alignment, read_alignment_mapped, sequential_decision, triangle_pairs)
+
+GAP = ord("-")
+
+# Matrix cells (pairs × sites) compared at a time by pair_diversities()
+PAIR_BLOCK_CELLS = 1 << 24
+
+# Temporaries of count_nucleotide_diversity() per cell of a column window: the
+# window and one base mask, plus two float64 class × column arrays (K/m rows each)
+WINDOW_BYTES_PER_CELL = 2
+WINDOW_BYTES_PER_CLASS_CELL = 16
 
-def calculate_nucleotide_diversity(seqs, ignore_gaps):
-    m = len(seqs)
+# Metrics cache entry of count_nucleotide_diversity()
+METRIC = "nucleotide_diversity"
+
+def metric_params(ignore_gaps):
+    return f"ignore_gaps={ignore_gaps}"
+
+def count_nucleotide_diversity(matrix, ignore_gaps, memory_budget=None):
+    """
+    Count-based π of a uint8 alignment matrix, equal to
+    calculate_nucleotide_diversity() without enumerating sequence pairs.
+
+    At one column, the number of mismatching pairs among n sequences is
+    (n² − Σ_b n_b²) / 2, where n_b counts base b. Summed over columns this
+    gives the total mismatches of all pairs at once. When gaps are ignored,
+    every pair is normalised by its own number of comparable sites, which
+    depends only on the two gap patterns. Sequences are therefore grouped
+    into classes of identical gap pattern: all pairs between classes a and b
+    share the comparable length c_ab, so their ratios sum to
+    (mismatches between a and b) / c_ab, and the pairwise mean is recovered
+    exactly from K × K class totals. Cost is O(m·L) plus O(K²·L) for K
+    distinct gap patterns (K = 1 for ungapped alignments or --include-gaps).
+
+    Both class totals are integer sums over columns, so with `memory_budget`
+    (bytes) they are accumulated over column windows with the same result:
+    a first pass refines the gap-pattern classes window by window, a second
+    adds up each window's totals.
+    """
+    m, length = matrix.shape
     if m < 2:
         return None
-    arr = np.array(seqs, dtype='<U1')
+
+    if ignore_gaps:
+        labels = np.zeros(m, dtype=np.int64)
+        for start, stop in column_windows(matrix.shape, memory_budget, WINDOW_BYTES_PER_CELL):
+            packed = np.packbits(matrix[:, start:stop] == GAP, axis=1)
+            _, window_labels = np.unique(packed, axis=0, return_inverse=True)
+            combined = np.stack([labels, window_labels.ravel()], axis=1)
+            _, labels = np.unique(combined, axis=0, return_inverse=True)
+            labels = labels.ravel()
+        sizes = np.bincount(labels)
+        order = np.argsort(labels, kind="stable")
+    else:
+        sizes = np.array([m])
+        order = None
+    starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+
+    # Comparable sites between the gap patterns of every pair of classes, and
+    # Σ over columns and bases of (count in class a) · (count in class b)
+    comp = np.zeros((len(sizes), len(sizes)))
+    matches = np.zeros_like(comp)
+    per_cell = WINDOW_BYTES_PER_CELL + WINDOW_BYTES_PER_CLASS_CELL * len(sizes) / m
+    for start, stop in column_windows(matrix.shape, memory_budget, per_cell):
+        if order is None:
+            window = np.ascontiguousarray(matrix[:, start:stop])
+            comparable = np.ones((1, stop - start))
+        else:
+            window = matrix[order, start:stop]
+            comparable = (window[starts] != GAP).astype(np.float64)
+        comp += comparable @ comparable.T
+
+        present = np.flatnonzero(np.bincount(window.ravel(), minlength=256))
+        for base in present:
+            if ignore_gaps and base == GAP:
+                continue
+            counts = np.add.reduceat(window == base, starts, axis=0, dtype=np.float64)
+            matches += counts @ counts.T
+
+    sizes = sizes.astype(np.float64)
+    within = np.diag((sizes ** 2 * np.diag(comp) - np.diag(matches)) / 2)
+    mismatches = np.outer(sizes, sizes) * comp - matches
+    mismatches = np.triu(mismatches, k=1) + within
+    pairs = np.triu(np.outer(sizes, sizes), k=1) + np.diag(sizes * (sizes - 1) / 2)
+
+    valid = (comp > 0) & (pairs > 0)
+    if not valid.any():
+        return 0.0
+    return float((mismatches[valid] / comp[valid]).sum() / pairs[valid].sum())
+
+def calculate_nucleotide_diversity(matrix, ignore_gaps):
+    """Pairwise reference for count_nucleotide_diversity(), on the same uint8 matrix."""
+    m = len(matrix)
+    if m < 2:
+        return None
+    arr = np.asarray(matrix, dtype=np.uint8)
     _, L = arr.shape
     pair_divs = []
     for i, j in combinations(range(m), 2):
         a, b = arr[i], arr[j]
         if ignore_gaps:
-            mask = (a != '-') & (b != '-')
+            mask = (a != GAP) & (b != GAP)
             comp = int(mask.sum())
             if comp == 0:
                 continue
@@ -37,6 +150,40 @@ def calculate_nucleotide_diversity(seqs, ignore_gaps):
         pair_divs.append(mismatches / comp)
     return float(np.mean(pair_divs)) if pair_divs else 0.0
 
+def pair_diversities(matrix, first, second, ignore_gaps):
+    """
+    π of the pairs (first[k], second[k]) of a uint8 alignment matrix, as in
+    calculate_nucleotide_diversity(); pairs without comparable sites are left out.
+    """
+    length = matrix.shape[1]
+    block = max(PAIR_BLOCK_CELLS // max(length, 1), 1)
+    values = []
+    for start in range(0, len(first), block):
+        a, b = matrix[first[start:start + block]], matrix[second[start:start + block]]
+        differ = a != b
+        if ignore_gaps:
+            mask = (a != GAP) & (b != GAP)
+            comparable = mask.sum(axis=1)
+            mismatches = (differ & mask).sum(axis=1)
+        else:
+            comparable = np.full(len(a), length)
+            mismatches = differ.sum(axis=1)
+        keep = comparable > 0
+        values.append(mismatches[keep] / comparable[keep])
+    return np.concatenate(values) if values else np.empty(0)
+
+def early_nucleotide_diversity(matrix, low, high, ignore_gaps, seed=119318):
+    """sequential_decision() on the π of randomly drawn sequence pairs: (decision, estimate, pairs drawn)."""
+    m = len(matrix)
+    if m < 2:
+        return None, None, 0
+
+    def values(k):
+        first, second = triangle_pairs(k, m)
+        return pair_diversities(matrix, first, second, ignore_gaps)
+
+    return sequential_decision(values, m * (m - 1) // 2, low, high, 1.0, seed)  # π of a pair lies in [0, 1]
+
 def main():
     p = argparse.ArgumentParser(
         description="Print TRUE/FALSE if alignment nucleotide diversity (π) passes threshold"
@@ -46,24 +193,63 @@ def main():
     p.add_argument("max_diversity", type=float, help="Maximum π (inclusive)")
     p.add_argument("--include-gaps", action="store_true",
                    help="Include gaps in diversity calculation")
+    p.add_argument("--engine", choices=["counts", "pairwise"], default="counts",
+                   help="π implementation (default: counts)")
+    p.add_argument("--metrics-cache", default=None,
+                   help="SQLite metrics cache to look the metric up in and store it to")
+    p.add_argument("--early-decision", action="store_true",
+                   help="Decide from randomly drawn pairs once the answer is clear, computing π exactly only near a boundary")
+    p.add_argument("--seed", type=int, default=119318, help="Seed of the pair sampling (default: 119318)")
+    p.add_argument("--memory-budget", type=float, default=None,
+                   help="MB for column-window temporaries; the matrix is memory-mapped (default: whole alignment at once)")
     args = p.parse_args()
+    telemetry = Telemetry(__file__)
+    budget = args.memory_budget * 1e6 if args.memory_budget else None
 
     try:
-        seqs = [list(str(rec.seq).upper()) for rec in SeqIO.parse(args.input_fasta, "fasta")]
+        with telemetry.phase("parse"):
+            ids, matrix = read_alignment_mapped(args.input_fasta) if budget else read_alignment(args.input_fasta)
     except Exception:
+        telemetry.decide("FALSE")
         print("FALSE")
         return
+    taxa, sites = matrix.shape
+    pairs = taxa * (taxa - 1) // 2
+    telemetry.record(taxa=taxa, sites=sites, pairs=pairs, engine=args.engine, memory_budget_mb=args.memory_budget)
 
-    pi = calculate_nucleotide_diversity(seqs, ignore_gaps=not args.include_gaps)
-    within_range:bool = pi is not None and args.min_diversity <= pi <= args.max_diversity
+    ignore_gaps = not args.include_gaps
+    decision, drawn = None, None
+    with telemetry.phase("compute"):
+        cache = MetricsCache(args.metrics_cache) if args.metrics_cache and args.engine == "counts" else None
+        sha256 = content_hash(args.input_fasta, ids, matrix) if cache else None
+        if args.early_decision and (cache is None or cache.get(sha256, METRIC, metric_params(ignore_gaps)) is MISSING):
+            decision, pi, drawn = early_nucleotide_diversity(matrix, args.min_diversity, args.max_diversity,
+                                                             ignore_gaps, args.seed)
+        if decision is None:
+            if args.engine == "counts":
+                pi = cached_metric(cache, sha256, METRIC, metric_params(ignore_gaps),
+                                   lambda: count_nucleotide_diversity(matrix, ignore_gaps, budget))
+            else:
+                pi = calculate_nucleotide_diversity(matrix, ignore_gaps=ignore_gaps)
+    if decision is None:
+        within_range:bool = pi is not None and args.min_diversity <= pi <= args.max_diversity
+    else:
+        within_range = decision
+    telemetry.record(nucleotide_diversity=pi)
+    if args.early_decision:
+        telemetry.record(pairs_drawn=drawn or 0, early_decision=decision is not None)
+    telemetry.decide("TRUE" if within_range else "FALSE")
     if within_range:
         print("TRUE")
     else:
         print("FALSE")
 
     log_path = args.input_fasta + ".log"
-    with open(log_path, 'w') as log_file:
-        log_file.write(f"π: {pi}\n")
+    with telemetry.phase("write"), open(log_path, 'w') as log_file:
+        log_file.write(f"π: {pi}" + (" (estimate)" if decision is not None else "") + "\n")
+        if args.early_decision:
+            log_file.write(f"Pairs drawn: {drawn or 0} of {pairs}, "
+                           + ("early decision\n" if decision is not None else "then exact π\n"))
         log_file.write(f"Min: {args.min_diversity}, Max: {args.max_diversity}\n")
         log_file.write("Result: " + ("TRUE" if within_range else "FALSE") + "\n")
 
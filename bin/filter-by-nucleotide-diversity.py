@@ -57,6 +57,7 @@ from Bio.SeqRecord import SeqRecord
 import argparse
 import numpy as np
 from scipy.spatial.distance import hamming
+from core_phylogenies import Telemetry, open_text, read_records, read_sequences
 
 def hamming_distance(seq1, seq2, ignore_gaps=True):
     """
@@ -106,15 +107,15 @@ def calculate_nucleotide_diversity(alignment_file, ignore_gaps=True):
         float: Nucleotide diversity (0 to 1)
     """
     try:
-        # Read sequences from FASTA file
-        sequences = list(SeqIO.parse(alignment_file, "fasta"))
+        # Read sequences from FASTA file (or alignment cache)
+        _, sequences = read_sequences(alignment_file)
         
         if len(sequences) < 2:
             print(f"Warning: {alignment_file} has fewer than 2 sequences. Skipping.")
             return None
         
         # Get sequence strings and convert to uppercase for consistency
-        seq_strings = [str(seq.seq).upper() for seq in sequences]
+        seq_strings = [seq.decode("ascii") for seq in sequences]
         
         # Check if all sequences have the same length
         seq_length = len(seq_strings[0])
@@ -192,7 +193,8 @@ def calculate_nucleotide_diversity(alignment_file, ignore_gaps=True):
         print(f"Error processing {alignment_file}: {e}")
         return None
 
-def filter_by_nucleotide_diversity(input_folder, output_folder, min_diversity, max_diversity, ignore_gaps=True):
+def filter_by_nucleotide_diversity(input_folder, output_folder, min_diversity, max_diversity, ignore_gaps=True,
+                                   telemetry=None):
     """
     Filter gene alignments based on nucleotide diversity.
     
@@ -202,7 +204,9 @@ def filter_by_nucleotide_diversity(input_folder, output_folder, min_diversity, m
         min_diversity: Minimum nucleotide diversity (inclusive)
         max_diversity: Maximum nucleotide diversity (inclusive)
         ignore_gaps: If True, ignore gap positions in diversity calculation
+        telemetry: Telemetry record to time the steps in (parsing is part of "compute")
     """
+    telemetry = telemetry or Telemetry(__file__)
     # Convert to Path objects
     input_path = Path(input_folder)
     output_path = Path(output_folder)
@@ -213,6 +217,7 @@ def filter_by_nucleotide_diversity(input_folder, output_folder, min_diversity, m
     # Get all FASTA files from input folder (including subdirectories)
     input_files = []
     fasta_extensions = ['*.fasta', '*.fa', '*.fas', '*.fna', '*.ffn']
+    fasta_extensions += [f"{ext}.gz" for ext in fasta_extensions]  # gzip/bgzip-compressed
     
     for ext in fasta_extensions:
         input_files.extend(input_path.glob(ext))
@@ -239,7 +244,8 @@ def filter_by_nucleotide_diversity(input_folder, output_folder, min_diversity, m
         print(f"Processing: {input_file.name}")
         
         # Calculate nucleotide diversity
-        diversity = calculate_nucleotide_diversity(input_file, ignore_gaps=ignore_gaps)
+        with telemetry.phase("compute"):
+            diversity = calculate_nucleotide_diversity(input_file, ignore_gaps=ignore_gaps)
         
         if diversity is None:
             continue
@@ -256,9 +262,11 @@ def filter_by_nucleotide_diversity(input_folder, output_folder, min_diversity, m
             # Create subdirectories if needed
             output_file.parent.mkdir(parents=True, exist_ok=True)
             
-            # Read and write sequences
-            sequences = list(SeqIO.parse(input_file, "fasta"))
-            SeqIO.write(sequences, output_file, "fasta")
+            # Read and write sequences (compressed again if the input was .gz)
+            with telemetry.phase("write"):
+                sequences = read_records(input_file)
+                with open_text(output_file, "w") as handle:
+                    SeqIO.write(sequences, handle, "fasta")
             
             print(f"  ✓ Kept (diversity within range)")
             filtered_count += 1
@@ -266,6 +274,8 @@ def filter_by_nucleotide_diversity(input_folder, output_folder, min_diversity, m
             print(f"  ✗ Filtered out (diversity outside range)")
     
     removed_count = total_count - filtered_count
+    telemetry.record(files=total_count, files_kept=filtered_count)
+    telemetry.decide(f"{filtered_count}/{total_count} kept")
     
     print("\n" + "=" * 60)
     print("RESULTS SUMMARY:")
@@ -314,6 +324,7 @@ Examples:
                        help="Include gap positions in diversity calculation (default: ignore gaps)")
     
     args = parser.parse_args()
+    telemetry = Telemetry(__file__)
     
     # Set ignore_gaps based on command line argument
     ignore_gaps = not args.include_gaps
@@ -346,7 +357,8 @@ Examples:
         args.output_folder, 
         args.min_diversity, 
         args.max_diversity,
-        ignore_gaps
+        ignore_gaps,
+        telemetry
     )
 
 if __name__ == "__main__":
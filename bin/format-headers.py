@@ -1,25 +1,36 @@
 #!/usr/bin/env python3
 
 import os, sys, re
+import argparse
+import multiprocessing
+from pathlib import Path
+from core_phylogenies import (CACHE_SUFFIX, Telemetry, list_alignments, open_text, read_alignment,
+                              split_path_id, strip_compression, write_alignment_cache)
 
-def main():
-    # Alignment to format
-    fasta_path = f"{sys.argv[1]}"
+# Headers are trimmed at the first '-' or '_'
+HEADER_SPLIT = re.compile("[-_]")
+
+# Write buffer of each formatted alignment
+WRITE_BUFFER = 1 << 20
+
+
+def format_headers(fasta_path, output_file):
+    """Stream `fasta_path` into `output_file`, trimming every header line."""
+
+    # Open the FASTA to read (gzip/BGZF or plain) and the new FASTA to write (gzip if it ends in .gz)
+    if strip_compression(output_file) != output_file:
+        output = open_text(output_file, "w")
+    else:
+        output = open(output_file, "w", buffering=WRITE_BUFFER)
 
-    # Formatted alignment
-    output_path = "./formatted-alignments"
-    if not os.path.exists(output_path):
-        os.mkdir("./formatted-alignments")
-    
-    # Open the FASTA to read and the new FASTA to write
-    with open(f"{fasta_path}", "r") as input, open(f"{output_path}/{fasta_path}", "w+") as output:
+    with open_text(fasta_path) as input, output:
 
         # For each line
-        for line in input.readlines():
+        for line in input:
 
             # If header
             if line[0] == ">":
-                output_line = re.split("[-_]", line)[0]
+                output_line = HEADER_SPLIT.split(line, 1)[0]
 
                 # Add a newline if there's no newline at the end
                 output.write(f"{output_line}\n" if output_line[-1] != "\n" else output_line)
@@ -29,4 +40,80 @@ def main():
                 output.write(line)
 
 
-main()
\ No newline at end of file
+def format_alignment(task):
+    """
+    Format one (gene_id, fasta_path, output_dir, cache_dir, compress) task and
+    return (gene_id, path of the file later steps should read).
+    """
+    gene_id, fasta_path, output_dir, cache_dir, compress = task
+    name = strip_compression(Path(fasta_path).name)
+    output_file = f"{output_dir}/{name}{'.gz' if compress else ''}"
+    format_headers(fasta_path, output_file)
+
+    # Alignment cache of the formatted alignment, read by the later steps instead of the FASTA
+    if cache_dir:
+        cache_file = f"{cache_dir}/{Path(name).stem}{CACHE_SUFFIX}"
+        try:
+            ids, matrix = read_alignment(output_file)
+            write_alignment_cache(cache_file, ids, matrix)
+        except (ValueError, OSError) as error:
+            # Not a valid alignment (e.g. ragged or empty): later steps get the FASTA and fail on this gene alone
+            print(f"Warning: no alignment cache for '{fasta_path}': {error}", file=sys.stderr)
+        else:
+            output_file = cache_file
+
+    return gene_id, output_file
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Trim FASTA headers at the first '-' or '_'"
+    )
+    parser.add_argument("fasta_paths", nargs="*", help="Alignments to format")
+    parser.add_argument("--fofn", default=None,
+                        help="Directory of alignments or file-of-filenames (optionally `<id><TAB><path>`) to format as well")
+    parser.add_argument("--output-dir", default="./formatted-alignments",
+                        help="Directory for the formatted alignments (default: ./formatted-alignments)")
+    parser.add_argument("--cache", metavar="DIR", default=None,
+                        help="Also write the formatted alignment as a .cpaln alignment cache into DIR")
+    parser.add_argument("--compress", action="store_true",
+                        help="Write gzip-compressed formatted alignments (<name>.gz)")
+    parser.add_argument("--manifest", default=None,
+                        help="Write `<id><TAB><absolute path>` of every formatted alignment (the cache, with --cache)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Alignments formatted in parallel (default: 1)")
+    args = parser.parse_args()
+    telemetry = Telemetry(__file__)
+
+    # Alignments to format, with the gene ID used by PREPARE_ID
+    genes = [(split_path_id(path), path) for path in args.fasta_paths]
+    if args.fofn:
+        genes += [(gene_id, str(path)) for gene_id, path in list_alignments(args.fofn)]
+
+    if not genes:
+        parser.error("no alignments to format")
+
+    # Formatted alignments
+    os.makedirs(args.output_dir, exist_ok=True)
+    if args.cache:
+        os.makedirs(args.cache, exist_ok=True)
+
+    tasks = [(gene_id, path, args.output_dir, args.cache, args.compress) for gene_id, path in genes]
+
+    # Formatting streams every alignment from input to output, so it is timed as "write"
+    with telemetry.phase("write"):
+        if args.workers > 1 and len(tasks) > 1:
+            context = multiprocessing.get_context("fork")
+            with context.Pool(min(args.workers, len(tasks))) as pool:
+                formatted = pool.map(format_alignment, tasks, chunksize=1)
+        else:
+            formatted = [format_alignment(task) for task in tasks]
+    telemetry.record(genes=len(tasks), workers=args.workers, cache=bool(args.cache), compress=args.compress)
+
+    if args.manifest:
+        with open(args.manifest, "w") as manifest:
+            for gene_id, path in formatted:
+                manifest.write(f"{gene_id}\t{Path(path).absolute()}\n")
+
+
+main()
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Program: Distance-Based Phylogeny (NJ / BIONJ)
+----------------------------------------------
+Description:
+    Builds a phylogeny of a (concatenated) alignment without an external
+    program, for quick screening of many gene subsets:
+      - Pairwise distances are counted for all pairs at once with matrix
+        products of per-base indicator matrices (A, C, G, T), over blocks of
+        columns: sites where both sequences have a base, identical sites and
+        transitions. Gaps, N and other IUPAC codes are left out pairwise.
+      - p-distance, or corrected for multiple hits with JC69 or K2P. Pairs
+        without a defined distance (no shared sites, or saturated under the
+        correction) get MAX_DISTANCE.
+      - Neighbor joining (Saitou & Nei 1987) or BIONJ (Gascuel 1997) on a
+        distance matrix (and, for BIONJ, a variance matrix) that shrinks by
+        one row per join: O(n²) memory, O(n³) time.
+      - With --bootstraps N, columns are resampled N times as column weights
+        (the alignment is not copied) and every internal branch is labelled
+        with the percentage of replicate trees that contain its split.
+      - With --site-weights (e.g. the weights of a pattern alignment written
+        by concatenate-alignments.py --patterns), every column counts as
+        many times as its weight: a pattern alignment gives the same tree as
+        the full alignment, and its bootstrap replicates are drawn from the
+        same distribution.
+
+Output:
+    An unrooted Newick tree with branch lengths (negative lengths are set to
+    0) and, with bootstraps, support values.
+
+Usage:
+    python make-nj-tree.py <alignment> <output.tre> [--distance p|jc69|k2p] [--algorithm nj|bionj]
+        [--bootstraps N] [--seed 119318] [--site-weights weights.txt]
+"""
+
+import argparse
+import sys
+import numpy as np
+from core_phylogenies import Telemetry, read_alignment, read_site_weights
+
+A, C, G, T = (ord(base) for base in "ACGT")
+
+# Substitutions per site given to pairs without a defined distance
+MAX_DISTANCE = 10.0
+
+# Matrix cells (taxa × columns) of one block of indicator matrices
+BLOCK_CELLS = 1 << 22
+
+# Characters that must be quoted in Newick labels
+NEWICK_SPECIAL = set(" \t()[]:;,'")
+
+def pair_counts(matrix, weights=None):
+    """
+    Return (compared, identical, transitions) taxa × taxa matrices: the
+    (weighted) number of columns where both sequences have a base, where
+    they have the same base, and where they differ by a transition.
+    """
+    taxa, sites = matrix.shape
+    compared = np.zeros((taxa, taxa))
+    identical = np.zeros((taxa, taxa))
+    transitions = np.zeros((taxa, taxa))
+    block = max(BLOCK_CELLS // max(taxa, 1), 1)
+
+    for start in range(0, sites, block):
+        chunk = matrix[:, start:start + block]
+        base = {code: (chunk == code).astype(np.float32) for code in (A, C, G, T)}
+        if weights is None:
+            weighted = base
+        else:
+            w = weights[start:start + block].astype(np.float32)
+            weighted = {code: indicator * w for code, indicator in base.items()}
+
+        compared += sum(weighted.values()) @ sum(base.values()).T
+        identical += sum(weighted[code] @ base[code].T for code in (A, C, G, T))
+        # A↔G and C↔T in one direction; the other direction is the transpose
+        half = weighted[A] @ base[G].T + weighted[C] @ base[T].T
+        transitions += half + half.T
+    return compared, identical, transitions
+
+def pair_distances(compared, identical, transitions, model="jc69"):
+    """Distance matrix of pair counts under `model` ('p', 'jc69' or 'k2p')."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        p = (compared - identical) / compared
+        if model == "p":
+            distances = p
+        elif model == "jc69":
+            distances = -0.75 * np.log(1 - 4 / 3 * p)
+        else:
+            P = transitions / compared
+            Q = p - P
+            distances = -0.5 * np.log(1 - 2 * P - Q) - 0.25 * np.log(1 - 2 * Q)
+    distances = np.where(np.isfinite(distances), np.maximum(distances, 0.0), MAX_DISTANCE)
+    np.fill_diagonal(distances, 0.0)
+    return distances
+
+def merge_rows(M, m, i, j, new):
+    """In the m × m block of M, put `new` in row/column i and move row/column m-1 to j."""
+    M[i, :m] = new
+    M[:m, i] = new
+    M[i, i] = 0.0
+    M[j, :m] = M[m - 1, :m]
+    M[:m, j] = M[:m, m - 1]
+    M[j, j] = 0.0
+
+def join_neighbors(distances, bionj=True):
+    """
+    NJ or BIONJ tree of a distance matrix. Returns the children of every
+    internal node as [(child, branch length), ...]: leaves are 0 … n-1,
+    internal node k is n + k, and children always come before their parent,
+    so the last node is the (trifurcating) root.
+    """
+    n = len(distances)
+    D = np.array(distances, dtype=np.float64)
+    V = D.copy() if bionj else None
+    nodes = list(range(n))  # Tree node at each row of the working matrices
+    children = []
+
+    m = n
+    while m > 3:
+        Dm = D[:m, :m]
+        r = Dm.sum(axis=1)
+        Q = (m - 2) * Dm - r[:, None] - r[None, :]
+        np.fill_diagonal(Q, np.inf)
+        i, j = divmod(int(np.argmin(Q)), m)
+        i, j = min(i, j), max(i, j)
+
+        dij = Dm[i, j]
+        bi = 0.5 * dij + (r[i] - r[j]) / (2 * (m - 2))
+        bj = dij - bi
+
+        lam = 0.5
+        if bionj:
+            Vm = V[:m, :m]
+            vij = Vm[i, j]
+            if vij > 0:
+                s = Vm.sum(axis=1)
+                lam = min(max(0.5 + (s[j] - s[i]) / (2 * (m - 2) * vij), 0.0), 1.0)
+            new_v = lam * Vm[i] + (1 - lam) * Vm[j] - lam * (1 - lam) * vij
+        new_d = lam * (Dm[i] - bi) + (1 - lam) * (Dm[j] - bj)
+
+        children.append([(nodes[i], max(bi, 0.0)), (nodes[j], max(bj, 0.0))])
+        nodes[i] = n + len(children) - 1
+
+        merge_rows(D, m, i, j, new_d)
+        if bionj:
+            merge_rows(V, m, i, j, new_v)
+        nodes[j] = nodes[m - 1]
+        nodes.pop()
+        m -= 1
+
+    if m == 3:
+        (a, b, c), Dm = nodes, D[:3, :3]
+        lengths = [(Dm[0, 1] + Dm[0, 2] - Dm[1, 2]) / 2,
+                   (Dm[0, 1] + Dm[1, 2] - Dm[0, 2]) / 2,
+                   (Dm[0, 2] + Dm[1, 2] - Dm[0, 1]) / 2]
+        children.append([(node, max(length, 0.0)) for node, length in zip((a, b, c), lengths)])
+    else:
+        half = D[0, 1] / 2 if m == 2 else 0.0
+        children.append([(node, half) for node in nodes])
+    return children
+
+def tree_splits(children, n):
+    """{split bitmask: internal node} of the non-root internal nodes, as sets of leaves without leaf 0."""
+    full = (1 << n) - 1
+    masks = [1 << leaf for leaf in range(n)]
+    splits = {}
+    for k, kids in enumerate(children):
+        mask = 0
+        for child, _ in kids:
+            mask |= masks[child]
+        masks.append(mask)
+        if k < len(children) - 1:
+            splits[mask ^ full if mask & 1 else mask] = n + k
+    return splits
+
+def newick_label(label):
+    if any(char in NEWICK_SPECIAL for char in label):
+        return "'" + label.replace("'", "''") + "'"
+    return label
+
+def to_newick(children, labels, support=None):
+    """Newick string of a join_neighbors() tree; `support` maps internal nodes to their labels."""
+    n = len(labels)
+    text = [newick_label(label) for label in labels]
+    for k, kids in enumerate(children):
+        inner = ",".join(f"{text[child]}:{length:.6g}" for child, length in kids)
+        for child, _ in kids:
+            text[child] = None
+        text.append(f"({inner}){(support or {}).get(n + k, '')}")
+    return text[-1] + ";"
+
+def build_tree(matrix, model, bionj, weights=None):
+    compared, identical, transitions = pair_counts(matrix, weights)
+    return join_neighbors(pair_distances(compared, identical, transitions, model), bionj)
+
+def bootstrap_support(matrix, children, model, bionj, replicates, seed, site_weights=None):
+    """
+    {internal node: percentage of `replicates` column-resampled trees
+    containing its split}. Columns are drawn in proportion to `site_weights`.
+    """
+    taxa, sites = matrix.shape
+    if site_weights is None:
+        site_weights = np.ones(sites, dtype=np.int64)
+    total = int(site_weights.sum())
+    splits = tree_splits(children, taxa)
+    found = dict.fromkeys(splits, 0)
+    rng = np.random.default_rng(seed)
+    for _ in range(replicates):
+        weights = rng.multinomial(total, site_weights / total)
+        for split in tree_splits(build_tree(matrix, model, bionj, weights), taxa):
+            if split in found:
+                found[split] += 1
+    return {node: f"{100 * found[split] / replicates:.0f}" for split, node in splits.items()}
+
+def main():
+    p = argparse.ArgumentParser(description="Neighbor-joining (NJ / BIONJ) phylogeny of an alignment")
+    p.add_argument("alignment", help="Alignment (FASTA, optionally gzipped, or .cpaln alignment cache)")
+    p.add_argument("output_tree", help="Output Newick tree")
+    p.add_argument("--distance", choices=["p", "jc69", "k2p"], default="jc69",
+                   help="Pairwise distance (default: jc69)")
+    p.add_argument("--algorithm", choices=["nj", "bionj"], default="bionj",
+                   help="Tree building algorithm (default: bionj)")
+    p.add_argument("--bootstraps", type=int, default=0,
+                   help="Bootstrap replicates for branch support (default: 0, no support values)")
+    p.add_argument("--seed", type=int, default=119318, help="Seed of the bootstrap resampling (default: 119318)")
+    p.add_argument("--site-weights", default=None,
+                   help="Column weights of the alignment, whitespace-separated (e.g. of a pattern alignment)")
+    args = p.parse_args()
+    telemetry = Telemetry(__file__)
+
+    try:
+        with telemetry.phase("parse"):
+            ids, matrix = read_alignment(args.alignment)
+    except Exception as e:
+        print(f"Error reading alignment '{args.alignment}': {e}", file=sys.stderr)
+        sys.exit(1)
+    if len(ids) < 2:
+        print(f"Error: '{args.alignment}' has fewer than 2 sequences", file=sys.stderr)
+        sys.exit(1)
+
+    weights = read_site_weights(args.site_weights) if args.site_weights else None
+    if weights is not None and (len(weights) != matrix.shape[1] or (weights < 0).any()):
+        print(f"Error: '{args.site_weights}' needs one non-negative weight per column ({matrix.shape[1]})",
+              file=sys.stderr)
+        sys.exit(1)
+    telemetry.record(taxa=len(ids), sites=matrix.shape[1], distance=args.distance, algorithm=args.algorithm,
+                     bootstraps=args.bootstraps)
+
+    bionj = args.algorithm == "bionj"
+    with telemetry.phase("compute"):
+        children = build_tree(matrix, args.distance, bionj, weights)
+        support = None
+        if args.bootstraps > 0 and matrix.shape[1] > 0 and (weights is None or weights.sum() > 0):
+            support = bootstrap_support(matrix, children, args.distance, bionj, args.bootstraps, args.seed, weights)
+
+    with telemetry.phase("write"), open(args.output_tree, "w") as handle:
+        handle.write(to_newick(children, ids, support) + "\n")
+
+    print(f"✓ {args.algorithm.upper()} tree of {len(ids)} sequences written to: {args.output_tree}")
+
+if __name__ == "__main__":
+    main()
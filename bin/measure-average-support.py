@@ -1,38 +1,217 @@
 #!/usr/bin/env python3
+"""
+Program #5: Measure Average Branch Support
+------------------------------------------
+Description:
+- Reads the support values of a Newick tree (the internal node labels, i.e.
+  the numbers right after ')') and writes their average to a .txt file.
 
+Summary mode (--table):
+- Streams one or more (optionally gzip-compressed) Newick files tree by tree,
+  so files with thousands of trees (bootstrap sets, TBE-annotated trees) are
+  never held in memory at once. A ';' inside a quoted label or a [comment]
+  does not end a tree.
+- Node labels are parsed as numbers, including decimals (TBE) and scientific
+  notation. Branch lengths (after ':') and [comments] are never read as
+  support; for labels like '95/100' (SH-aLRT/UFBoot) the first value is used.
+- Reports per-tree and per-file (all trees pooled) statistics: number of
+  supported nodes, mean, median and the fraction of nodes at or above each
+  threshold. Thresholds are percentages; values of a file whose supports are
+  all ≤ 1 are read as proportions (TBE), unless --scale says otherwise.
+
+Usage:
+    python measure-average-support.py <input_file.tre> <output_file.txt>
+    python measure-average-support.py --table support-summary.tsv [--per-tree support-per-tree.tsv]
+        [--thresholds 70,95] [--scale auto|percent|proportion] tree_1.tre ... tree_N.tre
+"""
+
+import argparse
 import re
+import statistics
 import sys
+from array import array
+from core_phylogenies import Telemetry, open_text
+
+# Characters read from a tree file at a time
+CHUNK_SIZE = 1 << 20
+
+# Internal node label: a quoted label, or everything after ')' up to the branch length or the next node
+NODE_LABEL = re.compile(r"\)('(?:[^']|'')*'|[^:,;()\[\]']+)")
+# A [comment], or a quoted label (group 1), which is kept even if it contains brackets
+COMMENT = re.compile(r"('(?:[^']|'')*')|\[[^\]]*\]")
+# Characters that end a tree or open/close a quoted label or a comment
+TREE_TOKEN = re.compile(r"[;'\[\]]")
+
+def iter_trees(path):
+    """
+    Yield the Newick strings of a (multi-)tree file one by one, reading it in
+    chunks. A ';' inside a quoted label or a [comment] does not end a tree.
+    """
+    with open_text(path) as handle:
+        pending = []  # Pieces of the current tree, which may span chunks
+        quoted = comment = False
+        while True:
+            chunk = handle.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            start = 0
+            for match in TREE_TOKEN.finditer(chunk):
+                char = match.group()
+                if comment:
+                    comment = char != "]"
+                elif quoted:
+                    quoted = char != "'"  # An escaped quote ('') closes and reopens the label
+                elif char == "'":
+                    quoted = True
+                elif char == "[":
+                    comment = True
+                elif char == ";":
+                    pending.append(chunk[start:match.end()])
+                    start = match.end()
+                    tree = "".join(pending)
+                    pending = []
+                    if tree[:-1].strip():
+                        yield tree
+            pending.append(chunk[start:])
+        tree = "".join(pending)
+        if tree.strip():
+            yield tree
+
+def parse_support(label):
+    """Support value of a node label, or None if the label is not numeric."""
+    label = label.strip().strip("'\"").split("/")[0]
+    try:
+        return float(label)
+    except ValueError:
+        return None
 
 def extract_bootstrap_values(newick_text):
-    # Find numbers that appear right after ')'
-    bootstrap_values = re.findall(r'\)(\d+(?:\.\d+)?)', newick_text)
-    return [float(value) for value in bootstrap_values]
+    """Support values of every internal node of a Newick string (any number of trees)."""
+    uncommented = COMMENT.sub(lambda match: match.group(1) or "", newick_text)
+    values = (parse_support(label) for label in NODE_LABEL.findall(uncommented))
+    return [value for value in values if value is not None]
 
 def compute_average(values):
     return sum(values) / len(values) if values else 0.0
 
+def summarize(values, thresholds, factor):
+    """[count, mean, median, fraction ≥ each threshold] of one set of support values."""
+    if not values:
+        return [0, "NA", "NA"] + ["NA"] * len(thresholds)
+    summary = [len(values), f"{statistics.fmean(values):.4f}", f"{statistics.median(values):.4f}"]
+    for threshold in thresholds:
+        passed = sum(1 for value in values if value * factor >= threshold)
+        summary.append(f"{passed / len(values):.4f}")
+    return summary
+
+def scale_factor(values, scale):
+    """Multiplier bringing support values to percentages."""
+    if scale == "proportion" or (scale == "auto" and values and max(values) <= 1.0):
+        return 100.0
+    return 1.0
+
+def parse_thresholds(value):
+    return [float(v) for v in value.split(",") if v.strip()]
+
+def write_summaries(tree_paths, table_path, per_tree_path, thresholds, scale):
+    """Write the summary tables; return (trees, supported nodes) read in total."""
+    total_trees = total_nodes = 0
+    threshold_columns = [f"fraction_ge_{threshold:g}" for threshold in thresholds]
+    per_tree = open(per_tree_path, "w") if per_tree_path else None
+    if per_tree:
+        per_tree.write("\t".join(["file", "tree", "nodes", "mean", "median"] + threshold_columns) + "\n")
+
+    with open(table_path, "w") as table:
+        table.write("\t".join(["file", "trees", "scale", "nodes", "mean", "median"] + threshold_columns) + "\n")
+        for path in tree_paths:
+            pooled = array("d")
+            trees = []  # Per-tree values are only kept (as compact arrays) when they are written out
+            count = 0
+            for tree in iter_trees(path):
+                values = array("d", extract_bootstrap_values(tree))
+                pooled.extend(values)
+                if per_tree:
+                    trees.append(values)
+                count += 1
+
+            factor = scale_factor(pooled, scale)
+            for index, values in enumerate(trees, start=1):
+                row = [path, index] + summarize(values, thresholds, factor)
+                per_tree.write("\t".join(str(value) for value in row) + "\n")
+
+            row = [path, count, "proportion" if factor != 1.0 else "percent"] + summarize(pooled, thresholds, factor)
+            table.write("\t".join(str(value) for value in row) + "\n")
+            total_trees += count
+            total_nodes += len(pooled)
+
+    if per_tree:
+        per_tree.close()
+    return total_trees, total_nodes
+
 def main():
-    if len(sys.argv) != 3:
-        print("Usage: python program5.py <input_file.tre> <output_file.txt>")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(
+        description="Average support of a Newick tree, or per-tree and per-file support statistics "
+                    "of one or more (multi-)tree Newick files",
+        usage="%(prog)s input output | %(prog)s --table TABLE [options] tree [tree ...]"
+    )
+    parser.add_argument("trees", nargs="+",
+                        help="Newick files, one or more trees each (optionally gzipped); "
+                             "without summary options: input output")
+    parser.add_argument("--table", default=None, help="Output TSV with one row per file")
+    parser.add_argument("--per-tree", default=None, help="Output TSV with one row per tree")
+    parser.add_argument("--thresholds", type=parse_thresholds, default=None,
+                        help="Comma-separated support thresholds, in percent (default: 70,95)")
+    parser.add_argument("--scale", choices=["auto", "percent", "proportion"], default=None,
+                        help="Whether supports are percentages or proportions (default: auto, per file)")
+    args = parser.parse_args()
 
-    input_file = sys.argv[1]
-    output_file = sys.argv[2]
+    telemetry = Telemetry(__file__)
 
-    try:
-        with open(input_file, "r") as f:
-            newick_data = f.read()
-    except FileNotFoundError:
-        print(f"Error: File '{input_file}' not found.")
-        sys.exit(1)
+    # Single tree file, as before: input output
+    if not (args.table or args.per_tree or args.thresholds is not None or args.scale):
+        if len(args.trees) != 2:
+            parser.error("without --table, exactly two arguments are expected: input output")
+        input_file, output_file = args.trees
+
+        bootstrap_values = []
+        trees = 0
+        try:
+            with telemetry.phase("parse"):
+                for tree in iter_trees(input_file):
+                    bootstrap_values.extend(extract_bootstrap_values(tree))
+                    trees += 1
+        except FileNotFoundError:
+            print(f"Error: File '{input_file}' not found.")
+            sys.exit(1)
+
+        average_value = compute_average(bootstrap_values)
+        telemetry.record(trees=trees, nodes=len(bootstrap_values))
+        telemetry.decide(f"{average_value:.2f}")
+
+        with telemetry.phase("write"), open(output_file, "w") as f:
+            f.write(f"{average_value:.2f}\n")
+
+        print(f"Average bootstrap value saved to '{output_file}'")
+        return
+
+    if not args.table:
+        parser.error("summary mode needs --table")
+    thresholds = [70.0, 95.0] if args.thresholds is None else args.thresholds
+    scale = args.scale or "auto"
 
-    bootstrap_values = extract_bootstrap_values(newick_data)
-    average_value = compute_average(bootstrap_values)
+    for path in args.trees:
+        try:
+            open(path).close()
+        except OSError:
+            print(f"Error: File '{path}' not found.")
+            sys.exit(1)
 
-    with open(output_file, "w") as f:
-        f.write(f"{average_value:.2f}\n")
+    # Trees are streamed, so reading and summarizing are timed together
+    with telemetry.phase("compute"):
+        trees, nodes = write_summaries(args.trees, args.table, args.per_tree, thresholds, scale)
+    telemetry.record(files=len(args.trees), trees=trees, nodes=nodes)
 
-    print(f"Average bootstrap value saved to '{output_file}'")
+    print(f"✓ Support summary of {len(args.trees)} files written to: {args.table}")
 
 if __name__ == "__main__":
     main()
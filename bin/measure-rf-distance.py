@@ -7,13 +7,29 @@ Description:
 - Calculates the Robinson-Foulds (RF) distance between them.
 - Outputs the RF distance to a .txt file.
 
+Batch mode (--matrix):
+- Reads N trees (and optionally a reference tree) once, over a shared taxon
+  namespace, and encodes every tree's non-trivial splits as integer bitmasks.
+- The RF distance of two trees is the size of the symmetric difference of
+  their split sets, so the full N × N RF matrix (and the normalized RF,
+  RF / (2·(n − 3))) is computed from hashed sets in one pass.
+- With --reference, a one-vs-many table against the reference is written
+  as well.
+
 Usage:
     python measure_rf_distance.py your_tree.tre reference_tree.tre rf_output.txt
+    python measure_rf_distance.py --matrix rf-matrix.tsv [--normalized-matrix rf-normalized.tsv]
+        [--reference reference_tree.tre --reference-table rf-reference.tsv] tree_1.tre ... tree_N.tre
 """
 
-import sys
+import argparse
+from pathlib import Path
 import dendropy
 from dendropy.calculate import treecompare
+from core_phylogenies import Telemetry
+
+# Removed from tree file names to label them in the matrices
+TREE_SUFFIXES = [".raxml.support.tre", ".support.tre", ".tre", ".nwk", ".newick"]
 
 def calculate_rf_distance(tree_path_1, tree_path_2):
     """
@@ -52,17 +68,118 @@ def write_output(rf_distance, max_rf, output_path):
         f.write(f"Max possible RF distance: {max_rf}\n")
         f.write("=" * 40 + "\n")
 
+def tree_label(path):
+    name = Path(path).name
+    for suffix in TREE_SUFFIXES:
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+def read_trees(paths, taxa):
+    """Read every tree into the shared taxon namespace `taxa`."""
+    return [dendropy.Tree.get(path=path, schema="newick",
+                              rooting="force-unrooted", taxon_namespace=taxa)
+            for path in paths]
+
+def split_set(tree):
+    """
+    Non-trivial splits of an unrooted tree as a frozenset of normalized
+    bitmasks over the taxon namespace. Must be called after every tree has
+    been read, so all trees are normalized against the same namespace.
+    """
+    return frozenset(bipartition.split_bitmask
+                     for bipartition in tree.encode_bipartitions()
+                     if not bipartition.is_trivial())
+
+def rf_from_splits(splits_1, splits_2):
+    """RF distance: number of splits found in only one of the two trees."""
+    return len(splits_1 ^ splits_2)
+
+def normalized_rf(rf_distance, max_rf):
+    return rf_distance / max_rf if max_rf > 0 else 0.0
+
+def write_matrix(labels, values, output_path):
+    with open(output_path, "w") as f:
+        f.write("\t".join(["tree"] + labels) + "\n")
+        for label, row in zip(labels, values):
+            f.write("\t".join([label] + [str(value) for value in row]) + "\n")
+
+def rf_matrix(tree_paths, reference_path=None):
+    """
+    Return (labels, RF matrix, max_rf, reference RF distances or None).
+    The reference, if given, is the first row/column of the matrix.
+    """
+    taxa = dendropy.TaxonNamespace()
+    paths = ([reference_path] if reference_path else []) + list(tree_paths)
+    labels = (["reference"] if reference_path else []) + [tree_label(path) for path in tree_paths]
+
+    trees = read_trees(paths, taxa)
+    splits = [split_set(tree) for tree in trees]
+    max_rf = 2 * (len(taxa) - 3)
+
+    matrix = [[0] * len(splits) for _ in splits]
+    for i in range(len(splits)):
+        for j in range(i + 1, len(splits)):
+            matrix[i][j] = matrix[j][i] = rf_from_splits(splits[i], splits[j])
+
+    reference = matrix[0][1:] if reference_path else None
+    return labels, matrix, max_rf, reference
+
 def main():
-    if len(sys.argv) != 4:
-        print("Usage: python measure_rf_distance.py tree1.tre tree2.tre output.txt")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(
+        description="RF distance of two trees, or RF distance matrix of many trees, optionally against a reference tree",
+        usage="%(prog)s tree_1 tree_2 output | %(prog)s --matrix MATRIX [options] tree [tree ...]"
+    )
+    parser.add_argument("trees", nargs="+",
+                        help="Query trees (Newick); without batch options: tree_1 tree_2 output")
+    parser.add_argument("--matrix", default=None, help="Output TSV with the all-vs-all RF matrix")
+    parser.add_argument("--normalized-matrix", default=None,
+                        help="Output TSV with the all-vs-all normalized RF matrix")
+    parser.add_argument("--reference", default=None, help="Reference tree (Newick)")
+    parser.add_argument("--reference-table", default=None,
+                        help="Output TSV with the RF distance of every tree to the reference")
+    args = parser.parse_args()
+
+    telemetry = Telemetry(__file__)
+
+    # Single pair, as before: tree_1 tree_2 output
+    if not (args.matrix or args.normalized_matrix or args.reference or args.reference_table):
+        if len(args.trees) != 3:
+            parser.error("without --matrix, exactly three arguments are expected: tree_1 tree_2 output")
+        tree_file_1, tree_file_2, output_file = args.trees
+
+        with telemetry.phase("compute"):
+            rf_distance, max_rf = calculate_rf_distance(tree_file_1, tree_file_2)
+        telemetry.record(trees=2, taxa=max_rf // 2 + 3)
+        telemetry.decide(str(rf_distance))
+        with telemetry.phase("write"):
+            write_output(rf_distance, max_rf, output_file)
+
+        print(f"✓ RF distance ({rf_distance}) written to: {output_file}")
+        return
+
+    if not args.matrix:
+        parser.error("batch mode needs --matrix")
+    if args.reference_table and not args.reference:
+        parser.error("--reference-table needs --reference")
+
+    with telemetry.phase("compute"):
+        labels, matrix, max_rf, reference = rf_matrix(args.trees, args.reference)
+    telemetry.record(trees=len(labels), taxa=max_rf // 2 + 3, pairs=len(labels) * (len(labels) - 1) // 2)
 
-    tree_file_1, tree_file_2, output_file = sys.argv[1:4]
+    with telemetry.phase("write"):
+        write_matrix(labels, matrix, args.matrix)
+        if args.normalized_matrix:
+            write_matrix(labels, [[f"{normalized_rf(value, max_rf):.6f}" for value in row] for row in matrix],
+                         args.normalized_matrix)
 
-    rf_distance, max_rf = calculate_rf_distance(tree_file_1, tree_file_2)
-    write_output(rf_distance, max_rf, output_file)
+    if args.reference_table:
+        with telemetry.phase("write"), open(args.reference_table, "w") as f:
+            f.write("tree\trf_distance\tmax_rf_distance\tnormalized_rf_distance\n")
+            for path, rf_distance in zip(args.trees, reference):
+                f.write(f"{tree_label(path)}\t{rf_distance}\t{max_rf}\t{normalized_rf(rf_distance, max_rf):.6f}\n")
 
-    print(f"✓ RF distance ({rf_distance}) written to: {output_file}")
+    print(f"✓ RF matrix of {len(labels)} trees written to: {args.matrix}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -7,24 +7,37 @@ Description:
     or full filename), randomly samples k unique taxon headers,
     and writes them—one per line—to the specified output file.
 
-Supported extensions: .fasta, .fa, .fas, .fna
+    Only the '>' header lines are read, never the sequences. With --seed
+    the samples are reproducible; each (k, replicate) sample gets its own
+    generator derived from the seed, so it does not change when other k
+    values or more replicates are requested.
+
+    Replicate mode (several k values and/or --replicates N): many
+    independent samples are drawn from the single scan and written as a
+    TSV with one row per sampled taxon: k, replicate, taxon.
+
+Supported extensions: .fasta, .fa, .fas, .fna, optionally gzip/bgzip
+compressed (.gz), and .cpaln alignment caches
 
 Usage:
-    python sample_taxa.py <input_base_or_filename> <k> <output.txt>
+    python sample_taxa.py <input_base_or_filename> <k> <output.txt> [--seed S]
+    python sample_taxa.py <input_base_or_filename> <k1,k2,...> <output.tsv> --replicates N [--seed S]
 
 Example:
     python sample_taxa.py cysl 5 taxa5.txt
     python sample_taxa.py cysl.fa 5 taxa5.txt
+    python sample_taxa.py cysl.fa 5,10,20 samples.tsv --replicates 100 --seed 42
 """
 
 import sys
 import argparse
 import random
 from pathlib import Path
-from Bio import SeqIO
+from core_phylogenies import CACHE_SUFFIX, Telemetry, read_ids
 
 # Supported FASTA extensions
-EXTS = [".fasta", ".fa", ".fas", ".fna"]
+EXTS = [".fasta", ".fa", ".fas", ".fna", CACHE_SUFFIX,
+        ".fasta.gz", ".fa.gz", ".fas.gz", ".fna.gz"]
 
 def resolve_fasta_path(base):
     """
@@ -38,19 +51,35 @@ def resolve_fasta_path(base):
         return p
     if p.suffix == "":
         for ext in EXTS:
-            q = p.with_suffix(ext)
+            q = p.with_name(p.name + ext)
             if q.is_file():
                 return q
     return None
 
+def parse_k_values(value):
+    """'5' → [5], '5,10,20' → [5, 10, 20]"""
+    try:
+        return [int(v) for v in value.split(",") if v.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{value}' is not a comma-separated list of integers")
+
+def sample_generator(seed, k, replicate):
+    """Random generator of one (k, replicate) sample; seeded from `seed` if given."""
+    return random.Random(f"{seed}:{k}:{replicate}") if seed is not None else random.Random()
+
 def main():
     parser = argparse.ArgumentParser(
         description="Randomly sample k taxa headers from a FASTA alignment"
     )
     parser.add_argument("input_base", help="Base name or FASTA filename of the alignment")
-    parser.add_argument("k", type=int, help="Number of taxa to sample (1 ≤ k ≤ total taxa)")
-    parser.add_argument("output_txt", help="Output text file for sampled headers")
+    parser.add_argument("k", type=parse_k_values,
+                        help="Number of taxa to sample (1 ≤ k ≤ total taxa), or a comma-separated list of them")
+    parser.add_argument("output_txt", help="Output text file for sampled headers (TSV in replicate mode)")
+    parser.add_argument("--seed", default=None, help="Seed for reproducible samples")
+    parser.add_argument("--replicates", type=int, default=1,
+                        help="Independent samples drawn for every k (default: 1)")
     args = parser.parse_args()
+    telemetry = Telemetry(__file__)
 
     # Locate the FASTA file
     fasta_path = resolve_fasta_path(args.input_base)
@@ -58,30 +87,41 @@ def main():
         print(f"Error: no FASTA file found for '{args.input_base}'", file=sys.stderr)
         sys.exit(1)
 
-    # Read all records
+    # Read the record IDs only (an alignment cache lists them in its header)
     try:
-        records = list(SeqIO.parse(fasta_path, "fasta"))
+        with telemetry.phase("parse"):
+            headers = read_ids(fasta_path)
     except Exception as e:
         print(f"Error reading alignment: {e}", file=sys.stderr)
         sys.exit(1)
 
-    headers = [rec.id for rec in records]
     n = len(headers)
     if n == 0:
         print("Error: no records found in alignment", file=sys.stderr)
         sys.exit(1)
-    if not (1 <= args.k <= n):
+    if not args.k or not all(1 <= k <= n for k in args.k):
         print(f"Error: k must be between 1 and {n}", file=sys.stderr)
         sys.exit(1)
+    if args.replicates < 1:
+        print("Error: --replicates must be at least 1", file=sys.stderr)
+        sys.exit(1)
 
     # Sample without replacement
-    sampled = random.sample(headers, args.k)
+    telemetry.record(taxa=n, k=",".join(str(k) for k in args.k), replicates=args.replicates)
+    samples = [(k, replicate, sample_generator(args.seed, k, replicate).sample(headers, k))
+               for k in args.k for replicate in range(1, args.replicates + 1)]
 
     # Write output
     try:
-        with open(args.output_txt, "w") as out:
-            for h in sampled:
-                out.write(h + "\n")
+        with telemetry.phase("write"), open(args.output_txt, "w") as out:
+            if len(samples) == 1:
+                for h in samples[0][2]:
+                    out.write(h + "\n")
+            else:
+                out.write("k\treplicate\ttaxon\n")
+                for k, replicate, sampled in samples:
+                    for h in sampled:
+                        out.write(f"{k}\t{replicate}\t{h}\n")
     except Exception as e:
         print(f"Error writing output: {e}", file=sys.stderr)
         sys.exit(1)
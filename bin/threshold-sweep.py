@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Program: Gene Subsets for a Grid of Filter Thresholds
+-----------------------------------------------------
+Description:
+    Reads the per-gene metrics computed once by `filter-batch.py --all-metrics`
+    and, for every point of a grid of thresholds, selects the genes that pass:
+      - polymorphic-site rate ≥ cutoff
+      - π ∈ [start, end]
+      - average dN/dS ∈ [start, end]
+    An axis left empty does not filter. The decisions are those of the single
+    filters (the rate is recomputed from the exact site counts). Grid points
+    that select the same genes share one subset, so each distinct subset is
+    concatenated and turned into a phylogeny only once.
+
+    Grid points are named like a single run of the pipeline:
+        <data>-<cutoff>-<π start>-<π end>-<dN/dS start>-<dN/dS end>
+    with empty fields for unused axes.
+
+Input:
+    - One or more filter-batch.py results tables (TSV).
+
+Output:
+    - A TSV describing every grid point: its thresholds, number of genes and
+      the subset it uses ("NA" if no gene passes).
+    - One `<subset>.tsv` per distinct, non-empty subset in the output directory,
+      listing `<id><TAB><absolute path>` of its genes.
+
+Usage:
+    python threshold-sweep.py <results.tsv> [<results.tsv> ...] --data-name NAME
+        [--polymorphic-sites-cutoffs X,Y] [--nucleotide-diversity-ranges A:B,C:D]
+        [--dnds-ratio-ranges A:B] [--grid sweep-grid.tsv] [--output-dir subsets]
+"""
+
+import argparse
+import csv
+import itertools
+import os
+from core_phylogenies import Telemetry
+
+GRID_COLUMNS = [
+    "grid_point",
+    "polymorphic_sites_cutoff",
+    "nucleotide_diversity_start", "nucleotide_diversity_end",
+    "dnds_ratio_start", "dnds_ratio_end",
+    "genes", "subset",
+]
+
+
+def split_list(value):
+    return [v.strip() for v in value.split(",") if v.strip()]
+
+
+def parse_values(value):
+    """'0.05,0.1' → ['0.05', '0.1']; the strings are kept for the grid point names."""
+    values = split_list(value)
+    for v in values:
+        float(v)
+    return values
+
+
+def parse_ranges(value):
+    """'0.05:0.8,0.1:0.5' → [('0.05', '0.8'), ('0.1', '0.5')]"""
+    ranges = []
+    for item in split_list(value):
+        start, sep, end = item.partition(":")
+        if not sep:
+            raise argparse.ArgumentTypeError(f"range '{item}' is not of the form START:END")
+        float(start), float(end)
+        ranges.append((start.strip(), end.strip()))
+    return ranges
+
+
+def to_float(value):
+    """Metric column value → float, or None for 'NA'/'None'."""
+    return None if value in ("NA", "None", "") else float(value)
+
+
+def read_metrics(tables):
+    """Return the gene rows of all results tables, in order."""
+    genes = []
+    for table in tables:
+        with open(table, newline="") as handle:
+            for row in csv.DictReader(handle, delimiter="\t"):
+                if row["failed_filter"] == "parse":
+                    continue
+                poly, length = to_float(row["polymorphic_sites"]), to_float(row["total_columns"])
+                genes.append({
+                    "id": row["id"],
+                    "path": row["path"],
+                    "polymorphic_rate": None if poly is None else (poly / length if length > 0 else 0.0),
+                    "nucleotide_diversity": to_float(row["nucleotide_diversity"]),
+                    "dnds_ratio": to_float(row["dnds_ratio"]),
+                })
+    return genes
+
+
+def in_range(value, bounds):
+    if bounds is None:
+        return True
+    return value is not None and float(bounds[0]) <= value <= float(bounds[1])
+
+
+def passes(gene, cutoff, diversity, dnds):
+    if cutoff is not None and (gene["polymorphic_rate"] is None or gene["polymorphic_rate"] < float(cutoff)):
+        return False
+    return in_range(gene["nucleotide_diversity"], diversity) and in_range(gene["dnds_ratio"], dnds)
+
+
+def grid_point_name(data_name, cutoff, diversity, dnds):
+    fields = [cutoff, *(diversity or (None, None)), *(dnds or (None, None))]
+    return "-".join([data_name] + [field or "" for field in fields])
+
+
+def main():
+    p = argparse.ArgumentParser(
+        description="Derive the gene subset of every point of a threshold grid from precomputed metrics"
+    )
+    p.add_argument("tables", nargs="+", help="filter-batch.py --all-metrics results tables")
+    p.add_argument("--data-name", required=True, help="Dataset name used as prefix of the grid point names")
+    p.add_argument("--polymorphic-sites-cutoffs", type=parse_values, default=[],
+                   help="Comma-separated minimum polymorphic-site rates")
+    p.add_argument("--nucleotide-diversity-ranges", type=parse_ranges, default=[],
+                   help="Comma-separated inclusive π ranges START:END")
+    p.add_argument("--dnds-ratio-ranges", type=parse_ranges, default=[],
+                   help="Comma-separated inclusive dN/dS ranges START:END")
+    p.add_argument("--grid", default="sweep-grid.tsv", help="Output TSV describing the grid points")
+    p.add_argument("--output-dir", default="subsets", help="Directory for the subset lists")
+    args = p.parse_args()
+    telemetry = Telemetry(__file__)
+
+    with telemetry.phase("parse"):
+        genes = read_metrics(args.tables)
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    subsets = {}  # Gene IDs → subset name
+    points = 0
+    with telemetry.phase("compute"), open(args.grid, "w") as grid:
+        grid.write("\t".join(GRID_COLUMNS) + "\n")
+        for cutoff, diversity, dnds in itertools.product(args.polymorphic_sites_cutoffs or [None],
+                                                         args.nucleotide_diversity_ranges or [None],
+                                                         args.dnds_ratio_ranges or [None]):
+            name = grid_point_name(args.data_name, cutoff, diversity, dnds)
+            selected = [gene for gene in genes if passes(gene, cutoff, diversity, dnds)]
+            key = tuple(gene["id"] for gene in selected)
+
+            if key and key not in subsets:
+                subsets[key] = name
+                with open(os.path.join(args.output_dir, f"{name}.tsv"), "w") as subset:
+                    for gene in selected:
+                        subset.write(f"{gene['id']}\t{gene['path']}\n")
+
+            fields = [name, cutoff, *(diversity or (None, None)), *(dnds or (None, None)),
+                      len(selected), subsets.get(key, "NA")]
+            grid.write("\t".join("NA" if field is None else str(field) for field in fields) + "\n")
+            points += 1
+
+    telemetry.record(genes=len(genes), grid_points=points, subsets=len(subsets))
+    print(f"{len(subsets)} distinct gene subsets")
+
+
+if __name__ == "__main__":
+    main()
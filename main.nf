@@ -3,4 +3,16 @@ include { CORE_PHYLOGENIES } from './workflows/core-phylogenies'
 workflow {
     main:
         CORE_PHYLOGENIES()
-}
\ No newline at end of file
+}
+
+workflow.onComplete {
+    if (params.telemetry) {
+        // Merge the telemetry records of every task of this run (needs only Python 3 on the machine running Nextflow)
+        def command = ["python3", "${projectDir}/bin/collect-telemetry.py", "${workflow.workDir}",
+                       "--output", "${params.results}/telemetry.tsv",
+                       "--summary", "${params.results}/telemetry-summary.tsv",
+                       "--since", "${workflow.start.toInstant().toEpochMilli() / 1000}"]
+        def collector = command.execute()
+        collector.waitForProcessOutput(System.out, System.err)
+    }
+}
@@ -0,0 +1,22 @@
+process BUILD_MANIFEST {
+    tag "${id}"
+    cpus "${params.build_manifest_cpus}"
+    memory "${params.build_manifest_memory} GB"
+    publishDir "${params.results}/build-manifest", mode: "copy"
+    container "${container}"
+    clusterOptions "${cluster_options}"
+
+    input:
+        tuple val(id), path(input_alignments, stageAs: "input-alignments/*"), val(container), val(cluster_options) // ${input_alignments} is a list of files!
+    
+    output:
+        tuple val(id), path("${id}-manifest.tsv")
+
+    script:
+        """
+        build-manifest.py input-alignments \
+            --output ${id}-manifest.tsv \
+            --id-method ${params.prepare_id_method} \
+            --workers ${task.cpus}
+        """
+}
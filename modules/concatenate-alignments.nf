@@ -10,13 +10,20 @@ process CONCATENATE_ALIGNMENTS {
         tuple val(id), val(input_alignments), val(container), val(cluster_options) // ${input_alignments} is a string of paths!
     
     output:
-        tuple val(id), path("${id}-concatenated.fasta"), path("genes-after-filtering.txt")
+        tuple val(id), path("${id}-concatenated.fasta*"), path("genes-after-filtering.txt"), emit: alignment
+        tuple val(id), path("${id}-concatenated.patterns.fasta"), path("${id}-concatenated.site-weights.txt"), optional: true, emit: patterns // Only with --concatenate_alignments_patterns
+        tuple val(id), path("${id}-site-patterns.tsv"), path("${id}-concatenated.invariant-sites.tsv"), optional: true, emit: report // ^
 
     script:
+        def output = "${id}-concatenated.fasta${params.concatenate_alignments_compress ? ".gz" : ""}"
+        def streaming = params.concatenate_alignments_streaming ? "--streaming" : ""
+        def patterns = params.concatenate_alignments_patterns ? "--patterns --pattern-report ${id}-site-patterns.tsv" : ""
+        def block_cache = params.concatenate_alignments_block_cache ? "--block-cache ${file(params.concatenate_alignments_block_cache)}" : ""
+
         """
         mkdir input-alignments
-        cp ${input_alignments} input-alignments/
-        concatenate-alignments.py "\${PWD}/input-alignments" ${id}-concatenated.fasta
+        ln -sf ${input_alignments} input-alignments/ # Links keep the paths (and block cache keys) of the alignments
+        concatenate-alignments.py "\${PWD}/input-alignments" ${output} ${streaming} ${patterns} ${block_cache}
 
         ls input-alignments > genes-after-filtering.txt
         printf "\nNumber of genes after filtering:\n" >> genes-after-filtering.txt
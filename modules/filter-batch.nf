@@ -0,0 +1,66 @@
+process FILTER_BATCH {
+    tag "${id}"
+    cpus "${params.filter_batch_cpus}"
+    memory "${params.filter_batch_memory} GB"
+    maxForks params.filter_batch_max_forks.toInteger()
+    publishDir "${params.results}/filter-batch", mode: "copy"
+    container "${container}"
+    clusterOptions "${cluster_options}"
+
+    input:
+        tuple val(id), val(gene_ids), path(input_alignments, stageAs: "input-alignments/*"), val(container), val(cluster_options) // ${input_alignments} is a list of files!
+    
+    output:
+        tuple val(id), path("${id}-filter-results.tsv"), path("${id}-passed-alignments.tsv")
+
+    script:
+        def alignments = [gene_ids, input_alignments instanceof List ? input_alignments : [input_alignments]].transpose()
+        def options = []
+
+        if (params.metrics_cache) {
+            options << "--metrics-cache ${file(params.metrics_cache)}"
+        }
+
+        if (params.sweep) {
+            // Every metric of the sweep grid for every gene, thresholds are applied by THRESHOLD_SWEEP
+            def metrics = []
+
+            if (params.sweep_polymorphic_sites_cutoffs) {
+                metrics << "polymorphic-sites"
+            }
+
+            if (params.sweep_nucleotide_diversity_ranges) {
+                metrics << "nucleotide-diversity"
+            }
+
+            if (params.sweep_dnds_ratio_ranges) {
+                metrics << "dnds-ratio"
+            }
+
+            options << "--all-metrics --metrics '${metrics.join(",")}'"
+
+        } else {
+            if (params.filter_by_polymorphic_sites_cutoff) {
+                options << "--polymorphic-sites-cutoff ${params.filter_by_polymorphic_sites_cutoff}"
+            }
+
+            if (params.filter_by_nucleotide_diversity_start && params.filter_by_nucleotide_diversity_end) {
+                options << "--nucleotide-diversity ${params.filter_by_nucleotide_diversity_start} ${params.filter_by_nucleotide_diversity_end}"
+            }
+
+            if (params.filter_by_dnds_ratio_start && params.filter_by_dnds_ratio_end) {
+                options << "--dnds-ratio ${params.filter_by_dnds_ratio_start} ${params.filter_by_dnds_ratio_end}"
+            }
+        }
+
+        """
+        printf "%s\\t%s\\n" ${alignments.flatten().join(" ")} > alignments.tsv
+
+        filter-batch.py alignments.tsv \
+            --table ${id}-filter-results.tsv \
+            --passed ${id}-passed-alignments.tsv \
+            --order ${params.filter_batch_order} \
+            --threads ${task.cpus} \
+            ${options.join(" ")}
+        """
+}
@@ -15,7 +15,7 @@ process FILTER_BY_DNDS_RATIO {
 
     script:
         """
-        ANSWER=`filter-by-dnds-ratio-optimized.py ${input_alignment} ${start} ${end}`
+        ANSWER=`filter-by-dnds-ratio-optimized.py ${input_alignment} ${start} ${end} --threads ${task.cpus} ${params.metrics_cache ? "--metrics-cache ${file(params.metrics_cache)}" : ""}`
         if [ "\${ANSWER}" == "TRUE" ]; then
             RETURN="\${PWD}/${input_alignment}"
         else
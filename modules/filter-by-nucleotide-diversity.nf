@@ -15,7 +15,7 @@ process FILTER_BY_NUCLEOTIDE_DIVERSITY {
 
     script:
         """
-        ANSWER=`filter-by-nucleotide-diversity-optimized.py ${input_alignment} ${start} ${end}`
+        ANSWER=`filter-by-nucleotide-diversity-optimized.py ${input_alignment} ${start} ${end} ${params.metrics_cache ? "--metrics-cache ${file(params.metrics_cache)}" : ""} ${params.filter_column_windows ? "--memory-budget ${task.memory.toMega().intdiv(2)}" : ""} ${params.filter_by_nucleotide_diversity_early_decision ? "--early-decision" : ""}`
         if [ "\${ANSWER}" == "TRUE" ]; then
             RETURN="\${PWD}/${input_alignment}"
         else
@@ -15,7 +15,7 @@ process FILTER_BY_POLYMORPHIC_SITES {
 
     script:
         """
-        ANSWER=`filter-by-normalized-polymorphic-sites.py ${input_alignment} ${cutoff}`
+        ANSWER=`filter-by-normalized-polymorphic-sites.py ${input_alignment} ${cutoff} ${params.metrics_cache ? "--metrics-cache ${file(params.metrics_cache)}" : ""} ${params.filter_column_windows ? "--memory-budget ${task.memory.toMega().intdiv(2)}" : ""}`
         if [ "\${ANSWER}" == "TRUE" ]; then
             RETURN="\${PWD}/${input_alignment}"
         else
@@ -0,0 +1,28 @@
+process FORMAT_HEADERS_BATCH {
+    tag "${id}"
+    cpus "${params.format_headers_cpus}"
+    memory "${params.format_headers_memory} GB"
+    maxForks params.format_headers_max_forks.toInteger()
+    publishDir "${params.results}/format-headers", mode: "copy"
+    container "${container}"
+    clusterOptions "${cluster_options}"
+
+    input:
+        tuple val(id), val(gene_ids), path(input_alignments, stageAs: "input-alignments/*"), val(container), val(cluster_options) // ${input_alignments} is a list of files!
+    
+    output:
+        tuple val(id), path("${id}-formatted-alignments.tsv"), path("formatted-alignments/*")
+
+    script:
+        def alignments = [gene_ids, input_alignments instanceof List ? input_alignments : [input_alignments]].transpose()
+
+        """
+        printf "%s\\t%s\\n" ${alignments.flatten().join(" ")} > alignments.tsv
+
+        format-headers.py --fofn alignments.tsv \
+            --manifest ${id}-formatted-alignments.tsv \
+            --workers ${task.cpus} \
+            ${params.format_headers_cache ? "--cache alignment-cache" : ""} \
+            ${params.format_headers_compress ? "--compress" : ""}
+        """
+}
@@ -11,10 +11,13 @@ process FORMAT_HEADERS {
         tuple val(id), path(input_alignment), val(container), val(cluster_options) // ${input_alignments} is a directory!
     
     output:
-        tuple val(id), path("formatted-alignments/*")
+        tuple val(id), path("formatted-alignments/*"), emit: alignment
+        tuple val(id), path("alignment-cache/*"), optional: true, emit: cache // Only with --format_headers_cache
 
     script:
         """
-        format-headers.py ${input_alignment}
+        format-headers.py ${input_alignment} \
+            ${params.format_headers_cache ? "--cache alignment-cache" : ""} \
+            ${params.format_headers_compress ? "--compress" : ""}
         """
 }
\ No newline at end of file
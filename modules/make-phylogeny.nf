@@ -9,13 +9,18 @@ process MAKE_PHYLOGENY {
     cache "deep"
 
     input:
-        tuple val(id), path(alignment), path(substitution_model), val(container), val(cluster_options)
+        tuple val(id), path(alignment), path(substitution_model), path(site_weights, stageAs: "site-weights.txt"), val(container), val(cluster_options) // ${site_weights} is "/" unless the alignment is a pattern alignment
     
     output:
         tuple val(id), path("${id}.support.tre")
 
     script:
         """
+        SITE_WEIGHTS=""
+        if [ -f "${site_weights}" ]; then
+            SITE_WEIGHTS="--site-weights ${site_weights}"
+        fi
+
         if [ "${params.make_phylogeny_method}" = "raxml-ng" ]; then
         
             export MODEL=\$(cat ${substitution_model} | grep "> raxml-ng" | tail -1 | grep -e "--model.*\$" -o | grep  -e "\\s.*\$" -o)
@@ -30,7 +35,8 @@ process MAKE_PHYLOGENY {
                 --tree pars{100} \
                 --bs-trees ${params.make_phylogeny_bootstraps} \
                 --threads ${task.cpus} \
-                --force perf_threads
+                --force perf_threads \
+                \$SITE_WEIGHTS
 
             mv ${id}.raxml.support ${id}.support.tre
 
@@ -64,6 +70,17 @@ process MAKE_PHYLOGENY {
                 -out ${id}.support.tre \
                 ${alignment}
 
+        elif [ "${params.make_phylogeny_method}" = "nj" ] ; then
+
+            OMP_NUM_THREADS=${task.cpus} make-nj-tree.py \
+                ${alignment} \
+                ${id}.support.tre \
+                --algorithm ${params.make_phylogeny_nj_algorithm} \
+                --distance ${params.make_phylogeny_nj_distance} \
+                --bootstraps ${params.make_phylogeny_bootstraps} \
+                --seed 119318 \
+                \$SITE_WEIGHTS
+
         fi
         """
 }
\ No newline at end of file
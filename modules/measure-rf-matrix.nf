@@ -0,0 +1,23 @@
+process MEASURE_RF_MATRIX {
+    tag "${id}"
+    cpus "${params.measure_rf_distance_cpus}"
+    memory "${params.measure_rf_distance_memory} GB"
+    publishDir "${params.results}/measure-rf-distance", mode: "copy"
+    container "${container}"
+    clusterOptions "${cluster_options}"
+
+    input:
+        tuple val(id), path(query_trees, stageAs: "query-trees/*"), path(reference_tree), val(container), val(cluster_options) // ${query_trees} is a list of files!
+    
+    output:
+        tuple val(id), path("${id}-rf-matrix.tsv"), path("${id}-rf-normalized-matrix.tsv"), path("${id}-rf-reference.tsv")
+
+    script:
+        """
+        measure-rf-distance.py query-trees/* \
+            --reference ${reference_tree} \
+            --matrix ${id}-rf-matrix.tsv \
+            --normalized-matrix ${id}-rf-normalized-matrix.tsv \
+            --reference-table ${id}-rf-reference.tsv
+        """
+}
@@ -0,0 +1,22 @@
+process MEASURE_SUPPORT_SUMMARY {
+    tag "${id}"
+    cpus "${params.measure_average_support_cpus}"
+    memory "${params.measure_average_support_memory} GB"
+    publishDir "${params.results}/measure-average-support", mode: "copy"
+    container "${container}"
+    clusterOptions "${cluster_options}"
+
+    input:
+        tuple val(id), path(query_trees, stageAs: "query-trees/*"), val(container), val(cluster_options) // ${query_trees} is a list of files!
+    
+    output:
+        tuple val(id), path("${id}-support-summary.tsv"), path("${id}-support-per-tree.tsv")
+
+    script:
+        """
+        measure-average-support.py query-trees/* \
+            --table ${id}-support-summary.tsv \
+            --per-tree ${id}-support-per-tree.tsv \
+            --thresholds ${params.measure_support_thresholds}
+        """
+}
@@ -0,0 +1,26 @@
+process THRESHOLD_SWEEP {
+    tag "${id}"
+    cpus "${params.threshold_sweep_cpus}"
+    memory "${params.threshold_sweep_memory} GB"
+    publishDir "${params.results}/threshold-sweep", mode: "copy"
+    container "${container}"
+    clusterOptions "${cluster_options}"
+
+    input:
+        tuple val(id), path(filter_results, stageAs: "filter-results/*"), val(container), val(cluster_options) // ${filter_results} is a list of files!
+    
+    output:
+        tuple val(id), path("${id}-sweep-grid.tsv"), emit: grid
+        path("subsets/*.tsv"), optional: true, emit: subsets // One list of genes per distinct subset
+
+    script:
+        """
+        threshold-sweep.py filter-results/* \
+            --data-name ${id} \
+            --polymorphic-sites-cutoffs "${params.sweep_polymorphic_sites_cutoffs ?: ''}" \
+            --nucleotide-diversity-ranges "${params.sweep_nucleotide_diversity_ranges ?: ''}" \
+            --dnds-ratio-ranges "${params.sweep_dnds_ratio_ranges ?: ''}" \
+            --grid ${id}-sweep-grid.tsv \
+            --output-dir subsets
+        """
+}
@@ -0,0 +1,637 @@
+#!/usr/bin/env python3
+"""
+Program: Benchmarks of the bin/ Scripts
+---------------------------------------
+Description:
+    Times the core function of every bin/ script on synthetic core genomes
+    (see simulate-core-genome.py) along scaling curves of taxa count and
+    alignment length, and records wall time and peak memory so results can
+    be compared between commits.
+
+    Every measurement runs in a fresh Python process, so peak memory is not
+    inflated by earlier cases:
+      - In-process cases import the script (core_phylogenies.load_script),
+        parse their input outside the timed region and time one call of the
+        core function. peak_rss_mb is the peak resident memory of that
+        process, delta_rss_mb the part reached during the timed call. The
+        dN/dS cases use the first gene without its gapped codon columns, so
+        all pairs are compared.
+      - CLI cases (scripts that run main() on import, or whose core is the
+        whole program) time the script as a subprocess; peak_rss_mb is its
+        peak resident memory.
+    Legacy and optimized implementations are separate cases (e.g.
+    nucleotide-diversity-legacy vs nucleotide-diversity-optimized, or the
+    shared FASTA parser in read-alignment vs Biopython in
+    read-alignment-biopython), and the value each returns is recorded, so
+    they can be checked for agreement.
+    Slow reference implementations are skipped on the largest points.
+
+    --check compares optimized and reference implementations instead of
+    timing them, on the test alignments (tests/data) and on a small
+    synthetic gapped core genome, and exits with an error on any mismatch
+    beyond the check's tolerance.
+
+Output:
+    - A TSV with one row per (case, taxa, length): commit, script, minimum
+      and median wall time over the repeats, peak and delta memory (MB),
+      and the case's result (or the error).
+
+Usage:
+    python run-benchmarks.py [--suite quick|full] [--cases a,b,...] [--repeats 3]
+        [--output benchmark-results.tsv] [--work-dir DIR]
+    python run-benchmarks.py --compare baseline.tsv current.tsv
+    python run-benchmarks.py --check
+"""
+
+import argparse
+import csv
+import gc
+import importlib.util
+import json
+import os
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import Namespace
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+REPO_DIR = BENCH_DIR.parents[1]
+BIN_DIR = REPO_DIR / "bin"
+TEST_DATA_DIR = REPO_DIR / "tests" / "data" / "prorocentrum-spp-formatted"
+sys.path.insert(0, str(BIN_DIR))
+
+# Scaling curves: taxa at a fixed length, then length at a fixed number of taxa
+SUITES = {
+    "quick": {"taxa": [8, 16, 32], "taxa_length": 999,
+              "length": [300, 3000, 30000], "length_taxa": 16,
+              "genes": 4, "trees": 20},
+    "full": {"taxa": [8, 16, 32, 64, 128, 256], "taxa_length": 3000,
+             "length": [999, 9999, 99999, 999999], "length_taxa": 32,
+             "genes": 20, "trees": 200},
+}
+
+# Synthetic data
+GAP_FRACTION = 0.05
+DIVERSITY = 0.05
+SEED = 1
+
+# Synthetic gapped core genome of --check: genes, taxa, length
+CHECK_GENOME = (2, 12, 999)
+
+# Largest difference allowed between the table and Biopython dN/dS averages (floating-point summation order)
+DNDS_TOLERANCE = 1e-9
+
+# Largest difference allowed between the count-based and the pairwise π (floating-point summation order)
+PI_TOLERANCE = 1e-12
+
+RESULT_COLUMNS = [
+    "commit", "case", "script", "taxa", "length", "genes", "repeats",
+    "wall_s_min", "wall_s_median", "peak_rss_mb", "delta_rss_mb", "result",
+]
+
+
+def load_benchmark_module(name):
+    """Import a hyphenated script of this directory (e.g. simulate-core-genome.py)."""
+    spec = importlib.util.spec_from_file_location(name.replace("-", "_")[:-3], BENCH_DIR / name)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def peak_rss_mb(usage):
+    """ru_maxrss in MB (it is in kB on Linux, in bytes on macOS)."""
+    return usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def scaling_points(suite):
+    points = [(taxa, suite["taxa_length"]) for taxa in suite["taxa"]]
+    points += [(suite["length_taxa"], length) for length in suite["length"]]
+    return sorted(set(points))
+
+
+# ---------------------------------------------------------------- Cases
+#
+# Each case: (script, kind, setup, limit). `setup(data)` runs outside the
+# timed region and returns the callable to time (kind "call") or the command
+# to run (kind "cli"). `limit(taxa, length)` is False for points too large
+# for a slow implementation.
+
+def first_gene(data):
+    return data.genes[0]
+
+
+def gene_matrix(data):
+    from core_phylogenies import read_alignment
+    return read_alignment(first_gene(data))
+
+
+def gene_records(data):
+    from core_phylogenies import read_records
+    return read_records(first_gene(data))
+
+
+def ungapped_sequences(data):
+    """Sequences of the first gene without its gapped codon columns, so every pair has equal-length ORFs."""
+    ids, matrix = gene_matrix(data)
+    codons = matrix[:, :matrix.shape[1] // 3 * 3].reshape(len(ids), -1, 3)
+    keep = ~(codons == ord("-")).any(axis=(0, 2))
+    return [row.tobytes() for row in codons[:, keep].reshape(len(ids), -1)]
+
+
+def setup_read_alignment(data):
+    from core_phylogenies import read_fasta
+    path = first_gene(data)
+    return lambda: read_fasta(path)[1].shape
+
+
+def setup_read_alignment_biopython(data):
+    from Bio import SeqIO
+    from core_phylogenies import open_text, sequences_to_matrix
+    path = first_gene(data)
+
+    def parse():
+        with open_text(path) as handle:
+            return sequences_to_matrix(str(rec.seq) for rec in SeqIO.parse(handle, "fasta")).shape
+    return parse
+
+
+def setup_polymorphic_sites(data):
+    from core_phylogenies import load_script
+    script = load_script("filter-by-normalized-polymorphic-sites.py")
+    _, matrix = gene_matrix(data)
+    return lambda: script.count_site_classes(matrix)
+
+
+def setup_polymorphic_sites_windowed(data):
+    from core_phylogenies import load_script
+    script = load_script("filter-by-normalized-polymorphic-sites.py")
+    _, matrix = gene_matrix(data)
+    return lambda: script.count_site_classes(matrix, memory_budget=1 << 20)
+
+
+def setup_polymorphic_sites_reference(data):
+    from Bio.Align import MultipleSeqAlignment
+    from core_phylogenies import load_script
+    script = load_script("filter-by-normalized-polymorphic-sites.py")
+    alignment = MultipleSeqAlignment(gene_records(data))
+    return lambda: script.compute_polymorphic_rate(alignment)
+
+
+def setup_nucleotide_diversity_legacy(data):
+    from core_phylogenies import load_script
+    script = load_script("filter-by-nucleotide-diversity.py")
+    path = first_gene(data)
+    return lambda: script.calculate_nucleotide_diversity(path, ignore_gaps=True)
+
+
+def setup_nucleotide_diversity_optimized(data):
+    from core_phylogenies import load_script
+    script = load_script("filter-by-nucleotide-diversity-optimized.py")
+    _, matrix = gene_matrix(data)
+    return lambda: script.count_nucleotide_diversity(matrix, ignore_gaps=True)
+
+
+def setup_nucleotide_diversity_windowed(data):
+    from core_phylogenies import load_script
+    script = load_script("filter-by-nucleotide-diversity-optimized.py")
+    _, matrix = gene_matrix(data)
+    return lambda: script.count_nucleotide_diversity(matrix, ignore_gaps=True, memory_budget=1 << 20)
+
+
+def setup_nucleotide_diversity_early(data):
+    from core_phylogenies import load_script
+    script = load_script("filter-by-nucleotide-diversity-optimized.py")
+    _, matrix = gene_matrix(data)
+    return lambda: script.early_nucleotide_diversity(matrix, 0.0, 0.01, ignore_gaps=True)[0]
+
+
+def setup_dnds_ratio_legacy(data):
+    from core_phylogenies import load_script
+    script = load_script("filter-by-dnds-ratio.py")
+    sequences = ungapped_sequences(data)
+    return lambda: script.average_dnds(sequences, include_gaps=False)
+
+
+def setup_dnds_ratio_optimized(data):
+    from core_phylogenies import load_script
+    script = load_script("filter-by-dnds-ratio-optimized.py")
+    sequences = ungapped_sequences(data)
+    return lambda: script.average_dnds(sequences, include_gaps=False)
+
+
+def setup_dnds_ratio_optimized_table(data):
+    from core_phylogenies import load_script
+    script = load_script("filter-by-dnds-ratio-optimized.py")
+    sequences = ungapped_sequences(data)
+    return lambda: script.average_dnds_table(sequences, include_gaps=False)
+
+
+def filter_batch_args():
+    return Namespace(polymorphic_sites_cutoff=None, nucleotide_diversity=None, dnds_ratio=None,
+                     include_gaps=False, threads=1)
+
+
+def setup_filter_batch(data):
+    from core_phylogenies import load_script
+    script = load_script("filter-batch.py")
+    criteria, args = list(script.CHECKS), filter_batch_args()
+    return lambda: [script.evaluate_gene(Path(path).stem, path, criteria, args, keep_going=True)["result"]
+                    for path in data.genes]
+
+
+def setup_concatenate_alignments(data):
+    from core_phylogenies import load_script
+    script = load_script("concatenate-alignments.py")
+    output = os.path.join(data.scratch, "concatenated.fasta")
+    return lambda: script.concatenate_alignments(data.alignments, output)
+
+
+def setup_concatenate_alignments_streaming(data):
+    from core_phylogenies import load_script
+    script = load_script("concatenate-alignments.py")
+    output = os.path.join(data.scratch, "concatenated.fasta")
+    return lambda: script.concatenate_alignments_streaming(data.alignments, output)
+
+
+def setup_concatenate_alignments_block_cache(data):
+    from core_phylogenies import BlockCache, load_script
+    script = load_script("concatenate-alignments.py")
+    output = os.path.join(data.scratch, "concatenated.fasta")
+    cache = os.path.join(data.scratch, "block-cache")
+    script.concatenate_alignments_streaming(data.alignments, output, block_cache=BlockCache(cache))  # Fill the cache
+    return lambda: script.concatenate_alignments_streaming(data.alignments, output, block_cache=BlockCache(cache))
+
+
+def setup_format_headers(data):
+    return [sys.executable, str(BIN_DIR / "format-headers.py"),
+            "--fofn", data.alignments, "--output-dir", os.path.join(data.scratch, "formatted")]
+
+
+def setup_prepare_id(data):
+    return [sys.executable, str(BIN_DIR / "prepare-id-split-path.py"), first_gene(data)]
+
+
+def setup_build_manifest(data):
+    from core_phylogenies import load_script
+    script = load_script("build-manifest.py")
+    return lambda: [script.describe_alignment(path)[:2] for path in data.genes]
+
+
+def setup_taxon_sampler(data):
+    from core_phylogenies import read_ids
+    path = first_gene(data)
+    return lambda: len(read_ids(path))
+
+
+def setup_filter_by_headers(data):
+    from core_phylogenies import load_script, read_ids
+    script = load_script("filter-by-headers.py")
+    path = first_gene(data)
+    wanted = set(read_ids(path)[::2])
+    output = os.path.join(data.scratch, "filtered.fasta")
+    index = os.path.join(data.scratch, "filtered.cpidx")  # Built inside the timed call
+    return lambda: script.filter_alignment(path, wanted, output, index)
+
+
+def setup_make_nj_tree(data):
+    from core_phylogenies import load_script
+    script = load_script("make-nj-tree.py")
+    _, matrix = gene_matrix(data)
+    return lambda: len(script.build_tree(matrix, "jc69", bionj=True))
+
+
+def setup_measure_average_support(data):
+    from core_phylogenies import load_script
+    script = load_script("measure-average-support.py")
+    table, per_tree = (os.path.join(data.scratch, name) for name in ("summary.tsv", "per-tree.tsv"))
+    return lambda: script.write_summaries([data.multi_tree], table, per_tree, [70.0, 95.0], "auto")
+
+
+def setup_measure_rf_distance(data):
+    from core_phylogenies import load_script
+    script = load_script("measure-rf-distance.py")
+    return lambda: script.rf_matrix(data.trees)[2]
+
+
+def setup_threshold_sweep(data):
+    from core_phylogenies import load_script
+    script = load_script("filter-batch.py")
+    criteria, args = list(script.CHECKS), filter_batch_args()
+    table = os.path.join(data.scratch, "filter-results.tsv")
+    with open(table, "w") as handle:
+        handle.write("\t".join(script.TABLE_COLUMNS) + "\n")
+        for path in data.genes:
+            row = script.evaluate_gene(Path(path).stem, path, criteria, args, keep_going=True)
+            handle.write("\t".join(str(row[column]) for column in script.TABLE_COLUMNS) + "\n")
+    return [sys.executable, str(BIN_DIR / "threshold-sweep.py"), table, "--data-name", "bench",
+            "--polymorphic-sites-cutoffs", "0.01,0.05,0.1,0.2,0.3",
+            "--nucleotide-diversity-ranges", "0:0.05,0:0.1,0.02:0.2",
+            "--dnds-ratio-ranges", "0:0.5,0:1,0:2",
+            "--grid", os.path.join(data.scratch, "grid.tsv"),
+            "--output-dir", os.path.join(data.scratch, "subsets")]
+
+
+def always(taxa, length):
+    return True
+
+
+CASES = {
+    "read-alignment": ("core_phylogenies.py", "call", setup_read_alignment, always),
+    "read-alignment-biopython": ("core_phylogenies.py", "call", setup_read_alignment_biopython,
+                                 lambda taxa, length: taxa * length <= 1024 * 100000),
+    "polymorphic-sites": ("filter-by-normalized-polymorphic-sites.py", "call", setup_polymorphic_sites, always),
+    "polymorphic-sites-windowed": ("filter-by-normalized-polymorphic-sites.py", "call",
+                                   setup_polymorphic_sites_windowed, always),
+    "polymorphic-sites-reference": ("filter-by-normalized-polymorphic-sites.py", "call",
+                                    setup_polymorphic_sites_reference,
+                                    lambda taxa, length: length <= 30000),
+    "nucleotide-diversity-legacy": ("filter-by-nucleotide-diversity.py", "call", setup_nucleotide_diversity_legacy,
+                                    lambda taxa, length: taxa * taxa * length <= 64 * 64 * 10000),
+    "nucleotide-diversity-optimized": ("filter-by-nucleotide-diversity-optimized.py", "call",
+                                       setup_nucleotide_diversity_optimized, always),
+    "nucleotide-diversity-windowed": ("filter-by-nucleotide-diversity-optimized.py", "call",
+                                      setup_nucleotide_diversity_windowed, always),
+    "nucleotide-diversity-early": ("filter-by-nucleotide-diversity-optimized.py", "call",
+                                   setup_nucleotide_diversity_early, always),
+    "dnds-ratio-legacy": ("filter-by-dnds-ratio.py", "call", setup_dnds_ratio_legacy,
+                          lambda taxa, length: taxa * taxa * length <= 32 * 32 * 3000),
+    "dnds-ratio-optimized": ("filter-by-dnds-ratio-optimized.py", "call", setup_dnds_ratio_optimized,
+                             lambda taxa, length: taxa * taxa * length <= 32 * 32 * 3000),
+    "dnds-ratio-optimized-table": ("filter-by-dnds-ratio-optimized.py", "call",
+                                   setup_dnds_ratio_optimized_table, always),
+    "filter-batch": ("filter-batch.py", "call", setup_filter_batch,
+                     lambda taxa, length: taxa * taxa * length <= 256 * 256 * 10000),
+    "threshold-sweep": ("threshold-sweep.py", "cli", setup_threshold_sweep,
+                        lambda taxa, length: taxa * taxa * length <= 256 * 256 * 10000),
+    "concatenate-alignments": ("concatenate-alignments.py", "call", setup_concatenate_alignments, always),
+    "concatenate-alignments-streaming": ("concatenate-alignments.py", "call",
+                                         setup_concatenate_alignments_streaming, always),
+    "concatenate-alignments-block-cache": ("concatenate-alignments.py", "call",
+                                           setup_concatenate_alignments_block_cache, always),
+    "format-headers": ("format-headers.py", "cli", setup_format_headers, always),
+    "prepare-id": ("prepare-id-split-path.py", "cli", setup_prepare_id, always),
+    "build-manifest": ("build-manifest.py", "call", setup_build_manifest, always),
+    "taxon-sampler": ("taxon-sampler.py", "call", setup_taxon_sampler, always),
+    "filter-by-headers": ("filter-by-headers.py", "call", setup_filter_by_headers, always),
+    "make-nj-tree": ("make-nj-tree.py", "call", setup_make_nj_tree, always),
+    "measure-average-support": ("measure-average-support.py", "call", setup_measure_average_support, always),
+    "measure-rf-distance": ("measure-rf-distance.py", "call", setup_measure_rf_distance, always),
+}
+
+
+# ---------------------------------------------------------------- Agreement checks
+#
+# Each check: check(path) returns a list of (quantity, reference value,
+# optimized value, absolute tolerance) for one alignment. Values may be None
+# (e.g. no dN/dS for an alignment without ORFs), which only matches None.
+
+def check_polymorphic_sites(path):
+    from Bio.Align import MultipleSeqAlignment
+    from core_phylogenies import load_script, read_alignment, matrix_to_records
+    script = load_script("filter-by-normalized-polymorphic-sites.py")
+    ids, matrix = read_alignment(path)
+    alignment = MultipleSeqAlignment(matrix_to_records(ids, matrix))
+    poly, length = script.compute_polymorphic_rate(alignment)
+    informative = script.count_informative_sites(alignment)
+    numpy_poly, numpy_informative, numpy_length = script.count_site_classes(matrix)
+    return [("polymorphic_rate", poly / length, numpy_poly / numpy_length, 0.0),
+            ("informative_sites", informative, numpy_informative, 0)]
+
+
+def check_dnds_ratio(path):
+    from core_phylogenies import load_script, read_sequences
+    script = load_script("filter-by-dnds-ratio-optimized.py")
+    _, sequences = read_sequences(path)
+    return [(f"dnds_ratio (include_gaps={include_gaps})", script.average_dnds(sequences, include_gaps),
+             script.average_dnds_table(sequences, include_gaps), DNDS_TOLERANCE)
+            for include_gaps in (False, True)]
+
+
+def check_nucleotide_diversity(path):
+    from core_phylogenies import load_script, read_alignment
+    script = load_script("filter-by-nucleotide-diversity-optimized.py")
+    _, matrix = read_alignment(path)
+    checks = []
+    for ignore_gaps in (True, False):
+        pairwise = script.calculate_nucleotide_diversity(matrix, ignore_gaps)
+        checks.append((f"pi (ignore_gaps={ignore_gaps})", pairwise,
+                       script.count_nucleotide_diversity(matrix, ignore_gaps), PI_TOLERANCE))
+        checks.append((f"pi windowed (ignore_gaps={ignore_gaps})", pairwise,
+                       script.count_nucleotide_diversity(matrix, ignore_gaps, memory_budget=1 << 12), PI_TOLERANCE))
+    return checks
+
+
+CHECKS = {
+    "polymorphic-sites": check_polymorphic_sites,
+    "dnds-ratio": check_dnds_ratio,
+    "nucleotide-diversity": check_nucleotide_diversity,
+}
+
+
+def agree(expected, actual, tolerance):
+    if expected is None or actual is None:
+        return expected is actual
+    return abs(expected - actual) <= tolerance
+
+
+def format_value(value):
+    return "None" if value is None else f"{value:.10g}"
+
+
+def run_checks():
+    """Run every check on the test alignments and a synthetic gapped core genome; exit 1 on a mismatch."""
+    simulator = load_benchmark_module("simulate-core-genome.py")
+    work_dir = Path(tempfile.mkdtemp(prefix="core-phylogenies-checks-"))
+    genes, taxa, length = CHECK_GENOME
+    simulator.simulate_core_genome(work_dir / "alignments", genes, taxa, length, GAP_FRACTION, DIVERSITY, 0, seed=SEED)
+    paths = sorted(TEST_DATA_DIR.glob("*.fasta")) + sorted((work_dir / "alignments").glob("*.fasta"))
+
+    failures = 0
+    try:
+        for name, check in CHECKS.items():
+            for path in paths:
+                for quantity, expected, actual, tolerance in check(str(path)):
+                    ok = agree(expected, actual, tolerance)
+                    failures += not ok
+                    print(f"{'OK' if ok else 'MISMATCH':<9} {name:<20} {path.name:<16} {quantity:<38} "
+                          f"reference={format_value(expected)} optimized={format_value(actual)} "
+                          f"tolerance={tolerance:g}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if failures:
+        sys.exit(f"Error: {failures} mismatches between reference and optimized implementations")
+    print("✓ Reference and optimized implementations agree")
+
+
+# ---------------------------------------------------------------- Measurement
+
+def dataset(data_dir, scratch):
+    data_dir = Path(data_dir)
+    return Namespace(
+        alignments=str(data_dir / "alignments"),
+        genes=sorted(str(path) for path in (data_dir / "alignments").glob("*.fasta")),
+        trees=sorted(str(path) for path in (data_dir / "alignments" / "trees").glob("*.tre")),
+        multi_tree=str(data_dir / "alignments" / "trees.tre"),
+        scratch=scratch,
+    )
+
+
+def run_case(name, data_dir):
+    """Child process: set up and time one case, return its measurement."""
+    _, kind, setup, _ = CASES[name]
+    scratch = tempfile.mkdtemp(prefix=f"{name}-", dir=data_dir)
+    try:
+        prepared = setup(dataset(data_dir, scratch))
+        gc.collect()
+
+        if kind == "cli":
+            start = time.perf_counter()
+            process = subprocess.Popen(prepared, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+            _, status, usage = os.wait4(process.pid, 0)
+            wall = time.perf_counter() - start
+            if os.waitstatus_to_exitcode(status) != 0:
+                raise RuntimeError(process.stderr.read().decode().strip().splitlines()[-1])
+            return {"wall_s": wall, "peak_rss_mb": peak_rss_mb(usage), "delta_rss_mb": "NA", "result": "OK"}
+
+        baseline = peak_rss_mb(resource.getrusage(resource.RUSAGE_SELF))
+        start = time.perf_counter()
+        result = prepared()
+        wall = time.perf_counter() - start
+        peak = peak_rss_mb(resource.getrusage(resource.RUSAGE_SELF))
+        return {"wall_s": wall, "peak_rss_mb": peak, "delta_rss_mb": peak - baseline, "result": result}
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+def measure(name, data_dir):
+    """Run one case in a fresh process; return its measurement (or {"error": ...})."""
+    process = subprocess.run([sys.executable, __file__, "--run-case", name, "--data", str(data_dir)],
+                             capture_output=True, text=True)
+    lines = process.stdout.strip().splitlines()
+    if process.returncode != 0 or not lines:
+        error = (process.stderr.strip().splitlines() or ["failed"])[-1]
+        return {"error": error}
+    return json.loads(lines[-1])
+
+
+def format_result(value):
+    if isinstance(value, float):
+        return f"{value:.6g}"
+    text = str(value).replace("\t", " ").replace("\n", " ")
+    return text if len(text) <= 60 else text[:57] + "..."
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "-C", str(REPO_DIR), "rev-parse", "--short", "HEAD"],
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "-C", str(REPO_DIR), "diff", "--quiet", "HEAD", "--", "bin"]).returncode
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "NA"
+
+
+def run_suite(args):
+    suite = SUITES[args.suite]
+    cases = args.cases or list(CASES)
+    unknown = [name for name in cases if name not in CASES]
+    if unknown:
+        sys.exit(f"Error: unknown cases: {', '.join(unknown)} (known: {', '.join(CASES)})")
+
+    simulator = load_benchmark_module("simulate-core-genome.py")
+    work_dir = Path(args.work_dir or tempfile.mkdtemp(prefix="core-phylogenies-benchmarks-"))
+    commit = git_commit()
+
+    with open(args.output, "w", newline="") as handle:
+        writer = csv.writer(handle, delimiter="\t", lineterminator="\n")
+        writer.writerow(RESULT_COLUMNS)
+
+        for taxa, length in scaling_points(suite):
+            data_dir = work_dir / f"{taxa}x{length}"
+            if not (data_dir / "alignments").is_dir():
+                simulator.simulate_core_genome(data_dir / "alignments", suite["genes"], taxa, length,
+                                               GAP_FRACTION, DIVERSITY, suite["trees"], seed=SEED)
+
+            for name in cases:
+                script, _, _, limit = CASES[name]
+                if not limit(taxa, length):
+                    continue
+
+                runs = [measure(name, data_dir) for _ in range(args.repeats)]
+                errors = [run["error"] for run in runs if "error" in run]
+                if errors:
+                    row = [commit, name, script, taxa, length, suite["genes"], args.repeats,
+                           "NA", "NA", "NA", "NA", f"error: {format_result(errors[0])}"]
+                else:
+                    walls = [run["wall_s"] for run in runs]
+                    deltas = [run["delta_rss_mb"] for run in runs if run["delta_rss_mb"] != "NA"]
+                    row = [commit, name, script, taxa, length, suite["genes"], args.repeats,
+                           f"{min(walls):.4f}", f"{statistics.median(walls):.4f}",
+                           f"{max(run['peak_rss_mb'] for run in runs):.1f}",
+                           f"{max(deltas):.1f}" if deltas else "NA",
+                           format_result(runs[0]["result"])]
+                writer.writerow(row)
+                handle.flush()
+                print(f"{name:<36} taxa={taxa:<5} length={length:<8} wall={row[7]}s peak={row[9]}MB",
+                      file=sys.stderr)
+
+    if not args.work_dir:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    print(f"✓ Benchmark results written to: {args.output}")
+
+
+def compare(baseline_path, current_path):
+    """Print the speedup and memory change of every case/point found in both result files."""
+    def read(path):
+        with open(path, newline="") as handle:
+            return {(row["case"], row["taxa"], row["length"]): row
+                    for row in csv.DictReader(handle, delimiter="\t")}
+
+    baseline, current = read(baseline_path), read(current_path)
+    print("\t".join(["case", "taxa", "length", "baseline_s", "current_s", "speedup",
+                     "baseline_rss_mb", "current_rss_mb"]))
+    for key in sorted(set(baseline) & set(current), key=lambda key: (key[0], int(key[1]), int(key[2]))):
+        old, new = baseline[key], current[key]
+        try:
+            speedup = f"{float(old['wall_s_median']) / float(new['wall_s_median']):.2f}x"
+        except (ValueError, ZeroDivisionError):
+            speedup = "NA"
+        print("\t".join([*key, old["wall_s_median"], new["wall_s_median"], speedup,
+                         old["peak_rss_mb"], new["peak_rss_mb"]]))
+
+
+def main():
+    p = argparse.ArgumentParser(description="Benchmark the bin/ scripts on synthetic core genomes")
+    p.add_argument("--suite", choices=sorted(SUITES), default="quick", help="Scaling curves to run (default: quick)")
+    p.add_argument("--cases", type=lambda value: [v.strip() for v in value.split(",") if v.strip()], default=None,
+                   help="Comma-separated cases to run (default: all)")
+    p.add_argument("--repeats", type=int, default=3, help="Runs of every case and point (default: 3)")
+    p.add_argument("--output", default="benchmark-results.tsv", help="Output TSV (default: benchmark-results.tsv)")
+    p.add_argument("--work-dir", default=None,
+                   help="Directory for the synthetic data, kept and reused between runs (default: temporary)")
+    p.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"), default=None,
+                   help="Compare two result files instead of running benchmarks")
+    p.add_argument("--check", action="store_true",
+                   help="Check that optimized and reference implementations agree instead of running benchmarks")
+    p.add_argument("--run-case", default=None, help=argparse.SUPPRESS)
+    p.add_argument("--data", default=None, help=argparse.SUPPRESS)
+    args = p.parse_args()
+
+    if args.run_case:
+        print(json.dumps(run_case(args.run_case, args.data), default=str))
+    elif args.compare:
+        compare(*args.compare)
+    elif args.check:
+        run_checks()
+    else:
+        run_suite(args)
+
+
+if __name__ == "__main__":
+    main()
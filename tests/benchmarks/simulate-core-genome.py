@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Program: Synthetic Core Genome for Benchmarks
+---------------------------------------------
+Description:
+    Writes a set of synthetic gene alignments over one shared set of taxa,
+    sized for benchmarking the bin/ scripts:
+      - Every gene is an ORF: it starts with ATG and has no internal stop
+        codon in any taxon, so the dN/dS filters use all of it.
+      - Taxa diverge from a random ancestral ORF on a star tree: every site
+        is substituted with probability --diversity (codons that would become
+        a stop codon keep the ancestral codon).
+      - Gaps are whole codons ('---'), placed per taxon with probability
+        --gap-fraction, so the reading frame is kept.
+    Optionally writes random Newick trees over the same taxa, with bootstrap
+    (integer) or TBE (decimal) support values and branch lengths.
+
+Output:
+    - <output_dir>/gene0001.fasta ... one alignment per gene
+    - <output_dir>/trees/tree0001.tre ... one tree per file (--trees N)
+    - <output_dir>/trees.tre, all of those trees in one multi-tree file
+
+Usage:
+    python simulate-core-genome.py <output_dir> [--genes 10] [--taxa 16] [--length 999]
+        [--gap-fraction 0.05] [--diversity 0.05] [--trees 0] [--tbe] [--seed 1]
+"""
+
+import argparse
+import os
+import random
+
+BASES = "ACGT"
+STOPS = {"TAA", "TAG", "TGA"}
+SENSE_CODONS = [a + b + c for a in BASES for b in BASES for c in BASES if a + b + c not in STOPS]
+
+
+def taxon_names(taxa):
+    return [f"taxon{i:04d}" for i in range(1, taxa + 1)]
+
+
+def simulate_gene(rng, taxa, length, gap_fraction, diversity):
+    """Return the `taxa` aligned sequences (strings) of one synthetic gene of ~`length` bases."""
+    codons = max(length // 3, 2)
+    ancestor = ["ATG"] + [rng.choice(SENSE_CODONS) for _ in range(codons - 1)]
+
+    sequences = []
+    for _ in range(taxa):
+        seq = []
+        for position, codon in enumerate(ancestor):
+            if position > 0 and rng.random() < gap_fraction:
+                seq.append("---")
+                continue
+            mutated = "".join(rng.choice(BASES.replace(base, "")) if position > 0 and rng.random() < diversity
+                              else base for base in codon)
+            seq.append(codon if mutated in STOPS else mutated)
+        sequences.append("".join(seq))
+    return sequences
+
+
+def write_fasta(path, ids, sequences):
+    with open(path, "w") as handle:
+        for seq_id, seq in zip(ids, sequences):
+            handle.write(f">{seq_id}\n{seq}\n")
+
+
+def random_newick(rng, ids, tbe=False):
+    """A random unrooted binary tree over `ids` with support values and branch lengths."""
+    def support():
+        return f"{rng.random():.3f}" if tbe else str(rng.randint(0, 100))
+
+    nodes = [f"{seq_id}:{rng.uniform(0.001, 0.1):.5f}" for seq_id in ids]
+    while len(nodes) > 3:
+        a = nodes.pop(rng.randrange(len(nodes)))
+        b = nodes.pop(rng.randrange(len(nodes)))
+        nodes.append(f"({a},{b}){support()}:{rng.uniform(0.001, 0.1):.5f}")
+    return f"({','.join(nodes)});"
+
+
+def simulate_core_genome(output_dir, genes=10, taxa=16, length=999, gap_fraction=0.05,
+                         diversity=0.05, trees=0, tbe=False, seed=1):
+    """Write the synthetic alignments (and trees) to `output_dir`; return the alignment paths."""
+    rng = random.Random(seed)
+    ids = taxon_names(taxa)
+    os.makedirs(output_dir, exist_ok=True)
+
+    paths = []
+    for gene in range(1, genes + 1):
+        path = os.path.join(output_dir, f"gene{gene:04d}.fasta")
+        write_fasta(path, ids, simulate_gene(rng, taxa, length, gap_fraction, diversity))
+        paths.append(path)
+
+    if trees:
+        os.makedirs(os.path.join(output_dir, "trees"), exist_ok=True)
+        with open(os.path.join(output_dir, "trees.tre"), "w") as multi:
+            for tree in range(1, trees + 1):
+                newick = random_newick(rng, ids, tbe)
+                with open(os.path.join(output_dir, "trees", f"tree{tree:04d}.tre"), "w") as single:
+                    single.write(newick + "\n")
+                multi.write(newick + "\n")
+    return paths
+
+
+def main():
+    p = argparse.ArgumentParser(description="Write a synthetic core genome (gene alignments and trees)")
+    p.add_argument("output_dir", help="Directory for the alignments")
+    p.add_argument("--genes", type=int, default=10, help="Number of genes (default: 10)")
+    p.add_argument("--taxa", type=int, default=16, help="Number of taxa (default: 16)")
+    p.add_argument("--length", type=int, default=999, help="Alignment length in bases (default: 999)")
+    p.add_argument("--gap-fraction", type=float, default=0.05,
+                   help="Probability of a gap codon per taxon and codon (default: 0.05)")
+    p.add_argument("--diversity", type=float, default=0.05,
+                   help="Substitution probability per site from the ancestor (default: 0.05)")
+    p.add_argument("--trees", type=int, default=0, help="Number of random trees (default: 0)")
+    p.add_argument("--tbe", action="store_true", help="Decimal (TBE) instead of integer support values")
+    p.add_argument("--seed", type=int, default=1, help="Random seed (default: 1)")
+    args = p.parse_args()
+
+    paths = simulate_core_genome(args.output_dir, args.genes, args.taxa, args.length, args.gap_fraction,
+                                 args.diversity, args.trees, args.tbe, args.seed)
+    print(f"✓ {len(paths)} alignments of {args.taxa} taxa written to: {args.output_dir}")
+
+
+if __name__ == "__main__":
+    main()
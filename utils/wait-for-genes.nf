@@ -0,0 +1,9 @@
+def waitForGenes (ch_genes) {
+    // Holds the genes of a stage until all of them are ready, unless genes stream through the stages (--streaming)
+    if (params.streaming) {
+        return ch_genes
+    }
+    return ch_genes
+        .collect(flat: false)
+        .flatMap {gene -> gene}
+}
@@ -1,18 +1,25 @@
 // Default utility imports
 include { resolveContainerPath } from '../utils/resolve-container-path'
+include { waitForGenes         } from '../utils/wait-for-genes'
 
 
 // Default module imports
 include { PREPARE_ID                     } from '../modules/prepare-id'
+include { BUILD_MANIFEST                 } from '../modules/build-manifest'
 include { FORMAT_HEADERS                 } from '../modules/format-headers'
+include { FORMAT_HEADERS_BATCH           } from '../modules/format-headers-batch'
 include { FILTER_BY_POLYMORPHIC_SITES    } from '../modules/filter-by-polymorphic-sites'
 include { FILTER_BY_NUCLEOTIDE_DIVERSITY } from '../modules/filter-by-nucleotide-diversity'
 include { FILTER_BY_DNDS_RATIO           } from '../modules/filter-by-dnds-ratio'
+include { FILTER_BATCH                   } from '../modules/filter-batch'
+include { THRESHOLD_SWEEP                } from '../modules/threshold-sweep'
 include { CONCATENATE_ALIGNMENTS         } from '../modules/concatenate-alignments'
 include { CALCULATE_SUBSTITUTION_MODEL   } from '../modules/calculate-substitution-model'
 include { MAKE_PHYLOGENY                 } from '../modules/make-phylogeny'
 include { MEASURE_RF_DISTANCE            } from '../modules/measure-rf-distance'
+include { MEASURE_RF_MATRIX              } from '../modules/measure-rf-matrix'
 include { MEASURE_AVERAGE_SUPPORT        } from '../modules/measure-average-support'
+include { MEASURE_SUPPORT_SUMMARY        } from '../modules/measure-support-summary'
 
 
 // Pipeline workflow
@@ -75,6 +82,14 @@ workflow CORE_PHYLOGENIES {
             error "ERROR: Reference tree for RF distance measurement not specified (--data_reference)"
         }
 
+        if (params.sweep && !params.pipeline_filter) {
+            error "ERROR: Threshold sweep (--sweep) needs gene alignments to filter (--pipeline_filter)"
+        }
+
+        if (params.pipeline_phylo && params.concatenate_alignments_compress) {
+            error "ERROR: Cannot make phylogeny from a compressed concatenated alignment (--concatenate_alignments_compress)"
+        }
+
         if (params.pipeline_filter) {
             // Pipeline needs to check for input constraints if user only wants to filter
             // Ranges must be complete
@@ -99,14 +114,22 @@ workflow CORE_PHYLOGENIES {
         if (params.pipeline_phylo) {
             // Only when it has to make a phylogeny
 
-            def valid_methods = ["raxml-ng", "iqtree2", "fasttree"]
+            def valid_methods = ["raxml-ng", "iqtree2", "fasttree", "nj"]
 
             if(!params.make_phylogeny_method) {
-                error "ERROR: Missing method ('raxml-ng', 'iqtree2', 'fasttree') for MAKE_PHYLOGENY module"
+                error "ERROR: Missing method ('raxml-ng', 'iqtree2', 'fasttree', 'nj') for MAKE_PHYLOGENY module"
             }
 
             if (!valid_methods.contains(params.make_phylogeny_method)) {
-                error "ERROR: Invalid value for MAKE_PHLOGENY method ('raxml-ng', 'iqtree2', 'fasttree')"
+                error "ERROR: Invalid value for MAKE_PHLOGENY method ('raxml-ng', 'iqtree2', 'fasttree', 'nj')"
+            }
+
+            if (params.make_phylogeny_method == "nj" && !["nj", "bionj"].contains(params.make_phylogeny_nj_algorithm)) {
+                error "ERROR: Invalid value for --make_phylogeny_nj_algorithm ('nj', 'bionj')"
+            }
+
+            if (params.make_phylogeny_method == "nj" && !["p", "jc69", "k2p"].contains(params.make_phylogeny_nj_distance)) {
+                error "ERROR: Invalid value for --make_phylogeny_nj_distance ('p', 'jc69', 'k2p')"
             }
 
         }
@@ -139,6 +162,12 @@ workflow CORE_PHYLOGENIES {
                 ch_container_fasttree
                     .set{ch_container_make_phylogeny}
 
+            } else if (params.make_phylogeny_method == "nj") {
+                // Built-in distance method (bin/make-nj-tree.py)
+
+                ch_container_base
+                    .set{ch_container_make_phylogeny}
+
             }
         }
 
@@ -188,86 +217,175 @@ workflow CORE_PHYLOGENIES {
         if (params.pipeline_filter) {
             // If user wants to filter...
 
-            PREPARE_ID(ch_input_alignments
-                .combine(ch_container_base)
-                .combine(ch_cluster_options))
-                .collect(flat: false) // Wait for all alignments to be processed before continuing
-                .flatMap {gene -> gene} // ^^^
-                .set {ch_alignments_with_id}
-
-            FORMAT_HEADERS(ch_alignments_with_id
-                .combine(ch_container_base)
-                .combine(ch_cluster_options))
-                .collect(flat: false) // ^^^
-                .flatMap {gene -> gene} // ^^^
-                .set {ch_formatted_alignments}
+            if (params.prepare_id_manifest && !params.streaming) {
+                // Pipeline will derive the IDs (and size, sequence count, length, hash) of all alignments in one task
 
-            if (params.filter_by_polymorphic_sites_cutoff) {
-                // Pipeline will filter by polymorphic sites if user specified a cutoff
-
-                FILTER_BY_POLYMORPHIC_SITES(ch_formatted_alignments
-                    .combine(ch_filter_by_polymorphic_sites_cutoff)
+                BUILD_MANIFEST(ch_input_alignments
+                    .collect() // Wait for all alignments to be found before continuing
+                    .map {alignments -> ["${params.data.split('/').last()}", alignments]}
                     .combine(ch_container_base)
                     .combine(ch_cluster_options))
-                    .filter( ~/(.)*\/(.)+/ ) // Only those with valid paths are retained
-                    .collect(flat: false) // ^^^
-                    .flatMap {gene -> gene} // ^^^
-                    .set {ch_filtered_alignments_1}
+                    .flatMap {manifest -> manifest[1].readLines().drop(1)} // One line per gene, without header
+                    .map {gene -> gene.tokenize("\t")}
+                    .map {gene -> [gene[2], gene[0]]} // [file name, ID]
+                    .join(ch_input_alignments.map {alignment -> [alignment.name, alignment]}, failOnMismatch: true) // Manifest paths are local to its task
+                    .map {name, id, alignment -> [id, alignment]} // [ID, alignment]
+                    .set {ch_alignments_with_id}
 
             } else {
-                 // No filtering by polymorphic sites, use formatted alignments directly
+                // One task per alignment
 
-                ch_formatted_alignments
-                    .set {ch_filtered_alignments_1}
+                PREPARE_ID(ch_input_alignments
+                    .combine(ch_container_base)
+                    .combine(ch_cluster_options))
+
+                waitForGenes(PREPARE_ID.out) // Wait for all alignments to be processed before continuing, unless streaming
+                    .set {ch_alignments_with_id}
             }
 
-            if (params.filter_by_nucleotide_diversity_start && params.filter_by_nucleotide_diversity_end) {
-                // Pipeline will filter by nucleotide diversity if user specified a range
+            if (params.format_headers_batch) {
+                // Pipeline will format headers for a batch of genes in one task
 
-                FILTER_BY_NUCLEOTIDE_DIVERSITY(ch_filtered_alignments_1
-                    .combine(ch_filter_by_nucleotide_diversity_start)
-                    .combine(ch_filter_by_nucleotide_diversity_end)
+                FORMAT_HEADERS_BATCH(ch_alignments_with_id
+                    .collate(params.format_headers_batch_size.toInteger()) // Shard genes into batches
+                    .map {batch -> ["batch-${batch[0][0]}", batch.collect {gene -> gene[0]}, batch.collect {gene -> gene[1]}]}
                     .combine(ch_container_base)
                     .combine(ch_cluster_options))
-                    .filter( ~/(.)*\/(.)+/ ) // ^^
-                    .collect(flat: false) // ^^^
-                    .flatMap {gene -> gene} // ^^^
-                    .set {ch_filtered_alignments_2}
+
+                waitForGenes(FORMAT_HEADERS_BATCH.out) // Wait for all alignments to be processed before continuing, unless streaming
+                    .flatMap {batch -> batch[1].readLines()} // One line per gene
+                    .map {gene -> gene.tokenize("\t")} // [ID, formatted alignment (or cache) path]
+                    .set {ch_formatted_alignments}
+
             } else {
-                // No filtering by nucleotide diversity, use previous alignments directly
+                // One task per gene
 
-                ch_filtered_alignments_1
-                    .set {ch_filtered_alignments_2}
+                FORMAT_HEADERS(ch_alignments_with_id
+                    .combine(ch_container_base)
+                    .combine(ch_cluster_options))
+
+                waitForGenes(params.format_headers_cache ? FORMAT_HEADERS.out.cache : FORMAT_HEADERS.out.alignment) // Alignment caches replace FASTA downstream, if enabled
+                    .set {ch_formatted_alignments}
             }
-            
-            if (params.filter_by_dnds_ratio_start && params.filter_by_dnds_ratio_end) {
-                // Pipeline will filter by dN/dS ratio if user specified a range
 
-                FILTER_BY_DNDS_RATIO(ch_filtered_alignments_2
-                    .combine(ch_filter_by_dnds_ratio_start)
-                    .combine(ch_filter_by_dnds_ratio_end)
+            if (params.sweep) {
+                // Pipeline will compute every metric once, then make one concatenated alignment per distinct gene subset of the threshold grid
+
+                FILTER_BATCH(ch_formatted_alignments
+                    .collate(params.filter_batch_size.toInteger()) // Shard genes into batches
+                    .map {batch -> ["batch-${batch[0][0]}", batch.collect {gene -> gene[0]}, batch.collect {gene -> gene[1]}]}
+                    .combine(ch_container_base)
+                    .combine(ch_cluster_options))
+                    .map {batch -> batch[1]} // Metrics table of the batch
+                    .collect() // ^^^
+                    .map {tables -> ["${params.data.split('/').last()}", tables]}
+                    .set {ch_filter_results}
+
+                THRESHOLD_SWEEP(ch_filter_results
+                    .combine(ch_container_base)
+                    .combine(ch_cluster_options))
+
+                THRESHOLD_SWEEP.out.subsets
+                    .flatten() // One list of genes per distinct subset
+                    .map {subset -> [subset.baseName, subset.readLines().collect {gene -> gene.tokenize("\t")[1]}.join(" ")]} // [grid point name, alignment paths]
+                    .set {ch_gene_subsets}
+
+            } else if (params.filter_batch) {
+                // Pipeline will run every enabled filter for a batch of genes in one task
+
+                FILTER_BATCH(ch_formatted_alignments
+                    .collate(params.filter_batch_size.toInteger()) // Shard genes into batches
+                    .map {batch -> ["batch-${batch[0][0]}", batch.collect {gene -> gene[0]}, batch.collect {gene -> gene[1]}]}
                     .combine(ch_container_base)
                     .combine(ch_cluster_options))
-                    .filter( ~/(.)*\/(.)+/ ) // ^^
-                    .collect(flat: false) // ^^^
-                    .flatMap {gene -> gene} // ^^^
+
+                waitForGenes(FILTER_BATCH.out) // ^^^
+                    .flatMap {batch -> batch[2].readLines()} // One line per gene that passed
+                    .map {gene -> gene.tokenize("\t")} // [ID, alignment path]
                     .set {ch_filtered_alignments_3}
 
             } else {
-                // No filtering by dN/dS ratio, use previous alignments directly
+                // One task per gene for each filter
 
-                ch_filtered_alignments_2
-                    .set {ch_filtered_alignments_3}
+                if (params.filter_by_polymorphic_sites_cutoff) {
+                    // Pipeline will filter by polymorphic sites if user specified a cutoff
+
+                    FILTER_BY_POLYMORPHIC_SITES(ch_formatted_alignments
+                        .combine(ch_filter_by_polymorphic_sites_cutoff)
+                        .combine(ch_container_base)
+                        .combine(ch_cluster_options))
+
+                    waitForGenes(FILTER_BY_POLYMORPHIC_SITES.out
+                        .filter {gene -> gene[1]}) // Only those that passed; rejected genes come back without a path
+                        .set {ch_filtered_alignments_1}
+
+                } else {
+                     // No filtering by polymorphic sites, use formatted alignments directly
+
+                    ch_formatted_alignments
+                        .set {ch_filtered_alignments_1}
+                }
+
+                if (params.filter_by_nucleotide_diversity_start && params.filter_by_nucleotide_diversity_end) {
+                    // Pipeline will filter by nucleotide diversity if user specified a range
+
+                    FILTER_BY_NUCLEOTIDE_DIVERSITY(ch_filtered_alignments_1
+                        .combine(ch_filter_by_nucleotide_diversity_start)
+                        .combine(ch_filter_by_nucleotide_diversity_end)
+                        .combine(ch_container_base)
+                        .combine(ch_cluster_options))
+
+                    waitForGenes(FILTER_BY_NUCLEOTIDE_DIVERSITY.out
+                        .filter {gene -> gene[1]}) // ^^
+                        .set {ch_filtered_alignments_2}
+                } else {
+                    // No filtering by nucleotide diversity, use previous alignments directly
+
+                    ch_filtered_alignments_1
+                        .set {ch_filtered_alignments_2}
+                }
+            
+                if (params.filter_by_dnds_ratio_start && params.filter_by_dnds_ratio_end) {
+                    // Pipeline will filter by dN/dS ratio if user specified a range
+
+                    FILTER_BY_DNDS_RATIO(ch_filtered_alignments_2
+                        .combine(ch_filter_by_dnds_ratio_start)
+                        .combine(ch_filter_by_dnds_ratio_end)
+                        .combine(ch_container_base)
+                        .combine(ch_cluster_options))
+
+                    waitForGenes(FILTER_BY_DNDS_RATIO.out
+                        .filter {gene -> gene[1]}) // ^^
+                        .set {ch_filtered_alignments_3}
+
+                } else {
+                    // No filtering by dN/dS ratio, use previous alignments directly
+
+                    ch_filtered_alignments_2
+                        .set {ch_filtered_alignments_3}
+                }
             }
 
-            CONCATENATE_ALIGNMENTS(ch_data_name
-                .combine(ch_filtered_alignments_3
-                .map {gene -> gene[1]} // Extract the alignment path from the tuple
-                .reduce("") {gene_1, gene_2 -> "$gene_1 $gene_2"}) // Concatenate all alignment paths
+            if (!params.sweep) {
+                // Single subset of genes for the given thresholds
+
+                ch_data_name
+                    .combine(ch_filtered_alignments_3
+                    .map {gene -> gene[1]} // Extract the alignment path from the tuple
+                    .reduce("") {gene_1, gene_2 -> "$gene_1 $gene_2"}) // Concatenate all alignment paths
+                    .set {ch_gene_subsets}
+            }
+
+            CONCATENATE_ALIGNMENTS(ch_gene_subsets
                 .combine(ch_container_base)
                 .combine(ch_cluster_options))
+
+            CONCATENATE_ALIGNMENTS.out.alignment
                 .map {alignment -> [alignment[0], alignment[1]]} // Get only the ID and concatenated alignment path
                 .set {ch_concatenated_alignment}
+
+            CONCATENATE_ALIGNMENTS.out.patterns
+                .set {ch_site_patterns} // [ID, pattern alignment, site weights], only with --concatenate_alignments_patterns
         
         } else {
             // Pipeline has to prepare IDs for input phylogenetic trees, if user only wants to measure
@@ -283,7 +401,7 @@ workflow CORE_PHYLOGENIES {
             // Pipeline will only make phylogeny if user only wants to
             // User can set this to FALSE if they only want to filter or measure
 
-            if(params.make_phylogeny_method != 'fasttree') {
+            if(!['fasttree', 'nj'].contains(params.make_phylogeny_method)) {
                 // Substitution model for raxml-ng and iqtree2
 
                 CALCULATE_SUBSTITUTION_MODEL(ch_concatenated_alignment
@@ -292,16 +410,31 @@ workflow CORE_PHYLOGENIES {
                     .set {ch_substitution_model} 
 
             } else {
-                // No model needed for fasttree
+                // No model needed for fasttree and nj
 
                 ch_concatenated_alignment
                     .map {alignment -> [alignment[0], "/"]} // Get only the ID, second element is filler
                     .set {ch_substitution_model} 
             }
 
-            MAKE_PHYLOGENY(ch_concatenated_alignment
+            if (params.concatenate_alignments_patterns && ['raxml-ng', 'nj'].contains(params.make_phylogeny_method)) {
+                // raxml-ng and nj build the tree from the distinct site patterns and their weights
+
+                ch_site_patterns
+                    .set {ch_phylogeny_alignment}
+
+            } else {
+                // Full alignment, third element is filler
+
+                ch_concatenated_alignment
+                    .map {alignment -> [alignment[0], alignment[1], "/"]}
+                    .set {ch_phylogeny_alignment}
+            }
+
+            MAKE_PHYLOGENY(ch_phylogeny_alignment
                 .join(ch_substitution_model)
-                .combine(ch_container_make_phylogeny)  // Depends on which method is used ('raxml-ng', 'iqtree2', 'fastttree')
+                .map {alignment -> [alignment[0], alignment[1], alignment[3], alignment[2]]} // [ID, alignment, substitution model, site weights]
+                .combine(ch_container_make_phylogeny)  // Depends on which method is used ('raxml-ng', 'iqtree2', 'fastttree', 'nj')
                 .combine(ch_cluster_options))
                 .set {ch_phylogeny}
 
@@ -310,16 +443,43 @@ workflow CORE_PHYLOGENIES {
         if(params.pipeline_measure) {
             // Pipeline wont measure if user only wants to filter
 
-            MEASURE_RF_DISTANCE(ch_phylogeny
-                .combine(ch_phylogenies.reference)
-                .combine(ch_container_base)
-                .combine(ch_cluster_options))
-                .set {ch_rf_distance}
+            if (params.measure_rf_matrix) {
+                // All trees in one task, reference read once
 
-            MEASURE_AVERAGE_SUPPORT(ch_phylogeny
-                .combine(ch_container_base)
-                .combine(ch_cluster_options))
-                .set {ch_average_support}
+                MEASURE_RF_MATRIX(ch_phylogeny
+                    .map {phylogeny -> phylogeny[1]} // Extract the tree path from the tuple
+                    .collect() // Wait for all phylogenies
+                    .map {trees -> ["${params.data.split('/').last()}", trees]}
+                    .combine(ch_phylogenies.reference)
+                    .combine(ch_container_base)
+                    .combine(ch_cluster_options))
+                    .set {ch_rf_distance}
+
+            } else {
+                MEASURE_RF_DISTANCE(ch_phylogeny
+                    .combine(ch_phylogenies.reference)
+                    .combine(ch_container_base)
+                    .combine(ch_cluster_options))
+                    .set {ch_rf_distance}
+            }
+
+            if (params.measure_support_summary) {
+                // All trees in one task, streamed tree by tree
+
+                MEASURE_SUPPORT_SUMMARY(ch_phylogeny
+                    .map {phylogeny -> phylogeny[1]} // Extract the tree path from the tuple
+                    .collect() // Wait for all phylogenies
+                    .map {trees -> ["${params.data.split('/').last()}", trees]}
+                    .combine(ch_container_base)
+                    .combine(ch_cluster_options))
+                    .set {ch_average_support}
+
+            } else {
+                MEASURE_AVERAGE_SUPPORT(ch_phylogeny
+                    .combine(ch_container_base)
+                    .combine(ch_cluster_options))
+                    .set {ch_average_support}
+            }
         
         }
 }
\ No newline at end of file